@@ -0,0 +1,8 @@
+"""Benchmarks of pytt, run as modules from the repository root, e.g.
+
+    python -m benchmarks.suite
+    python -m benchmarks.bench_hash_object
+
+synthetic generates the repositories they run against and suite times every
+plumbing command against git, as JSON to compare between releases.
+"""
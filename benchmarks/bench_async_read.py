@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Measure concurrent object reads through AsyncObjectDatabase against plain reads.
+
+Writes --objects loose blobs of about --size KiB, optionally packs them with
+git repack, then serves --requests concurrent requests of --per-request
+objects each, drawn from a small set of popular objects so that requests
+overlap. The requests are served on an event loop once with blocking
+ObjectDatabase.read calls and once with AsyncObjectDatabase, and the total
+time and the longest the loop was kept from running another task are
+printed for both, along with reading every object with read_many.
+
+    python -m benchmarks.bench_async_read --objects 5000 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import tempfile
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+from pytt.aio import AsyncObjectDatabase
+from pytt.repository import ObjectDatabase
+
+
+def write_objects(path: str, count: int, size: int) -> List[str]:
+    rng = random.Random(0)
+    objects = ObjectDatabase(path)
+    shas = []
+    for i in range(count):
+        # half random, half repeated, so it compresses like source does
+        noise = rng.randbytes(size // 2)
+        shas.append(objects.write(b"object %d\n" % i + noise + noise.hex().encode()[: size // 2]))
+    return shas
+
+
+async def serve(requests: List[List[str]], read: Callable[[str], Awaitable]) -> Tuple[float, float]:
+    """Serve the requests concurrently, return the total and the longest
+    stall of the event loop in seconds."""
+    stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal stall
+        while running:
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - before - 0.001)
+
+    async def request(shas):
+        for sha in shas:
+            await read(sha)
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(request(shas) for shas in requests))
+    elapsed = time.perf_counter() - start
+    running = False
+    await tick
+    return elapsed, stall
+
+
+async def read_all(odb: AsyncObjectDatabase, shas: List[str]) -> float:
+    start = time.perf_counter()
+    async for _ in odb.read_many(shas):
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=64, help="KiB per object")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--per-request", type=int, default=8)
+    parser.add_argument("--popular", type=int, default=200, help="objects requests draw from")
+    parser.add_argument("--packed", action="store_true", help="read from a pack instead")
+    parser.add_argument("--workers", type=int, default=None, help="reader threads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as repo:
+        subprocess.run(["git", "init", "-q", repo], check=True)
+        path = os.path.join(repo, ".git", "objects")
+        shas = write_objects(path, args.objects, args.size * 1024)
+        if args.packed:
+            # nothing refers to the blobs, repack would leave them loose
+            pack = os.path.join(path, "pack", "pack")
+            stdin = "\n".join(shas).encode()
+            subprocess.run(
+                ["git", "pack-objects", "-q", pack],
+                cwd=repo,
+                input=stdin,
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            subprocess.run(["git", "prune-packed"], cwd=repo, check=True)
+
+        rng = random.Random(1)
+        popular = rng.sample(shas, min(args.popular, len(shas)))
+        requests = [rng.choices(popular, k=args.per_request) for _ in range(args.requests)]
+
+        objects = ObjectDatabase(path)
+
+        async def blocking_read(sha):
+            return objects.read(sha)
+
+        elapsed, stall = asyncio.run(serve(requests, blocking_read))
+        print("blocking reads:  %.3fs, loop stalled up to %.1f ms" % (elapsed, stall * 1000))
+
+        workers = {"max_workers": args.workers} if args.workers else {}
+        odb = AsyncObjectDatabase(ObjectDatabase(path), **workers)
+        elapsed, stall = asyncio.run(serve(requests, odb.read))
+        print(
+            "async reads:     %.3fs, loop stalled up to %.1f ms, %d reads coalesced"
+            % (elapsed, stall * 1000, odb.coalesced)
+        )
+
+        start = time.perf_counter()
+        for sha in shas:
+            objects.read(sha)
+        print("read every object, one by one:  %.3fs" % (time.perf_counter() - start))
+        print("read every object, read_many:   %.3fs" % asyncio.run(read_all(odb, shas)))
+        odb.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Measure the Myers and histogram line diffs against difflib on large files.
+
+Generates a file of --size MiB of source-like lines and a copy with --edits
+percent of its lines changed, inserted or deleted, then times producing the
+whole unified diff with pytt.blobdiff and with difflib.unified_diff.
+
+    python -m benchmarks.bench_blobdiff --size 4
+"""
+import argparse
+import difflib
+import random
+import time
+from typing import Tuple
+
+from pytt import blobdiff
+
+WORDS = [b"return", b"self", b"value", b"if", b"for", b"in", b"None", b"index", b"data", b"="]
+
+
+def generate(size: int, edits: float, seed: int = 0):
+    rng = random.Random(seed)
+    old = []
+    length = 0
+    while length < size:
+        indent = b"    " * rng.randint(0, 3)
+        line = indent + b" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) + b"\n"
+        if rng.random() < 0.1:
+            line = b"\n"
+        old.append(line)
+        length += len(line)
+
+    new = list(old)
+    for _ in range(int(len(old) * edits / 100)):
+        position = rng.randrange(len(new))
+        action = rng.random()
+        if action < 0.4:
+            new[position] = b"changed %d\n" % rng.randrange(1 << 30)
+        elif action < 0.7:
+            new.insert(position, b"inserted %d\n" % rng.randrange(1 << 30))
+        else:
+            del new[position]
+
+    return b"".join(old), b"".join(new)
+
+
+def timed(diff) -> Tuple[float, int]:
+    start = time.perf_counter()
+    lines = sum(1 for _ in diff())
+    return time.perf_counter() - start, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=float, default=4, help="MiB per file")
+    parser.add_argument("--edits", type=float, default=1, help="percent of lines edited")
+    args = parser.parse_args()
+
+    old, new = generate(int(args.size * 1024 * 1024), args.edits)
+    print("%d and %d lines" % (old.count(b"\n"), new.count(b"\n")))
+
+    for algorithm in blobdiff.ALGORITHMS:
+        elapsed, lines = timed(lambda: blobdiff.unified_diff(old, new, algorithm=algorithm))
+        print("pytt %-9s %6.2fs, %d lines of diff" % (algorithm, elapsed, lines))
+
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    elapsed, lines = timed(lambda: difflib.diff_bytes(difflib.unified_diff, old_lines, new_lines))
+    print("difflib        %6.2fs, %d lines of diff" % (elapsed, lines))
+
+
+if __name__ == "__main__":
+    main()
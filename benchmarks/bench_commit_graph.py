@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Measure ancestry queries on a commit-graph as the history grows.
+
+Writes a commit-graph for a synthetic history: a main line where every
+--branch-every commits a side branch of a few commits forks off and is merged
+back later. Then times is_ancestor and merge_base between commits close to
+each other and far apart, and is_ancestor answers which are decided by the
+generation numbers alone.
+
+    python -m benchmarks.bench_commit_graph --commits 10000 100000 1000000
+"""
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from pytt.commit_graph import CommitGraph, CommitGraphWriter
+
+
+def synthetic_history(writer, count, branch_every):
+    """Add count commits to the writer, return the shas of the main line and
+    of the side branch tips."""
+    tree = hashlib.sha1(b"tree").digest()
+    main = []
+    tips = []
+    side = None
+    for i in range(count):
+        sha = hashlib.sha1(b"%d" % i).digest()
+        if i % branch_every == 1 and main:
+            side = main[-1]
+        if side is not None and i % branch_every in (2, 3, 4):
+            # a commit on the side branch
+            writer.add(sha, tree, [side], 1500000000 + i)
+            side = sha
+            continue
+
+        parents = [main[-1]] if main else []
+        if side is not None and i % branch_every == 5:
+            parents.append(side)
+            tips.append(side)
+            side = None
+        writer.add(sha, tree, parents, 1500000000 + i)
+        main.append(sha)
+
+    return main, tips
+
+
+def timed(queries):
+    start = time.perf_counter()
+    for query in queries:
+        query()
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--branch-every", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    for count in args.commits:
+        with tempfile.TemporaryDirectory() as directory:
+            writer = CommitGraphWriter()
+            main_line, tips = synthetic_history(writer, count, args.branch_every)
+            path = os.path.join(directory, "commit-graph")
+
+            start = time.perf_counter()
+            writer.write(path)
+            write_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            graph = CommitGraph(path)
+            open_s = time.perf_counter() - start
+
+            head = graph.position(main_line[-1])
+            positions = [graph.position(sha) for sha in main_line]
+            recent_tips = [graph.position(sha) for sha in tips[-10:]]
+            n = len(positions)
+
+            def near():
+                i = random.randrange(100, n)
+                return positions[i - 100], positions[i]
+
+            def far():
+                return positions[random.randrange(n // 10)], head
+
+            results = {
+                "is_ancestor near": [lambda: graph.is_ancestor(*near())],
+                "is_ancestor far": [lambda: graph.is_ancestor(*far())],
+                "not ancestor": [
+                    lambda: graph.is_ancestor(head, positions[random.randrange(n - 1)])
+                ],
+                "merge_base near": [
+                    lambda: graph.merge_base(
+                        random.choice(recent_tips),
+                        positions[random.randrange(n - 100, n)],
+                    )
+                ],
+            }
+
+            print(
+                "%8d commits: write %.2fs, open %.2fms, %.1f bytes/commit"
+                % (count, write_s, open_s * 1e3, os.path.getsize(path) / count)
+            )
+            for name, (query,) in results.items():
+                queries = [query] * (args.queries if name != "is_ancestor far" else 3)
+                print("  %-18s %10.3f ms" % (name, timed(queries) * 1e3))
+            graph.close()
+
+
+if __name__ == "__main__":
+    main()
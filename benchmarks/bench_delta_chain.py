@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Measure reading every object of a pack with deep delta chains.
+
+Builds a repository where one file is changed in --commits commits, repacks it
+with git using long delta chains and reads all objects through pytt with and
+without the delta base cache.
+
+    python -m benchmarks.bench_delta_chain --commits 2000
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from pytt.pack import Pack
+
+
+def build_repo(repo: str, commits: int) -> str:
+    """Create a repository with a long history of one growing file, return the
+    path of its single pack."""
+    lines = ["line %d of the file\n" % i for i in range(200)]
+    stream = []
+    for i in range(commits):
+        lines[i % len(lines)] = "changed in commit %d\n" % i
+        data = "".join(lines).encode()
+        stream.append(b"commit refs/heads/master\n")
+        stream.append(b"committer Foo Bar <foo.bar@email.com> %d +0200\n" % (1531840055 + i))
+        stream.append(b"data 7\ncommit\n")
+        stream.append(b"M 100644 inline file.txt\ndata %d\n%s\n" % (len(data), data))
+
+    subprocess.run(["git", "init", "-q", repo], check=True)
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=repo, input=b"".join(stream), check=True)
+    subprocess.run(
+        ["git", "repack", "-adfq", "--depth=4095", "--window=250"], cwd=repo, check=True
+    )
+
+    pack_dir = os.path.join(repo, ".git", "objects", "pack")
+    [pack] = [name for name in os.listdir(pack_dir) if name.endswith(".pack")]
+    return os.path.join(pack_dir, pack)
+
+
+def read_all(path: str, cache_size: int) -> float:
+    pack = Pack(path, delta_cache_size=cache_size)
+    start = time.perf_counter()
+    for position in range(len(pack.index)):
+        pack.read(pack.index.sha(position))
+    elapsed = time.perf_counter() - start
+    pack.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as repo:
+        path = build_repo(repo, args.commits)
+        count = len(Pack(path).index)
+        print("%d objects" % count)
+        print("cached:   %.3fs" % read_all(path, 96 * 1024 * 1024))
+        print("uncached: %.3fs" % read_all(path, 0))
+
+
+if __name__ == "__main__":
+    main()
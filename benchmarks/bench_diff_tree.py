@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Measure diff-tree -r between commits of a large tree, with and without -M.
+
+Builds a repository of --files files in nested directories with git
+fast-import, then a commit which changes --changed files and one which moves
+--renamed files to another directory and edits them. Diffs both commits
+against their parent through pytt and git, and prints how many trees were
+read and how many pairs of files were scored for renames.
+
+    python -m benchmarks.bench_diff_tree --files 100000
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+from pytt import pytt
+from pytt.repository import Repository
+from pytt.treediff import RenameDetector, TreeDiff
+
+
+def file_path(i: int) -> str:
+    return "top%d/mid%d/file%d.txt" % (i % 10, i % 100, i)
+
+
+def file_content(i: int, edit: int = 0) -> bytes:
+    lines = [b"line %d of file %d\n" % (n, i) for n in range(40)]
+    for n in range(edit):
+        lines[n * 7] = b"edited line %d\n" % n
+    return b"".join(lines)
+
+
+def file_command(path: str, content: bytes) -> bytes:
+    return b"M 100644 inline %s\ndata %d\n%s\n" % (path.encode(), len(content), content)
+
+
+def build_repo(repo: str, files: int, changed: int, renamed: int) -> None:
+    stream = [b"commit refs/heads/master\n", b"committer A <a@b.c> 1531840055 +0200\n"]
+    stream.append(b"data 4\nbase\n")
+    for i in range(files):
+        content = file_content(i)
+        stream.append(file_command(file_path(i), content))
+
+    stream.append(b"commit refs/heads/master\n")
+    stream.append(b"committer A <a@b.c> 1531840056 +0200\n")
+    stream.append(b"data 7\nchange\n")
+    for i in range(0, files, files // changed):
+        content = file_content(i, edit=1)
+        stream.append(file_command(file_path(i), content))
+
+    stream.append(b"commit refs/heads/master\n")
+    stream.append(b"committer A <a@b.c> 1531840057 +0200\n")
+    stream.append(b"data 7\nrename\n")
+    for i in range(1, files, files // renamed):
+        content = file_content(i, edit=2)
+        stream.append(b"D %s\n" % file_path(i).encode())
+        stream.append(file_command("moved/%d.txt" % i, content))
+
+    subprocess.run(["git", "init", "-q", repo], check=True)
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=repo, input=b"".join(stream), check=True)
+
+
+def timed_pytt(old: str, new: str, renames: bool) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pytt.diff_tree(old, new, recursive=True, find_renames=50 if renames else None)
+    return time.perf_counter() - start
+
+
+def timed_git(old: str, new: str, renames: bool) -> float:
+    start = time.perf_counter()
+    command = ["git", "diff-tree", "-r", *(["-M"] if renames else []), old, new]
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--changed", type=int, default=10)
+    parser.add_argument("--renamed", type=int, default=1000)
+    args = parser.parse_args()
+    logging.getLogger("pytt").setLevel(logging.WARNING)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo:
+        build_repo(repo, args.files, args.changed, args.renamed)
+        os.chdir(repo)
+        repository = Repository(repo)
+        shas = subprocess.run(
+            ["git", "rev-parse", "master~2", "master~1", "master"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.split()
+        trees = [repository.objects.commit(sha).tree for sha in shas]
+
+        diff = TreeDiff(repository.objects.tree, recursive=True)
+        changes = diff.diff(trees[0], trees[1])
+        print(
+            "%d changes, %d trees read of %d: pytt %.3fs, git %.3fs"
+            % (
+                len(changes),
+                diff.trees_read,
+                2 * (1 + 10 + 100),
+                timed_pytt(shas[0], shas[1], False),
+                timed_git(shas[0], shas[1], False),
+            )
+        )
+
+        diff = TreeDiff(repository.objects.tree, recursive=True)
+        changes = diff.diff(trees[1], trees[2])
+        detector = RenameDetector(lambda sha: repository.objects.read(sha)[1])
+        renames = [c for c in detector.detect(changes) if c.status == "R"]
+        print(
+            "%d renames, %d pairs scored of %d: pytt -M %.3fs, git -M %.3fs"
+            % (
+                len(renames),
+                detector.scored,
+                args.renamed * args.renamed,
+                timed_pytt(shas[1], shas[2], True),
+                timed_git(shas[1], shas[2], True),
+            )
+        )
+
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Measure status with and without the fsmonitor daemon.
+
+Creates --files files spread over directories and adds them with git, then
+times pytt status with nothing changed and with --changed files changed,
+first scanning the whole working tree and then with the daemon telling
+which files changed, against git status.
+
+    python -m benchmarks.bench_fsmonitor --files 100000
+"""
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+import time
+
+from pytt import pytt
+
+from .bench_status import build_worktree
+
+
+def timed_status() -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pytt.status()
+    return time.perf_counter() - start
+
+
+def timed_git() -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        ["git", "status", "--porcelain", "--untracked-files=no"],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def change_files(repo: str, count: int, round: int) -> None:
+    for i in range(count):
+        path = os.path.join(repo, "dir%d" % (i % 100), "file%d" % i)
+        with open(path, "a") as f:
+            f.write("change %d\n" % round)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--changed", type=int, default=10)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo:
+        build_worktree(repo, args.files)
+        os.chdir(repo)
+        time.sleep(1)
+        subprocess.run(["git", "update-index", "--refresh", "-q"], check=True)
+
+        print("git unchanged:     %.3fs" % timed_git())
+        change_files(repo, args.changed, 0)
+        print("git changed:       %.3fs" % timed_git())
+
+        print("without daemon, unchanged: %.3fs" % timed_status())
+        change_files(repo, args.changed, 1)
+        print("without daemon, changed:   %.3fs" % timed_status())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            pytt.fsmonitor_start()
+        try:
+            # the first query can't be answered and scans everything
+            print("with daemon, first:        %.3fs" % timed_status())
+            print("with daemon, unchanged:    %.3fs" % timed_status())
+            change_files(repo, args.changed, 2)
+            print("with daemon, changed:      %.3fs" % timed_status())
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                pytt.fsmonitor_stop()
+
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
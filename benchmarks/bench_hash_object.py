@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Compare hash-object throughput and memory with git hash-object.
+
+Hashes a generated file of --size MiB through the pytt and git command line,
+with and without writing the object, and reports MiB/s and the peak RSS of
+each process.
+
+    python -m benchmarks.bench_hash_object --size 1024
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def generate(path: str, size_mb: int) -> None:
+    """Write a file of half random, half repetitive data so compression has
+    some work to do."""
+    with open(path, "wb") as f:
+        for i in range(size_mb):
+            f.write(os.urandom(512 * 1024))
+            f.write(b"%08d" % i * (64 * 1024))
+
+
+def run(command, cwd: str):
+    """Run the command, return its wall time and peak RSS in MiB."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status:
+        raise RuntimeError("%s failed" % command)
+
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=256, help="file size in MiB")
+    args = parser.parse_args()
+
+    env_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.environ["PYTHONPATH"] = env_path
+
+    with tempfile.TemporaryDirectory() as repo:
+        subprocess.run(["git", "init", "-q", repo], check=True)
+        path = os.path.join(repo, "artifact.bin")
+        generate(path, args.size)
+
+        commands = {
+            "pytt hash-object": [sys.executable, "-m", "pytt", "hash-object", path],
+            "pytt hash-object -w": [sys.executable, "-m", "pytt", "hash-object", "-w", path],
+            "git hash-object": ["git", "hash-object", path],
+            "git hash-object -w": ["git", "hash-object", "-w", path],
+        }
+        for name, command in commands.items():
+            elapsed, rss = run(command, repo)
+            print(
+                "%-20s %7.1f MiB/s  %6.1f MiB peak RSS"
+                % (name, args.size / elapsed, rss)
+            )
+            if "-w" in command:
+                # start the next run without the object already written
+                shutil.rmtree(os.path.join(repo, ".git", "objects"))
+                os.makedirs(os.path.join(repo, ".git", "objects"))
+
+
+if __name__ == "__main__":
+    main()
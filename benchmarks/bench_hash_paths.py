@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Measure hash-object --stdin-paths scaling with the number of threads.
+
+Generates --files files of --size KiB and hashes (and writes) all of them with
+1, 2, 4, ... threads up to the number of cores.
+
+    python -m benchmarks.bench_hash_paths --files 20000 --size 64
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from pytt import pytt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=64, help="file size in KiB")
+    parser.add_argument("--write", action="store_true", help="also write the objects")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    jobs = [1]
+    while jobs[-1] * 2 <= cores:
+        jobs.append(jobs[-1] * 2)
+    if jobs[-1] != cores:
+        jobs.append(cores)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo:
+        subprocess.run(["git", "init", "-q", repo], check=True)
+        os.chdir(repo)
+
+        paths = []
+        for i in range(args.files):
+            path = "file%06d" % i
+            with open(path, "wb") as f:
+                f.write(os.urandom(args.size * 512) + b"%08d" % i * (args.size * 64))
+            paths.append(path)
+
+        baseline = None
+        for count in jobs:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                pytt.hash_paths(paths, args.write, jobs=count)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(
+                "%2d threads: %.2fs, %.0f files/s, speedup %.2f"
+                % (count, elapsed, args.files / elapsed, baseline / elapsed)
+            )
+
+            if args.write:
+                shutil.rmtree(".git/objects")
+                os.makedirs(".git/objects")
+
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Measure parsing and serializing synthetic indexes.
+
+Builds indexes with the given numbers of entries spread over a directory
+hierarchy --depth levels deep, in every one of --versions, and reports the
+file size, parse time, pack time, peak memory of the parse and the memory
+retained per entry.
+
+    python -m benchmarks.bench_index --entries 10000 100000 1000000
+    python -m benchmarks.bench_index --entries 1000000 --depth 8 --versions 2 4
+"""
+import argparse
+import hashlib
+import struct
+import time
+import tracemalloc
+
+from pytt.index import Index
+
+
+def synthetic_paths(count: int, fanout: int = 20, depth: int = 2):
+    """Yield count sorted paths like d03/d17/file00042.txt, with depth
+    directories. The ones past the second only make the paths longer, like
+    the nested packages of a monorepo."""
+    paths = []
+    for i in range(count):
+        directories = ["d%02d" % (i % fanout), "d%02d" % ((i // fanout) % fanout)]
+        for level in range(2, depth):
+            directories.append("src_component_level%d" % level)
+        paths.append("%s/file%07d.txt" % ("/".join(directories[:depth]), i))
+    return sorted(paths)
+
+
+def synthetic_index(count: int, depth: int = 2) -> bytes:
+    """Return the content of a v2 index with count entries."""
+    content = bytearray(struct.pack(">4sII", b"DIRC", 2, count))
+    entry = struct.Struct(">10I20sH")
+    for i, path in enumerate(synthetic_paths(count, depth=depth)):
+        name = path.encode()
+        sha = hashlib.sha1(name).digest()
+        content += entry.pack(
+            1531840055, 0, 1531840055, 0, 2049, i, 0o100644, 1000, 1000, 42, sha, len(name)
+        )
+        content += name
+        content += b"\0" * (8 - (62 + len(name)) % 8)
+    content += hashlib.sha1(content).digest()
+    return bytes(content)
+
+
+def measure(count: int, depth: int = 2, version: int = 2) -> dict:
+    content = synthetic_index(count, depth)
+    if version != 2:
+        idx = Index(content)
+        idx.version = version
+        content = idx.pack()
+
+    start = time.perf_counter()
+    idx = Index(content)
+    parse = time.perf_counter() - start
+
+    # measured separately since tracing allocations slows the parse down
+    del idx
+    tracemalloc.start()
+    idx = Index(content)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    idx.pack()
+    pack = time.perf_counter() - start
+
+    return {
+        "entries": count,
+        "version": version,
+        "bytes": len(content),
+        "parse_s": round(parse, 4),
+        "pack_s": round(pack, 4),
+        "peak_mb": round(peak / 1024 / 1024, 1),
+        "bytes_per_entry": round(retained / count),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--depth", type=int, default=2, help="directories above every file")
+    parser.add_argument("--versions", type=int, nargs="+", default=[2], choices=[2, 3, 4])
+    args = parser.parse_args()
+
+    for count in args.entries:
+        for version in args.versions:
+            print(measure(count, args.depth, version))
+
+
+if __name__ == "__main__":
+    main()
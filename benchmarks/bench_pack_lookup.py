@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Measure object lookup cost in a packfile.
+
+Writes a pack with --objects small blobs (no deltas) and its v2 index into a
+temporary repository, then times sha lookups and full reads through pytt.
+
+    python -m benchmarks.bench_pack_lookup --objects 1000000
+"""
+import argparse
+import hashlib
+import os
+import random
+import struct
+import tempfile
+import time
+import zlib
+
+from pytt import pytt
+from pytt.pack import OBJ_BLOB, Pack, _entry_header
+
+
+def write_pack(directory: str, count: int) -> str:
+    """Write a pack with count distinct blobs, return its path."""
+    entries = []
+    body = bytearray(struct.pack(">4sII", b"PACK", 2, count))
+    for i in range(count):
+        data = b"blob number %d\n" % i
+        sha = hashlib.sha1(b"blob %d\0%s" % (len(data), data)).digest()
+        compressed = zlib.compress(data)
+        entries.append((sha, zlib.crc32(compressed), len(body)))
+        body += _entry_header(OBJ_BLOB, len(data))
+        body += compressed
+    checksum = hashlib.sha1(body).digest()
+    body += checksum
+
+    entries.sort()
+    fanout = [0] * 256
+    for sha, _, _ in entries:
+        fanout[sha[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    idx = bytearray(struct.pack(">4sI", b"\377tOc", 2))
+    idx += struct.pack(">256I", *fanout)
+    idx += b"".join(sha for sha, _, _ in entries)
+    idx += b"".join(struct.pack(">I", crc) for _, crc, _ in entries)
+    idx += b"".join(struct.pack(">I", offset) for _, _, offset in entries)
+    idx += checksum
+    idx += hashlib.sha1(idx).digest()
+
+    base = os.path.join(directory, "pack-%s" % checksum.hex())
+    with open(base + ".pack", "wb") as f:
+        f.write(body)
+    with open(base + ".idx", "wb") as f:
+        f.write(idx)
+
+    return base + ".pack"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as repo:
+        pack_dir = os.path.join(repo, ".git", "objects", "pack")
+        os.makedirs(pack_dir)
+
+        start = time.perf_counter()
+        path = write_pack(pack_dir, args.objects)
+        print("wrote %d objects in %.2fs" % (args.objects, time.perf_counter() - start))
+
+        pack = Pack(path)
+        shas = [pack.index.sha(random.randrange(args.objects)) for _ in range(args.lookups)]
+
+        start = time.perf_counter()
+        for sha in shas:
+            pack.index.find(sha)
+        elapsed = time.perf_counter() - start
+        print("find: %.2f us/lookup" % (elapsed / args.lookups * 1e6))
+
+        start = time.perf_counter()
+        for sha in shas:
+            pack.read(sha)
+        elapsed = time.perf_counter() - start
+        print("read: %.2f us/object" % (elapsed / args.lookups * 1e6))
+
+        os.chdir(repo)
+        hexes = [sha.hex() for sha in shas[:1000]]
+        start = time.perf_counter()
+        for sha in hexes:
+            pytt.read_object(sha)
+        elapsed = time.perf_counter() - start
+        print("pytt.read_object: %.2f us/object" % (elapsed / len(hexes) * 1e6))
+        pack.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Measure resolving abbreviated shas as the number of objects grows.
+
+Writes a pack with each of the --objects counts and resolves --lookups random
+12 character prefixes, both in a fresh process state (buckets being built) and
+again with the buckets built.
+
+    python -m benchmarks.bench_resolve --objects 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from pytt.pack import PackIndex
+from pytt.repository import Repository
+
+from .bench_pack_lookup import write_pack
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    for count in args.objects:
+        with tempfile.TemporaryDirectory() as repo:
+            pack_dir = os.path.join(repo, ".git", "objects", "pack")
+            os.makedirs(pack_dir)
+            path = write_pack(pack_dir, count)
+
+            index = PackIndex(path[: -len(".pack")] + ".idx")
+            prefixes = [
+                index.sha(random.randrange(count)).hex()[:12] for _ in range(args.lookups)
+            ]
+            index.close()
+
+            objects = Repository(repo).objects
+            for state in ("cold", "warm"):
+                start = time.perf_counter()
+                for prefix in prefixes:
+                    objects.resolve(prefix)
+                elapsed = time.perf_counter() - start
+                print(
+                    "%8d objects, %s: %.1f us/lookup"
+                    % (count, state, elapsed / args.lookups * 1e6)
+                )
+            objects.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Measure walking the history with rev-list, with and without a commit-graph.
+
+Builds a repository of --commits commits with git fast-import and lists all
+of them, and the last 100 of them as HEAD~100..HEAD, through pytt and git.
+Also times parsing a commit in full against only its headers.
+
+    python -m benchmarks.bench_rev_list --commits 20000
+"""
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+import time
+import timeit
+
+from pytt import pytt
+from pytt.object import Commit
+from pytt.repository import Repository
+from pytt.revwalk import RevWalk
+
+
+def build_repo(repo: str, commits: int) -> None:
+    """Create a repository with a linear history where every commit has a
+    multi-line message."""
+    stream = []
+    for i in range(commits):
+        message = b"commit %d\n\n%s" % (i, b"a longer description of the change\n" * 10)
+        stream.append(b"commit refs/heads/master\n")
+        stream.append(b"author Foo Bar <foo.bar@email.com> %d +0200\n" % (1531840055 + i))
+        stream.append(b"committer Foo Bar <foo.bar@email.com> %d +0200\n" % (1531840055 + i))
+        stream.append(b"data %d\n%s\n" % (len(message), message))
+
+    subprocess.run(["git", "init", "-q", repo], check=True)
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=repo, input=b"".join(stream), check=True)
+    subprocess.run(["git", "symbolic-ref", "HEAD", "refs/heads/master"], cwd=repo, check=True)
+    subprocess.run(["git", "repack", "-adq"], cwd=repo, check=True)
+
+
+def timed_pytt(revisions):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        pytt.rev_list(revisions)
+    return time.perf_counter() - start, out.getvalue().count("\n")
+
+
+def timed_git(revisions):
+    start = time.perf_counter()
+    subprocess.run(["git", "rev-list", *revisions], stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commits", type=int, default=20000)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo:
+        build_repo(repo, args.commits)
+        os.chdir(repo)
+
+        repository = Repository(repo)
+        content = repository.objects.read(repository.resolve("HEAD"))[1]
+        for message in (True, False):
+            seconds = timeit.timeit(lambda: Commit.unpack(content, message), number=10000)
+            print("Commit.unpack(message=%s): %.2f us" % (message, seconds / 10000 * 1e6))
+
+        base = list(RevWalk(repository.commit_lookup(), [repository.resolve_commit("HEAD")], max_count=101))[-1]
+        for graph in ("without", "with"):
+            if graph == "with":
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pytt.write_commit_graph()
+                print("commit-graph write: %.2fs" % (time.perf_counter() - start))
+
+            for name, revisions in (("HEAD", ["HEAD"]), ("HEAD~100..HEAD", ["%s..HEAD" % base])):
+                elapsed, count = timed_pytt(revisions)
+                print(
+                    "%s commit-graph, rev-list %s: %d commits in %.3fs, git %.3fs"
+                    % (graph, name, count, elapsed, timed_git(revisions))
+                )
+
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Measure the commands which read the index with a full and a sparse index.
+
+Generates a synthetic repository of --files files, times reading and writing
+the index, status and write-tree after a change to one file in the cone, then
+restricts the working tree to the first --cone top-level directories with
+sparse-checkout set and times the same again. Outside the cone every
+directory is a single entry of the sparse index, so the times follow the
+size of the cone instead of the size of the repository.
+
+    python -m benchmarks.bench_sparse --files 200000 --cone 1
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from typing import Callable, Dict
+
+from pytt import pytt
+from pytt.repository import Repository
+
+from .synthetic import Shape, file_paths, generate
+
+
+def timed(function: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return round(best, 4)
+
+
+def measure(repo: str, changed: str, repeat: int) -> Dict[str, float]:
+    repository = Repository(repo)
+    idx = repository.index()
+
+    def write_tree_after_change():
+        # a new stat time invalidates the directories of the file only
+        os.utime(os.path.join(repo, changed))
+        pytt.update_index("100644", idx.table.sha(idx.table.find(changed.encode())), changed)
+        pytt.write_tree()
+
+    return {
+        "entries": len(idx),
+        "index_bytes": os.path.getsize(repository.git_path("index")),
+        "read_s": timed(repository.index, repeat),
+        "write_s": timed(lambda: repository.write_index(idx), repeat),
+        "status_s": timed(pytt.status, repeat),
+        "write_tree_s": timed(write_tree_after_change, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--depth", type=int, default=3, help="directory levels above the files")
+    parser.add_argument("--cone", type=int, default=1, help="top-level directories checked out")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    shape = Shape(files=args.files, depth=args.depth, commits=1)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        repo = os.path.join(directory, "repo")
+        generate(repo, shape)
+        os.chdir(repo)
+
+        paths = file_paths(shape)
+        cone = sorted({path.partition("/")[0] for path in paths})[: args.cone]
+        changed = next(path for path in paths if path.partition("/")[0] in cone)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            pytt.write_tree()
+        print("full:   %s" % measure(repo, changed, args.repeat))
+        start = time.perf_counter()
+        pytt.sparse_checkout_set(cone)
+        print("sparse-checkout set %s: %.2fs" % (" ".join(cone), time.perf_counter() - start))
+        print("sparse: %s" % measure(repo, changed, args.repeat))
+
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Measure how long the CLI takes to start, per command and per imported module.
+
+Imports pytt.cli with `python -X importtime` and prints the modules which
+took the longest, then times every command on a small synthetic repository
+from start to exit, next to `python -c pass` for the interpreter's own
+startup. The results are written as JSON to stdout, or to --output. Given
+the JSON of an earlier run as --baseline, the timings which got more than
+--tolerance times slower are reported and the exit status is 1.
+
+    python -m benchmarks.bench_startup --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import pytt as pytt_package
+
+from .synthetic import Shape, file_paths, generate
+
+# The python -c pass entry, which the commands can't get below.
+INTERPRETER = "python"
+
+
+def environment() -> Dict[str, str]:
+    # the CLI runs this same pytt, even when it isn't installed, and with the
+    # compiled modules cached like an installed pytt would
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(pytt_package.__file__)))
+    env = dict(os.environ, PYTHONPATH=package_parent)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def commands(repo: str, shape: Shape) -> Dict[str, List[str]]:
+    path = file_paths(shape)[0]
+    blob, parent, commit = subprocess.run(
+        ["git", "rev-parse", "HEAD:%s" % path, "HEAD~", "HEAD"],
+        cwd=repo,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.split()
+
+    return {
+        INTERPRETER: ["-c", "pass"],
+        "--help": ["-m", "pytt", "--help"],
+        "hash-object": ["-m", "pytt", "hash-object", path],
+        "cat-file": ["-m", "pytt", "cat-file", blob],
+        "rev-parse": ["-m", "pytt", "rev-parse", commit[:7]],
+        "update-ref": ["-m", "pytt", "update-ref", "refs/heads/bench", commit],
+        "ls-files": ["-m", "pytt", "ls-files"],
+        "status": ["-m", "pytt", "status"],
+        "diff-tree": ["-m", "pytt", "diff-tree", "-r", parent, commit],
+    }
+
+
+def import_times(env: Dict[str, str]) -> Tuple[float, List[Tuple[str, float, float]]]:
+    """Return the seconds importing pytt.cli took and the (module, self,
+    cumulative) seconds of every module it imported."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import pytt.cli"],
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stderr
+
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        modules.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+
+    total = next(cumulative for name, _, cumulative in modules if name == "pytt.cli")
+    return total, modules
+
+
+def time_runs(argv: List[str], repeat: int, cwd: str, env: Dict[str, str]) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=cwd, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every timing which got more than tolerance times slower."""
+    found = []
+    for name, timing in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = timing["median"] / before["median"]
+        if ratio > tolerance:
+            found.append("%s: %.2fx slower" % (name, ratio))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000, help="files in the repository")
+    parser.add_argument("--repeat", type=int, default=10, help="runs per command")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to print")
+    parser.add_argument("--output", help="write the JSON here instead of to stdout")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.25, help="slowdown reported as a regression"
+    )
+    args = parser.parse_args()
+    env = environment()
+    shape = Shape(files=args.files, commits=2)
+
+    # the first import writes the cached bytecode
+    import_times(env)
+    totals = []
+    for _ in range(args.repeat):
+        total, modules = import_times(env)
+        totals.append(total)
+    print("import pytt.cli: %.1f ms" % (statistics.median(totals) * 1000), file=sys.stderr)
+    for name, own, cumulative in sorted(modules, key=lambda m: -m[1])[: args.top]:
+        print(
+            "  %-30s %6.2f ms self %6.2f ms cumulative" % (name, own * 1000, cumulative * 1000),
+            file=sys.stderr,
+        )
+
+    results = {"import pytt.cli": {"min": min(totals), "median": statistics.median(totals)}}
+    with tempfile.TemporaryDirectory() as directory:
+        repo = os.path.join(directory, "repo")
+        generate(repo, shape)
+        for name, argv in commands(repo, shape).items():
+            results[name] = time_runs([sys.executable, *argv], args.repeat, repo, env)
+            print("%-16s %6.1f ms" % (name, results[name]["median"] * 1000), file=sys.stderr)
+
+    report = {"python": sys.version.split()[0], "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline["results"], args.tolerance)
+        for regression in found:
+            print("regression: %s" % regression, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
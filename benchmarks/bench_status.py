@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Measure status, which compares the working tree to the index.
+
+Creates --files files spread over directories and adds them with git, then
+times pytt status when nothing changed, after every file was touched (so each
+one is hashed and its stat data refreshed) and once more after the refresh,
+on a single thread and on --jobs threads, against git status.
+
+    python -m benchmarks.bench_status --files 20000
+"""
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+import time
+
+from pytt import pytt
+
+
+def build_worktree(repo: str, files: int) -> None:
+    for i in range(files):
+        directory = os.path.join(repo, "dir%d" % (i % 100))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "file%d" % i), "w") as f:
+            f.write("content of file %d\n" % i * 20)
+
+    subprocess.run(["git", "init", "-q", repo], check=True)
+    subprocess.run(["git", "add", "."], cwd=repo, check=True)
+
+
+def touch_all(repo: str) -> None:
+    for directory, _, names in os.walk(repo):
+        if ".git" in directory.split(os.sep):
+            continue
+        for name in names:
+            os.utime(os.path.join(directory, name))
+
+
+def timed_status(jobs: int) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pytt.status(jobs=jobs)
+    return time.perf_counter() - start
+
+
+def timed_git() -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        ["git", "status", "--porcelain", "--untracked-files=no"],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--jobs", type=int, default=16)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo:
+        build_worktree(repo, args.files)
+        os.chdir(repo)
+        # let the index fall out of the racy window
+        time.sleep(1)
+        subprocess.run(["git", "update-index", "--refresh", "-q"], check=True)
+
+        for jobs in (1, args.jobs):
+            print("jobs=%d unchanged: %.3fs" % (jobs, timed_status(jobs)))
+            touch_all(repo)
+            time.sleep(0.01)
+            print("jobs=%d touched:   %.3fs" % (jobs, timed_status(jobs)))
+            print("jobs=%d refreshed: %.3fs" % (jobs, timed_status(jobs)))
+
+        touch_all(repo)
+        print("git touched:   %.3fs" % timed_git())
+        print("git refreshed: %.3fs" % timed_git())
+
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Measure parsing large trees and looking up entries by name.
+
+    python -m benchmarks.bench_tree --entries 1000 10000 50000
+"""
+import argparse
+import hashlib
+import time
+
+from pytt.object import Tree
+
+
+def synthetic_tree(count: int) -> bytes:
+    """Return the content of a tree with count blobs and directories."""
+    entries = []
+    for i in range(count):
+        name = ("dir%07d" if i % 10 == 0 else "file%07d.c") % i
+        mode = b"40000" if i % 10 == 0 else b"100644"
+        entries.append((name.encode(), mode))
+    entries.sort(key=lambda e: e[0] + b"/" if e[1] == b"40000" else e[0])
+    return b"".join(
+        b"%s %s\0%s" % (mode, name, hashlib.sha1(name).digest()) for name, mode in entries
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    for count in args.entries:
+        content = synthetic_tree(count)
+
+        start = time.perf_counter()
+        tree = Tree.unpack(content)
+        parse = time.perf_counter() - start
+
+        names = ["file%07d.c" % i for i in range(1, count, 97)]
+        tree.find(names[0])
+        start = time.perf_counter()
+        for name in names:
+            tree.find(name)
+        find = (time.perf_counter() - start) / len(names)
+
+        print(
+            {
+                "entries": count,
+                "parse_ms": round(parse * 1000, 2),
+                "find_us": round(find * 1e6, 2),
+            }
+        )
+
+
+if __name__ == "__main__":
+    main()
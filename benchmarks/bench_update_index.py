@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Measure staging many paths with update-index.
+
+Stages --paths files in a fresh repository with a single batched
+update_index_info call, and --single of them one update_index call at a time
+for comparison.
+
+    python -m benchmarks.bench_update_index --paths 100000 --single 1000
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import tempfile
+import time
+
+from pytt import pytt
+
+from .bench_index import synthetic_paths
+
+
+def fresh_repo(repo: str, paths) -> None:
+    """Create a repository with an empty index and the given (empty) files."""
+    subprocess.run(["git", "init", "-q", repo], check=True)
+    subprocess.run(["git", "read-tree", "--empty"], cwd=repo, check=True)
+    for path in paths:
+        full_path = os.path.join(repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        open(full_path, "w").close()
+
+
+def index_info(paths):
+    for path in paths:
+        yield "100644", hashlib.sha1(path.encode()).hexdigest(), path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", type=int, default=100000)
+    parser.add_argument("--single", type=int, default=1000)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    for count, batched in ((args.paths, True), (args.single, False)):
+        paths = synthetic_paths(count)
+        with tempfile.TemporaryDirectory() as repo:
+            fresh_repo(repo, paths)
+            os.chdir(repo)
+
+            start = time.perf_counter()
+            if batched:
+                pytt.update_index_info(index_info(paths))
+            else:
+                for mode, sha, path in index_info(paths):
+                    pytt.update_index(mode, sha, path)
+            elapsed = time.perf_counter() - start
+
+            os.chdir(cwd)
+
+        print(
+            "%s: %d paths in %.2fs (%.1f us/path)"
+            % ("batched" if batched else "single", count, elapsed, elapsed / count * 1e6)
+        )
+
+
+if __name__ == "__main__":
+    main()
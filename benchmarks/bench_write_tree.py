@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Measure write-tree with and without a valid cache-tree.
+
+Writes the trees of a synthetic index with --entries entries, then changes a
+single entry and writes the trees again, which only has to rewrite the
+directories on the path to the changed entry.
+
+    python -m benchmarks.bench_write_tree --entries 500000
+"""
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+import time
+
+from pytt import pytt
+from pytt.repository import Repository
+
+from .bench_index import synthetic_index
+
+
+def timed_write_tree() -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pytt.write_tree()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=500000)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as repo:
+        subprocess.run(["git", "init", "-q", repo], check=True)
+        with open(os.path.join(repo, ".git", "index"), "wb") as f:
+            f.write(synthetic_index(args.entries))
+        os.chdir(repo)
+
+        print("cold:      %.2fs" % timed_write_tree())
+        print("unchanged: %.2fs" % timed_write_tree())
+
+        repository = Repository(repo)
+        idx = repository.index()
+        entry = next(idx.get_entries())
+        entry.sha = "0" * 40
+        idx.add_entry(entry)
+        repository.write_index(idx)
+        print("one entry: %.2fs" % timed_write_tree())
+
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""Time the plumbing commands on a synthetic repository and report JSON.
+
+Every command is timed in-process, through the pytt CLI and with the git
+binary, --repeat times each. A table is printed to stderr and the results
+are written as JSON to stdout, or to --output. Given the JSON of an earlier
+run as --baseline, the commands which got more than --tolerance times
+slower are reported and the exit status is 1.
+
+    python -m benchmarks.suite --files 10000 --output results.json
+    python -m benchmarks.suite --files 10000 --baseline results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+import pytt as pytt_package
+from pytt import pytt
+
+from .synthetic import Shape, add_shape_arguments, file_paths, generate, shape_from_arguments
+
+MODES = ("in-process", "cli", "git")
+
+# git commit-tree refuses to work without an identity.
+GIT_IDENTITY = {
+    "GIT_AUTHOR_NAME": "Foo Bar",
+    "GIT_AUTHOR_EMAIL": "foo.bar@email.com",
+    "GIT_COMMITTER_NAME": "Foo Bar",
+    "GIT_COMMITTER_EMAIL": "foo.bar@email.com",
+}
+
+
+class Case(NamedTuple):
+    """A command, run in the repository three ways."""
+
+    name: str
+    in_process: Callable[[], None]
+    cli: List[str]  # the arguments to pytt
+    git: List[str]  # the arguments to git
+
+
+def cases(repo: str, shape: Shape) -> List[Case]:
+    path = file_paths(shape)[0]
+    blob, tree, commit = subprocess.run(
+        ["git", "rev-parse", "HEAD:%s" % path, "HEAD^{tree}", "HEAD"],
+        cwd=repo,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.split()
+
+    return [
+        Case(
+            "hash-object",
+            lambda: pytt.hash_file(path),
+            ["hash-object", path],
+            ["hash-object", path],
+        ),
+        Case(
+            "cat-file",
+            lambda: pytt.cat_file(blob),
+            ["cat-file", blob],
+            ["cat-file", "-p", blob],
+        ),
+        Case("ls-files", pytt.ls_files, ["ls-files"], ["ls-files", "-s"]),
+        Case(
+            "update-index",
+            lambda: pytt.update_index("100644", blob, path),
+            ["update-index", "100644", blob, path],
+            ["update-index", "--cacheinfo", "100644,%s,%s" % (blob, path)],
+        ),
+        Case("write-tree", pytt.write_tree, ["write-tree"], ["write-tree"]),
+        Case(
+            "commit-tree",
+            lambda: pytt.commit_tree(tree, "benchmark", commit),
+            ["commit-tree", tree, "-p", commit, "-m", "benchmark"],
+            ["commit-tree", tree, "-p", commit, "-m", "benchmark"],
+        ),
+    ]
+
+
+def time_runs(run: Callable[[], None], repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def run_case(case: Case, repeat: int) -> Dict[str, Dict[str, float]]:
+    # the CLI runs this same pytt, even when it isn't installed
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(pytt_package.__file__)))
+    env = dict(os.environ, PYTHONPATH=package_parent, **GIT_IDENTITY)
+
+    def in_process():
+        with contextlib.redirect_stdout(io.StringIO()):
+            case.in_process()
+
+    def command(argv):
+        return lambda: subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, check=True)
+
+    return {
+        "in-process": time_runs(in_process, repeat),
+        "cli": time_runs(command([sys.executable, "-m", "pytt", *case.cli]), repeat),
+        "git": time_runs(command(["git", *case.git]), repeat),
+    }
+
+
+def environment() -> Dict[str, str]:
+    git = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    return {
+        "python": platform.python_version(),
+        "git": git,
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every pytt timing which got more than tolerance times slower."""
+    found = []
+    for name, modes in results.items():
+        for mode in ("in-process", "cli"):
+            before = baseline.get(name, {}).get(mode)
+            if before is None:
+                continue
+            ratio = modes[mode]["median"] / before["median"]
+            if ratio > tolerance:
+                found.append("%s %s: %.2fx slower" % (name, mode, ratio))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_shape_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per command and mode")
+    parser.add_argument("--commands", nargs="*", help="only time these commands")
+    parser.add_argument("--output", help="write the JSON here instead of to stdout")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.25, help="slowdown reported as a regression"
+    )
+    args = parser.parse_args()
+    shape = shape_from_arguments(args)
+
+    cwd = os.getcwd()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        repo = os.path.join(directory, "repo")
+        start = time.perf_counter()
+        generate(repo, shape)
+        print("generated %s in %.1fs" % (shape, time.perf_counter() - start), file=sys.stderr)
+
+        os.chdir(repo)
+        try:
+            for case in cases(repo, shape):
+                if args.commands and case.name not in args.commands:
+                    continue
+                results[case.name] = run_case(case, args.repeat)
+                print(
+                    "%-14s %s"
+                    % (
+                        case.name,
+                        "  ".join(
+                            "%s %.4fs" % (mode, results[case.name][mode]["median"])
+                            for mode in MODES
+                        ),
+                    ),
+                    file=sys.stderr,
+                )
+        finally:
+            os.chdir(cwd)
+
+    report = {"shape": shape._asdict(), "environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("shape") != report["shape"]:
+            print("the baseline was run on another shape of repository", file=sys.stderr)
+        found = regressions(results, baseline["results"], args.tolerance)
+        for regression in found:
+            print("regression: %s" % regression, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Generate a synthetic repository to benchmark against.
+
+Like scripts/create_repo.sh, but the number of files, the depth of the
+directories, the length of the history and the size of the blobs are all
+configurable. The history is written with git fast-import, then checked out
+so the working tree and the index match HEAD.
+
+    python -m benchmarks.synthetic /tmp/repo --files 100000 --depth 4 --commits 100
+"""
+import argparse
+import os
+import random
+import subprocess
+from typing import List, NamedTuple
+
+WORDS = [b"tree", b"blob", b"commit", b"index", b"pack", b"delta", b"sha", b"ref", b"object"]
+
+
+class Shape(NamedTuple):
+    """What a synthetic repository looks like."""
+
+    files: int = 1000
+    depth: int = 3  # directory levels above the files
+    fanout: int = 10  # directories per directory
+    commits: int = 10
+    changes: int = 10  # files changed by every commit after the first
+    blob_size: int = 1024  # average, the sizes vary between half and 1.5 times
+    seed: int = 0
+
+
+def file_paths(shape: Shape) -> List[str]:
+    """Return the path of every file, spread evenly over the directories."""
+    paths = []
+    for i in range(shape.files):
+        directories = []
+        rest = i
+        for level in range(shape.depth):
+            directories.append("d%d-%d" % (level, rest % shape.fanout))
+            rest //= shape.fanout
+        paths.append("/".join(directories + ["file%d.txt" % i]))
+    return paths
+
+
+def blob(rng: random.Random, size: int) -> bytes:
+    """Return text-like content of about size bytes."""
+    target = rng.randint(size // 2, size + size // 2)
+    lines = []
+    length = 0
+    while length < target:
+        line = b" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 10))) + b"\n"
+        lines.append(line)
+        length += len(line)
+    return b"".join(lines)
+
+
+def generate(path: str, shape: Shape = Shape()) -> None:
+    """Create the repository at path, which must not exist yet."""
+    rng = random.Random(shape.seed)
+    paths = file_paths(shape)
+
+    stream = []
+    for commit in range(shape.commits):
+        if commit == 0:
+            changed = range(len(paths))
+        else:
+            changed = rng.sample(range(len(paths)), min(shape.changes, len(paths)))
+        message = b"commit %d" % commit
+        stream.append(b"commit refs/heads/master\n")
+        stream.append(b"author Foo Bar <foo.bar@email.com> %d +0200\n" % (1531840055 + commit))
+        stream.append(b"committer Foo Bar <foo.bar@email.com> %d +0200\n" % (1531840055 + commit))
+        stream.append(b"data %d\n%s\n" % (len(message), message))
+        for i in changed:
+            content = blob(rng, shape.blob_size)
+            stream.append(b"M 100644 inline %s\n" % paths[i].encode())
+            stream.append(b"data %d\n%s\n" % (len(content), content))
+
+    subprocess.run(["git", "init", "-q", path], check=True)
+    subprocess.run(["git", "symbolic-ref", "HEAD", "refs/heads/master"], cwd=path, check=True)
+    subprocess.run(
+        ["git", "fast-import", "--quiet"], cwd=path, input=b"".join(stream), check=True
+    )
+    subprocess.run(["git", "reset", "-q", "--hard"], cwd=path, check=True)
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = Shape()
+    for field in Shape._fields:
+        parser.add_argument(
+            "--%s" % field.replace("_", "-"), type=int, default=getattr(defaults, field)
+        )
+
+
+def shape_from_arguments(args: argparse.Namespace) -> Shape:
+    return Shape(**{field: getattr(args, field) for field in Shape._fields})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="where to create the repository")
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error("%s already exists" % args.path)
+    generate(args.path, shape_from_arguments(args))
+
+
+if __name__ == "__main__":
+    main()
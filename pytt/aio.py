@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from . import trace
+from .repository import ObjectDatabase
+
+log = logging.getLogger("pytt")
+
+# Threads reading objects, unless an executor is given. Reading a loose object
+# is mostly waiting for the disk and for zlib, which both release the GIL.
+MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+class AsyncObjectDatabase:
+    """Reads the objects of an ObjectDatabase without blocking the event loop.
+
+    The reads run on a bounded pool of threads, and the results are handed
+    back to the loop. Loose and packed objects are read and inflated on the
+    threads in parallel, the delta base caches of the packs lock themselves
+    and only abbreviated shas are resolved one at a time, as the name index
+    loads its buckets as it goes. Concurrent reads of the same sha share a
+    single read: the first one starts it and the others wait for its result.
+
+    The ObjectDatabase shouldn't be used directly while reads are running.
+
+    Examples
+    --------
+    >>> async def main(shas):
+    ...     async with AsyncObjectDatabase(ObjectDatabase(".git/objects")) as odb:
+    ...         object_type, data = await odb.read(shas[0])
+    ...         async for sha, object_type, data in odb.read_many(shas):
+    ...             print(sha, object_type, len(data))
+    """
+
+    def __init__(
+        self,
+        objects: ObjectDatabase,
+        max_workers: int = MAX_WORKERS,
+        executor: Optional[concurrent.futures.Executor] = None,
+    ) -> None:
+        self.objects = objects
+        self.coalesced = 0  # reads which waited for a read already running
+
+        self._own_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="pytt-read"
+        )
+        self._resolve_lock = threading.Lock()
+        self._in_flight: Dict[str, asyncio.Future[Tuple[str, bytes]]] = {}
+
+    async def __aenter__(self) -> AsyncObjectDatabase:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    async def read(self, sha: str) -> Tuple[str, bytes]:
+        """Return the type and content of the object, like ObjectDatabase.read.
+
+        Raises FileNotFoundError if there is no such object.
+        """
+        future = self._in_flight.get(sha)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self._read, sha)
+            self._in_flight[sha] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(sha, None))
+        else:
+            self.coalesced += 1
+
+        # a reader which is cancelled leaves the read running for the others
+        return await asyncio.shield(future)
+
+    async def read_many(self, shas: Iterable[str]) -> AsyncIterator[Tuple[str, str, bytes]]:
+        """Yield (sha, type, content) of every object in the order the reads
+        complete, not the order of shas. A sha given twice is yielded once.
+
+        Raises FileNotFoundError once a missing object is reached, the reads
+        still running are then cancelled, as they are when the caller stops
+        iterating early.
+        """
+
+        async def read_named(sha: str) -> Tuple[str, Tuple[str, bytes]]:
+            return sha, await self.read(sha)
+
+        tasks = [asyncio.ensure_future(read_named(sha)) for sha in dict.fromkeys(shas)]
+        try:
+            for done in asyncio.as_completed(tasks):
+                sha, (object_type, data) = await done
+                yield sha, object_type, data
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self) -> None:
+        """Wait for the running reads and stop the threads, unless the
+        executor was given."""
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+
+    def _read(self, sha: str) -> Tuple[str, bytes]:
+        """Read the object on an executor thread."""
+        objects = self.objects
+        if len(sha) != 40:
+            with self._resolve_lock:
+                sha = objects.resolve(sha)
+            if len(sha) != 40:
+                raise FileNotFoundError("object %s not found" % sha)
+
+        trace.count("object/read")
+        obj = objects.read_loose(sha)
+        if obj is None:
+            obj = objects.read_packed(sha)
+        if obj is None:
+            raise FileNotFoundError("object %s not found" % sha)
+
+        return obj
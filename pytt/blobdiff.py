@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import logging
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+log = logging.getLogger("pytt")
+
+ALGORITHMS = ("myers", "histogram")
+
+# Lines of context around the changes of a hunk, like diff -u.
+CONTEXT = 3
+
+# The histogram diff falls back to Myers in a region where every line of the
+# old side occurs more often than this, like git's xhistogram.
+MAX_CHAIN_LENGTH = 64
+
+NO_NEWLINE = b"\\ No newline at end of file\n"
+
+# The longest function context shown after a hunk header, like git's.
+FUNCTION_CONTEXT_SIZE = 80
+
+# The matching lines, as pairs of positions in the old and new lines.
+Matches = List[Tuple[int, int]]
+
+
+def intern(old: Sequence[bytes], new: Sequence[bytes]) -> Tuple[List[int], List[int]]:
+    """Replace every distinct line by a small int, so that comparing two
+    lines compares two ints instead of two byte strings."""
+    ids: Dict[bytes, int] = {}
+    old_ids = [ids.setdefault(line, len(ids)) for line in old]
+    new_ids = [ids.setdefault(line, len(ids)) for line in new]
+    return old_ids, new_ids
+
+
+def diff_lines(old: Sequence[bytes], new: Sequence[bytes], algorithm: str = "myers") -> Matches:
+    """Return the pairs of lines the two sequences have in common, in order.
+    Every line which isn't in a pair was removed from old or added in new."""
+    if algorithm not in ALGORITHMS:
+        raise ValueError("unknown diff algorithm %s" % algorithm)
+
+    a, b = intern(old, new)
+    matches: Matches = []
+    if algorithm == "histogram":
+        _histogram(a, b, matches)
+    else:
+        _myers(a, b, [(0, len(a), 0, len(b))], matches)
+    matches.sort()
+    return matches
+
+
+def unified_diff(
+    old: bytes, new: bytes, context: int = CONTEXT, algorithm: str = "myers"
+) -> Iterator[bytes]:
+    """Yield the hunks of the unified diff from old to new, a line at a time,
+    starting with the @@ header of each hunk.
+
+    The lines are diffed up front, but the output is generated as it is
+    consumed, so a diff of large files is never held in memory as a whole.
+
+    Like git, the header of a hunk ends with the last line before it which
+    starts with a letter, _ or $, usually the function the hunk is in.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matches = diff_lines(old_lines, new_lines, algorithm)
+
+    # the function context is searched from where the previous hunk left off
+    function, searched = b"", 0
+    for hunk in _hunks(matches, len(old_lines), len(new_lines), context):
+        (i1, i2, j1, j2), changes = hunk
+        function = _function_line(old_lines, searched, i1) or function
+        searched = i1
+        header = b"@@ -%s +%s @@" % (_range(i1, i2), _range(j1, j2))
+        yield header + (b" " + function if function else b"") + b"\n"
+
+        i = i1
+        for ci1, ci2, cj1, cj2 in changes:
+            for k in range(i, ci1):
+                yield from _line(b" ", old_lines[k])
+            for k in range(ci1, ci2):
+                yield from _line(b"-", old_lines[k])
+            for k in range(cj1, cj2):
+                yield from _line(b"+", new_lines[k])
+            i = ci2
+        for k in range(i, i2):
+            yield from _line(b" ", old_lines[k])
+
+
+def _function_line(lines: Sequence[bytes], start: int, end: int) -> bytes:
+    """Return the last line in start:end which starts like a definition."""
+    for position in range(end - 1, start - 1, -1):
+        line = lines[position]
+        if line[:1].isalpha() or line[:1] in (b"_", b"$"):
+            return line[:FUNCTION_CONTEXT_SIZE].rstrip()
+
+    return b""
+
+
+def _line(prefix: bytes, line: bytes) -> Iterator[bytes]:
+    yield prefix + line
+    if not line.endswith(b"\n"):
+        yield b"\n" + NO_NEWLINE
+
+
+def _range(start: int, end: int) -> bytes:
+    """The start,count of a hunk header, 1-based like diff -u."""
+    if end - start == 1:
+        return b"%d" % (start + 1)
+    # an empty range starts at the line before it
+    return b"%d,%d" % (start + 1 if end > start else start, end - start)
+
+
+def _hunks(matches: Matches, old_count: int, new_count: int, context: int) -> Iterator[Tuple]:
+    """Yield the (old start, old end, new start, new end) of every hunk with
+    the changes in it, merging changes which are at most 2 * context lines
+    apart."""
+    changes = []
+    i = j = 0
+    for mi, mj in matches + [(old_count, new_count)]:
+        if mi > i or mj > j:
+            changes.append((i, mi, j, mj))
+        i, j = mi + 1, mj + 1
+
+    start = 0
+    while start < len(changes):
+        end = start + 1
+        while end < len(changes) and changes[end][0] - changes[end - 1][1] <= 2 * context:
+            end += 1
+
+        first, last = changes[start], changes[end - 1]
+        before = min(context, first[0])
+        after = min(context, old_count - last[1])
+        bounds = (first[0] - before, last[1] + after, first[2] - before, last[3] + after)
+        yield bounds, changes[start:end]
+        start = end
+
+
+def _myers(a: List[int], b: List[int], regions: List[Tuple[int, ...]], matches: Matches) -> None:
+    """Find the matches of the regions with Myers' O(ND) algorithm, in linear
+    space: the middle snake of the shortest edit script splits a region in
+    two, which are solved the same way."""
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = _trim(a, b, alo, ahi, blo, bhi, matches)
+        if alo == ahi or blo == bhi:
+            continue
+
+        x, y, u, v = _middle_snake(a, b, alo, ahi, blo, bhi)
+        matches.extend(zip(range(x, u), range(y, v)))
+        regions.append((alo, x, blo, y))
+        regions.append((u, ahi, v, bhi))
+
+
+def _trim(a: List[int], b: List[int], alo: int, ahi: int, blo: int, bhi: int, matches: Matches):
+    """Match the common prefix and suffix of the region, return what's left."""
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        matches.append((alo, blo))
+        alo += 1
+        blo += 1
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        matches.append((ahi, bhi))
+
+    return alo, ahi, blo, bhi
+
+
+def _middle_snake(a: List[int], b: List[int], alo: int, ahi: int, blo: int, bhi: int):
+    """Return the start and end of the middle snake of the region.
+
+    The furthest x reached on every diagonal k = x - y is searched forward
+    from the start and backward from the end, d edits at a time, until the
+    two searches overlap. The lists are indexed by k directly, negative
+    diagonals wrap around to their end.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    size = 2 * (n + m) + 3
+    forward = [0] * size
+    backward = [0] * size
+
+    for d in range((n + m + 1) // 2 + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[k - 1] < forward[k + 1]):
+                x = forward[k + 1]
+            else:
+                x = forward[k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[k] = x
+
+            if odd and -d < delta - k < d and x + backward[delta - k] >= n:
+                return alo + start_x, blo + start_y, alo + x, blo + y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[k - 1] < backward[k + 1]):
+                x = backward[k + 1]
+            else:
+                x = backward[k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            backward[k] = x
+
+            if not odd and -d <= delta - k <= d and x + forward[delta - k] >= n:
+                return alo + n - x, blo + m - y, alo + n - start_x, blo + m - start_y
+
+    raise AssertionError("the middle snake is always found")
+
+
+def _histogram(a: List[int], b: List[int], matches: Matches) -> None:
+    """Find the matches with git's histogram diff.
+
+    In a region, the lines of the new side are looked up in a histogram of
+    the old side. The match around the line which occurs the fewest times,
+    the longest one among those, anchors the region, and the parts before
+    and after it are solved the same way. Rare lines are the most likely to
+    be unchanged, which keeps moved blocks and braces from being matched
+    against each other and makes the hunks easier to read than Myers'.
+    """
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = _trim(a, b, alo, ahi, blo, bhi, matches)
+        if alo == ahi or blo == bhi:
+            continue
+
+        occurrences: Dict[int, List[int]] = {}
+        for i in range(alo, ahi):
+            occurrences.setdefault(a[i], []).append(i)
+
+        best = None
+        best_count = MAX_CHAIN_LENGTH + 1
+        best_length = 0
+        j = blo
+        while j < bhi:
+            next_j = j + 1
+            positions = occurrences.get(b[j])
+            if positions is not None and len(positions) <= best_count:
+                for i in positions:
+                    s, t = i, j
+                    while s > alo and t > blo and a[s - 1] == b[t - 1]:
+                        s -= 1
+                        t -= 1
+                    e, f = i + 1, j + 1
+                    while e < ahi and f < bhi and a[e] == b[f]:
+                        e += 1
+                        f += 1
+
+                    next_j = max(next_j, f)
+                    if len(positions) < best_count or e - s > best_length:
+                        best = (s, e, t, f)
+                        best_count = len(positions)
+                        best_length = e - s
+            j = next_j
+
+        if best is None:
+            _myers(a, b, [(alo, ahi, blo, bhi)], matches)
+            continue
+
+        s, e, t, f = best
+        matches.extend(zip(range(s, e), range(t, f)))
+        regions.append((alo, s, blo, t))
+        regions.append((e, ahi, f, bhi))
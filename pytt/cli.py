@@ -1,12 +1,10 @@
 #!/usr/bin/env python
 import argparse
-import json
 import logging
+import os
 import sys
 
-import colorlog
-
-from . import pytt
+from . import trace
 
 log = logging.getLogger("pytt")
 log_levels = {
@@ -18,85 +16,554 @@ log_levels = {
 }
 log_names = list(log_levels)
 
+# The global options which take a value, skipped when looking for the command.
+VALUE_OPTIONS = {"-l", "--log-level", "--profile", "--cprofile"}
+
 
 def run():
     args = _parse_args()
     _set_up_logging(args)
 
+    trace_path = args.profile or os.environ.get(trace.TRACE_ENV)
+    if trace_path:
+        trace.start(trace_path, sys.argv)
+    cprofile_path = args.cprofile or os.environ.get(trace.CPROFILE_ENV)
+    profiler = None
+    if cprofile_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    code = 1
+    try:
+        with trace.region("cmd", args.command or ""):
+            _run_command(args)
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+        trace.stop(code)
+
+
+def _run_command(args):
+    # imported here so that --help and argument errors don't pay for it
+    from . import pytt
+
     if args.command == "cat-file":
-        pytt.cat_file(args.object)
+        if args.batch or args.batch_check:
+            names = (line.strip() for line in sys.stdin if line.strip())
+            pytt.cat_file_batch(
+                names, sys.stdout.buffer, contents=args.batch, flush=not args.buffer
+            )
+        elif args.object is None:
+            print("cat-file needs an object or --batch/--batch-check")
+        else:
+            pytt.cat_file(args.object)
     elif args.command == "hash-object":
-        pytt.hash_object(args.content.encode(), args.write)
+        if args.stdin_paths:
+            paths = (line.rstrip("\n") for line in sys.stdin if line.strip())
+            pytt.hash_paths(paths, args.write, jobs=args.jobs)
+        elif args.stdin:
+            pytt.hash_stream(sys.stdin.buffer, args.write)
+        elif args.path is None:
+            print("hash-object needs a path or --stdin")
+        else:
+            pytt.hash_file(args.path, args.write)
     elif args.command == "ls-files":
-        pytt.ls_files()
+        pytt.ls_files(args.sparse)
     elif args.command == "update-index":
-        pytt.update_index(args.mode, args.sha, args.filename)
+        if args.index_version is not None:
+            pytt.update_index_version(args.index_version)
+        elif args.index_info:
+            terminator = b"\0" if args.z else b"\n"
+            pytt.update_index_info(_read_index_info(sys.stdin.buffer, terminator))
+        elif args.filename is None:
+            print("update-index needs a mode, sha and filename or --index-info")
+        else:
+            pytt.update_index(args.mode, args.sha, args.filename)
+    elif args.command == "status":
+        pytt.status(not args.no_refresh, args.jobs)
+    elif args.command == "diff-files":
+        pytt.diff_files(args.refresh, args.jobs)
+    elif args.command == "fsmonitor":
+        if args.action == "run":
+            pytt.fsmonitor_run()
+        elif args.action == "start":
+            pytt.fsmonitor_start(args.log_level)
+        elif args.action == "stop":
+            pytt.fsmonitor_stop()
+        else:
+            pytt.fsmonitor_query(args.token)
+    elif args.command == "sparse-checkout":
+        if args.action == "set":
+            pytt.sparse_checkout_set(args.directories)
+        elif args.action == "list":
+            pytt.sparse_checkout_list()
+        else:
+            pytt.sparse_checkout_disable()
     elif args.command == "write-tree":
         pytt.write_tree()
     elif args.command == "commit-tree":
         pytt.commit_tree(args.tree, args.message, args.parent)
     elif args.command == "update-ref":
         pytt.update_ref(args.ref, args.sha)
+    elif args.command == "rev-parse":
+        pytt.rev_parse(args.name, args.short)
+    elif args.command == "diff-tree":
+        pytt.diff_tree(
+            args.old,
+            args.new,
+            args.recursive,
+            args.find_renames,
+            args.patch,
+            args.diff_algorithm,
+        )
+    elif args.command == "pack-objects":
+        objects = _read_object_list(sys.stdin) if args.stdin else None
+        pytt.pack_objects(objects, **_pack_options(args))
+    elif args.command == "repack":
+        pytt.repack(args.delete, **_pack_options(args))
+    elif args.command == "commit-graph":
+        pytt.write_commit_graph()
+    elif args.command == "merge-base":
+        if args.is_ancestor:
+            sys.exit(0 if pytt.is_ancestor(args.one, args.two) else 1)
+        pytt.merge_base(args.one, args.two, args.all)
+    elif args.command == "rev-list":
+        pytt.rev_list(args.revisions, **_walk_options(args))
+    elif args.command == "log":
+        pytt.log_commits(args.revisions, **_walk_options(args))
     else:
         print("unknown command %s" % args.command)
 
 
-def _parse_args():
+def _parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
     parser = argparse.ArgumentParser(
         description="pytt", formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
 
     subparsers = parser.add_subparsers(dest="command")
 
+    # Only the parser of the command being run is built, the others only when
+    # --help or an unknown command needs them all.
+    command = _command_name(argv)
+    for name, add_parser in COMMAND_PARSERS.items():
+        if command is None or command == name:
+            add_parser(subparsers)
+
+    parser.add_argument(
+        "-l",
+        "--log-level",
+        default=log_names[1],
+        choices=log_names,
+        help="The log level for the client",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="append timed regions and counters to FILE as JSON lines, like %s"
+        % trace.TRACE_ENV,
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="FILE",
+        help="dump cProfile stats to FILE, like %s" % trace.CPROFILE_ENV,
+    )
+
+    return parser.parse_args(argv)
+
+
+def _command_name(argv):
+    """Return the command argv runs, or None if it has none or an unknown one."""
+    takes_value = False
+    for arg in argv:
+        if takes_value:
+            takes_value = False
+        elif arg in VALUE_OPTIONS:
+            takes_value = True
+        elif not arg.startswith("-"):
+            return arg if arg in COMMAND_PARSERS else None
+
+    return None
+
+
+def _add_hash_object_parser(subparsers):
     hash_obj = subparsers.add_parser("hash-object")
-    hash_obj.add_argument("content")
+    hash_obj.add_argument("path", nargs="?", help="the file to hash")
+    hash_obj.add_argument(
+        "--stdin", action="store_true", help="hash the content read from stdin"
+    )
+    hash_obj.add_argument(
+        "--stdin-paths",
+        action="store_true",
+        help="hash the files whose paths are read from stdin, one per line",
+    )
+    hash_obj.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="threads used by --stdin-paths, defaults to the number of cores",
+    )
     hash_obj.add_argument(
         "-w", "--write", action="store_true", help="save the object as well"
     )
 
+
+def _add_cat_file_parser(subparsers):
     cat_file = subparsers.add_parser("cat-file")
     cat_file.add_argument("-p", action="store_true", help="pretty print the object")
-    cat_file.add_argument("object")
+    cat_file.add_argument("object", nargs="?")
+    cat_file.add_argument(
+        "--batch",
+        action="store_true",
+        help="print header and content of every object named on stdin",
+    )
+    cat_file.add_argument(
+        "--batch-check",
+        action="store_true",
+        help="print the header of every object named on stdin",
+    )
+    cat_file.add_argument(
+        "--buffer",
+        action="store_true",
+        help="don't flush the output after each object in batch mode",
+    )
+
+
+def _add_ls_files_parser(subparsers):
+    ls_files = subparsers.add_parser("ls-files")
+    ls_files.add_argument(
+        "--sparse",
+        action="store_true",
+        help="list directories outside the sparse-checkout as one entry instead of their files",
+    )
 
-    subparsers.add_parser("ls-files")
 
+def _add_update_index_parser(subparsers):
     update_index = subparsers.add_parser("update-index")
-    update_index.add_argument("mode")
-    update_index.add_argument("sha")
-    update_index.add_argument("filename")
+    update_index.add_argument("mode", nargs="?")
+    update_index.add_argument("sha", nargs="?")
+    update_index.add_argument("filename", nargs="?")
+    update_index.add_argument(
+        "--index-info",
+        "--stdin",
+        action="store_true",
+        help="read '<mode> <sha>\\t<filename>' records from stdin",
+    )
+    update_index.add_argument(
+        "-z", action="store_true", help="stdin records are NUL terminated"
+    )
+    update_index.add_argument(
+        "--index-version",
+        type=int,
+        choices=[2, 3, 4],
+        help="rewrite the index in this version, 4 prefix-compresses the names",
+    )
+
+
+def _add_status_parser(subparsers):
+    status = subparsers.add_parser("status")
+    status.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="don't write refreshed stat data back to the index",
+    )
+    status.add_argument("-j", "--jobs", type=int, help="threads to lstat and hash files on")
+
+
+def _add_diff_files_parser(subparsers):
+    diff_files = subparsers.add_parser("diff-files")
+    diff_files.add_argument(
+        "--refresh",
+        action="store_true",
+        help="write the stat data of unchanged files back to the index",
+    )
+    diff_files.add_argument("-j", "--jobs", type=int, help="threads to lstat and hash files on")
+
 
+def _add_fsmonitor_parser(subparsers):
+    fsmonitor = subparsers.add_parser("fsmonitor")
+    fsmonitor.add_argument(
+        "action",
+        choices=["run", "start", "stop", "query"],
+        help="run the daemon in the foreground, start it in the background, stop it "
+        "or print the paths changed since a token",
+    )
+    fsmonitor.add_argument("token", nargs="?", default="", help="the token to query from")
+
+
+def _add_sparse_checkout_parser(subparsers):
+    sparse_checkout = subparsers.add_parser("sparse-checkout")
+    sparse_checkout.add_argument(
+        "action",
+        choices=["set", "list", "disable"],
+        help="check out only the files in the directories, list the directories "
+        "or check out every file again",
+    )
+    sparse_checkout.add_argument("directories", nargs="*", help="the directories to set")
+
+
+def _add_write_tree_parser(subparsers):
     subparsers.add_parser("write-tree")
 
+
+def _add_commit_tree_parser(subparsers):
     commit_tree = subparsers.add_parser("commit-tree")
     commit_tree.add_argument("tree", help="tree to commit")
     commit_tree.add_argument("-p", "--parent", help="commit parent")
     commit_tree.add_argument("-m", "--message", help="commit message")
 
+
+def _add_update_ref_parser(subparsers):
     update_ref = subparsers.add_parser("update-ref")
     update_ref.add_argument("ref", help="the ref to update")
     update_ref.add_argument("sha", help="the sha to set the ref to")
 
-    parser.add_argument(
-        "-l",
-        "--log-level",
-        default=log_names[1],
-        choices=log_names,
-        help="The log level for the client",
+
+def _add_rev_parse_parser(subparsers):
+    rev_parse = subparsers.add_parser("rev-parse")
+    rev_parse.add_argument("name", help="the (abbreviated) sha to resolve")
+    rev_parse.add_argument(
+        "--short",
+        nargs="?",
+        const=7,
+        type=int,
+        help="print the shortest unique abbreviation of at least this length",
     )
 
-    return parser.parse_args()
 
+def _add_diff_tree_parser(subparsers):
+    diff_tree = subparsers.add_parser("diff-tree")
+    diff_tree.add_argument("old", help="the tree-ish to compare from, or a commit alone")
+    diff_tree.add_argument("new", nargs="?", help="the tree-ish to compare to")
+    diff_tree.add_argument(
+        "-r", dest="recursive", action="store_true", help="recurse into changed subtrees"
+    )
+    diff_tree.add_argument(
+        "-M",
+        dest="find_renames",
+        action="store_const",
+        const=50,
+        help="detect renames of files which are at least 50%% similar",
+    )
+    diff_tree.add_argument(
+        "--find-renames",
+        type=lambda score: int(score.rstrip("%")),
+        help="detect renames of files at least this similar in percent",
+    )
+    diff_tree.add_argument(
+        "-p", "--patch", action="store_true", help="print the changes as unified diffs"
+    )
+    diff_tree.add_argument(
+        "--diff-algorithm",
+        default="myers",
+        choices=["myers", "histogram"],
+        help="the line diff of --patch",
+    )
 
-def _set_up_logging(args):
-    handler = colorlog.StreamHandler()
-    formatter = colorlog.ColoredFormatter(
-        fmt=(
-            "%(log_color)s[%(asctime)s %(levelname)8s] --"
-            " %(message)s (%(filename)s:%(lineno)s)"
-        ),
-        datefmt="%Y-%m-%d %H:%M:%S",
+
+def _add_pack_objects_parser(subparsers):
+    pack_objects = subparsers.add_parser("pack-objects")
+    pack_objects.add_argument(
+        "--stdin",
+        action="store_true",
+        help="read '<sha> [<name>]' lines from stdin instead of packing all loose objects",
+    )
+    _add_pack_options(pack_objects)
+
+
+def _add_repack_parser(subparsers):
+    repack = subparsers.add_parser("repack")
+    repack.add_argument(
+        "-d", "--delete", action="store_true", help="remove the packed loose objects"
+    )
+    _add_pack_options(repack)
+
+
+def _add_commit_graph_parser(subparsers):
+    commit_graph = subparsers.add_parser("commit-graph")
+    commit_graph.add_argument(
+        "action", choices=["write"], help="write the graph of all reachable commits"
+    )
+
+
+def _add_merge_base_parser(subparsers):
+    merge_base = subparsers.add_parser("merge-base")
+    merge_base.add_argument("one", help="the first commit")
+    merge_base.add_argument("two", help="the second commit")
+    merge_base.add_argument(
+        "--all", action="store_true", help="print all best common ancestors"
     )
-    handler.setFormatter(formatter)
+    merge_base.add_argument(
+        "--is-ancestor",
+        action="store_true",
+        help="exit with 0 if the first commit is an ancestor of the second, else 1",
+    )
+
+
+def _add_rev_list_parser(subparsers):
+    rev_list = subparsers.add_parser("rev-list")
+    rev_list.add_argument(
+        "revisions", nargs="+", help="commits to list from, ^A or A..B to leave out A's history"
+    )
+    _add_walk_options(rev_list)
+
+
+def _add_log_parser(subparsers):
+    log_command = subparsers.add_parser("log")
+    log_command.add_argument(
+        "revisions", nargs="*", help="commits to list from, defaults to HEAD"
+    )
+    _add_walk_options(log_command)
+
 
-    log.addHandler(handler)
+# The parser of every command, in the order --help lists them.
+COMMAND_PARSERS = {
+    "hash-object": _add_hash_object_parser,
+    "cat-file": _add_cat_file_parser,
+    "ls-files": _add_ls_files_parser,
+    "update-index": _add_update_index_parser,
+    "status": _add_status_parser,
+    "diff-files": _add_diff_files_parser,
+    "fsmonitor": _add_fsmonitor_parser,
+    "sparse-checkout": _add_sparse_checkout_parser,
+    "write-tree": _add_write_tree_parser,
+    "commit-tree": _add_commit_tree_parser,
+    "update-ref": _add_update_ref_parser,
+    "rev-parse": _add_rev_parse_parser,
+    "diff-tree": _add_diff_tree_parser,
+    "pack-objects": _add_pack_objects_parser,
+    "repack": _add_repack_parser,
+    "commit-graph": _add_commit_graph_parser,
+    "merge-base": _add_merge_base_parser,
+    "rev-list": _add_rev_list_parser,
+    "log": _add_log_parser,
+}
+
+
+def _add_pack_options(parser):
+    parser.add_argument(
+        "--window", type=int, default=10, help="objects to try as delta base"
+    )
+    parser.add_argument("--depth", type=int, default=50, help="max delta chain length")
+    parser.add_argument(
+        "-j", "--processes", type=int, default=1, help="processes for the delta search"
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="compare the written pack with `git verify-pack -v`",
+    )
+
+
+def _add_walk_options(parser):
+    parser.add_argument(
+        "-n", "--max-count", type=int, help="stop after listing this many commits"
+    )
+    parser.add_argument(
+        "--first-parent", action="store_true", help="only follow the first parent of merges"
+    )
+    parser.add_argument(
+        "--order",
+        default="date",
+        choices=["date", "generation"],
+        help="list newest first by commit date or by commit-graph generation",
+    )
+
+
+def _walk_options(args):
+    return {
+        "max_count": args.max_count,
+        "first_parent": args.first_parent,
+        "order": args.order,
+    }
+
+
+def _pack_options(args):
+    return {
+        "window": args.window,
+        "depth": args.depth,
+        "processes": args.processes,
+        "verify": args.verify,
+    }
+
+
+def _read_object_list(lines):
+    objects = []
+    for line in lines:
+        sha, _, name = line.rstrip("\n").partition(" ")
+        if sha:
+            objects.append((sha, name))
+    return objects
+
+
+def _read_records(stream, terminator, chunk_size=64 * 1024):
+    """Yield the records of the binary stream split on terminator, reading it
+    in chunks instead of all at once."""
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        records = (pending + chunk).split(terminator)
+        pending = records.pop()
+        yield from records
+
+    if pending:
+        yield pending
+
+
+def _read_index_info(stream, terminator):
+    """Yield (mode, sha, filename) for every '<mode> <sha>\t<filename>' record.
+
+    A space instead of the tab works as well as long as the filename doesn't
+    start with whitespace.
+    """
+    for record in _read_records(stream, terminator):
+        if not record.strip():
+            continue
+
+        meta, tab, filename = record.decode().partition("\t")
+        if tab:
+            mode, sha = meta.split()
+        else:
+            mode, sha, filename = meta.split(None, 2)
+        yield mode, sha, filename
+
+
+def _set_up_logging(args):
+    log.addHandler(_ColorHandler())
     log.setLevel(log_levels[args.log_level])
+
+
+class _ColorHandler(logging.Handler):
+    """Writes the records in color to stderr. colorlog takes longer to import
+    than most commands take to run and most of them never log anything at
+    the default level, so it is only imported for the first record."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._handler = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._handler is None:
+            import colorlog
+
+            self._handler = colorlog.StreamHandler()
+            self._handler.setFormatter(
+                colorlog.ColoredFormatter(
+                    fmt=(
+                        "%(log_color)s[%(asctime)s %(levelname)8s] --"
+                        " %(message)s (%(filename)s:%(lineno)s)"
+                    ),
+                    datefmt="%Y-%m-%d %H:%M:%S",
+                )
+            )
+        self._handler.emit(record)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import hashlib
+import heapq
+import logging
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from .pack import _map_file, _write_file
+
+log = logging.getLogger("pytt")
+
+# Parent positions in the commit data chunk, see CommitGraph.
+NO_PARENT = 0x70000000
+EXTRA_EDGES = 0x80000000
+EDGE_POSITION_MASK = 0x7FFFFFFF
+
+GENERATION_MAX = 0x3FFFFFFF
+
+# Flags used when painting down from two commits to their merge bases.
+_PARENT1 = 1
+_PARENT2 = 2
+_STALE = 4
+
+
+# For reference of how the file is structured, see:
+# https://github.com/git/git/blob/master/Documentation/technical/commit-graph-format.txt
+class CommitGraph:
+    """The commit-graph file stores the parents, root tree, commit time and
+    generation number of every commit, so history can be walked without
+    inflating and parsing any commit objects.
+
+    Only version 1 with SHA-1 and a single graph file is supported. The file
+    is mmap'd, a commit is referred to by its position in the sorted list of
+    shas and looking one up touches the fanout table and log2(n) shas.
+
+    The structure is:
+    {signature} {version} {hash version} {chunk count} {base graph count}
+    [chunk id, chunk offset] {OIDF: 256 fanout counts} {OIDL: sorted shas}
+    {CDAT: [tree, parent, parent, generation and commit time]}
+    {EDGE: the parents of octopus merges beyond the first} {checksum}
+
+    The generation number of a commit is one more than the largest generation
+    of its parents, so a commit can only reach commits of lower generation.
+    This is what lets is_ancestor and merge_base stop walking early.
+    """
+
+    SIGNATURE = b"CGPH"
+    HEADER = struct.Struct(">4sBBBB")
+    CHUNK = struct.Struct(">4sQ")
+    FANOUT = struct.Struct(">256I")
+    DATA = struct.Struct(">20sIIII")
+    PARENTS = struct.Struct(">II")
+    RECORD = struct.Struct(">IIII")
+    EDGE = struct.Struct(">I")
+
+    OIDF = b"OIDF"
+    OIDL = b"OIDL"
+    CDAT = b"CDAT"
+    EDGE_CHUNK = b"EDGE"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._map = _map_file(path)
+
+        signature, version, hash_version, chunk_count, _ = self.HEADER.unpack_from(self._map)
+        if signature != self.SIGNATURE or version != 1 or hash_version != 1:
+            raise ValueError("unsupported commit-graph %s" % path)
+
+        chunks = {}
+        for i in range(chunk_count):
+            chunk_id, offset = self.CHUNK.unpack_from(
+                self._map, self.HEADER.size + self.CHUNK.size * i
+            )
+            chunks[chunk_id] = offset
+
+        for required in (self.OIDF, self.OIDL, self.CDAT):
+            if required not in chunks:
+                raise ValueError("commit-graph %s lacks the %s chunk" % (path, required))
+
+        self.fanout = self.FANOUT.unpack_from(self._map, chunks[self.OIDF])
+        self.count = self.fanout[-1]
+        self._sha_offset = chunks[self.OIDL]
+        self._data_offset = chunks[self.CDAT]
+        self._edge_offset = chunks.get(self.EDGE_CHUNK)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def sha(self, position: int) -> bytes:
+        """Return the binary sha of the commit at the given position."""
+        start = self._sha_offset + 20 * position
+        return self._map[start : start + 20]
+
+    def position(self, sha: bytes) -> Optional[int]:
+        """Return the position of the binary sha or None if it isn't in the graph."""
+        first = sha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sha(mid) < sha:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < self.count and self.sha(lo) == sha:
+            return lo
+
+        return None
+
+    def tree(self, position: int) -> bytes:
+        """Return the binary sha of the root tree of the commit."""
+        start = self._data_offset + self.DATA.size * position
+        return self._map[start : start + 20]
+
+    def parents(self, position: int) -> List[int]:
+        """Return the positions of the parents of the commit."""
+        first, second = self.PARENTS.unpack_from(
+            self._map, self._data_offset + self.DATA.size * position + 20
+        )
+        if first == NO_PARENT:
+            return []
+        if second == NO_PARENT:
+            return [first]
+        if not second & EXTRA_EDGES:
+            return [first, second]
+
+        parents = [first]
+        edge = self._edge_offset + 4 * (second & EDGE_POSITION_MASK)
+        while True:
+            parent = self.EDGE.unpack_from(self._map, edge)[0]
+            parents.append(parent & EDGE_POSITION_MASK)
+            if parent & EXTRA_EDGES:
+                return parents
+            edge += 4
+
+    def generation(self, position: int) -> int:
+        high = self.EDGE.unpack_from(
+            self._map, self._data_offset + self.DATA.size * position + 28
+        )[0]
+        return high >> 2
+
+    def commit_time(self, position: int) -> int:
+        high, low = self.PARENTS.unpack_from(
+            self._map, self._data_offset + self.DATA.size * position + 28
+        )
+        return (high & 3) << 32 | low
+
+    def is_ancestor(self, ancestor: int, descendant: int) -> bool:
+        """Return True if the commit at position ancestor can be reached from
+        the commit at position descendant, or is the same commit.
+
+        Commits with a lower generation than the ancestor can't reach it, so
+        the walk never goes below it in the history.
+        """
+        minimum = self.generation(ancestor)
+        unpack_from = self.RECORD.unpack_from
+        records = self._data_offset + 20
+        seen = {descendant}
+        pending = [descendant]
+        while pending:
+            position = pending.pop()
+            # follow first parents without going through the stack, most
+            # history is long chains of them
+            while position != ancestor:
+                first, second, high, _ = unpack_from(
+                    self._map, records + self.DATA.size * position
+                )
+                if high >> 2 < minimum or first == NO_PARENT:
+                    break
+
+                if second != NO_PARENT:
+                    for parent in self.parents(position)[1:]:
+                        if parent not in seen:
+                            seen.add(parent)
+                            pending.append(parent)
+
+                if first in seen:
+                    break
+                seen.add(first)
+                position = first
+            else:
+                return True
+
+        return False
+
+    def merge_base(self, one: int, two: int) -> List[int]:
+        """Return the positions of the best common ancestors of the commits,
+        i.e. the common ancestors which aren't ancestors of another one, newest
+        commit time first like git merge-base lists them.
+
+        Both commits paint their ancestors, highest generation first, until
+        every commit left to visit is below a commit painted by both.
+        """
+        if one == two:
+            return [one]
+
+        flags = {one: _PARENT1, two: _PARENT2}
+        pending: List[Tuple[int, int, int]] = []
+        for position in (one, two):
+            heapq.heappush(pending, (-self.generation(position), position, flags[position]))
+        not_stale = 2
+
+        bases = []
+        while not_stale:
+            _, position, pushed = heapq.heappop(pending)
+            if not pushed & _STALE:
+                not_stale -= 1
+
+            flag = flags[position]
+            if flag & (_PARENT1 | _PARENT2) == _PARENT1 | _PARENT2:
+                if not flag & _STALE:
+                    bases.append(position)
+                    flag |= _STALE
+                    flags[position] = flag
+
+            for parent in self.parents(position):
+                parent_flag = flags.get(parent, 0)
+                if parent_flag & flag == flag:
+                    continue
+
+                parent_flag |= flag
+                flags[parent] = parent_flag
+                heapq.heappush(pending, (-self.generation(parent), parent, parent_flag))
+                if not parent_flag & _STALE:
+                    not_stale += 1
+
+        if len(bases) < 2:
+            return bases
+
+        bases = [
+            base
+            for base in bases
+            if not any(
+                other != base and self.is_ancestor(base, other) for other in bases
+            )
+        ]
+        return sorted(bases, key=lambda base: -self.commit_time(base))
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class CommitGraphWriter:
+    """Collects commits and writes them as a commit-graph file.
+
+    Every parent of an added commit has to be added as well, i.e. the commits
+    have to be closed under reachability.
+
+    Examples
+    --------
+    >>> writer = CommitGraphWriter()
+    >>> writer.add(sha, tree, [parent], commit_time)
+    >>> writer.write(".git/objects/info/commit-graph")
+    """
+
+    def __init__(self) -> None:
+        self.commits: Dict[bytes, Tuple[bytes, List[bytes], int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.commits)
+
+    def add(self, sha: bytes, tree: bytes, parents: List[bytes], commit_time: int) -> None:
+        self.commits[sha] = (tree, parents, commit_time)
+
+    def write(self, path: str) -> bytes:
+        """Write the commit-graph file to path, return its checksum."""
+        shas = sorted(self.commits)
+        positions = {sha: position for position, sha in enumerate(shas)}
+
+        parents = []
+        for sha in shas:
+            try:
+                parents.append([positions[parent] for parent in self.commits[sha][1]])
+            except KeyError as e:
+                raise ValueError(
+                    "parent %s of commit %s isn't in the graph" % (e.args[0].hex(), sha.hex())
+                ) from None
+
+        generations = _generations(parents)
+
+        fanout = [0] * 256
+        for sha in shas:
+            fanout[sha[0]] += 1
+        for first in range(1, 256):
+            fanout[first] += fanout[first - 1]
+
+        data = bytearray()
+        edges = bytearray()
+        for position, sha in enumerate(shas):
+            tree, _, commit_time = self.commits[sha]
+            commit_parents = parents[position]
+            first = commit_parents[0] if commit_parents else NO_PARENT
+            if len(commit_parents) <= 2:
+                second = commit_parents[1] if len(commit_parents) == 2 else NO_PARENT
+            else:
+                second = EXTRA_EDGES | len(edges) // 4
+                for parent in commit_parents[1:-1]:
+                    edges += CommitGraph.EDGE.pack(parent)
+                edges += CommitGraph.EDGE.pack(EXTRA_EDGES | commit_parents[-1])
+
+            data += CommitGraph.DATA.pack(
+                tree,
+                first,
+                second,
+                generations[position] << 2 | (commit_time >> 32) & 3,
+                commit_time & 0xFFFFFFFF,
+            )
+
+        chunks = [
+            (CommitGraph.OIDF, CommitGraph.FANOUT.pack(*fanout)),
+            (CommitGraph.OIDL, b"".join(shas)),
+            (CommitGraph.CDAT, bytes(data)),
+        ]
+        if edges:
+            chunks.append((CommitGraph.EDGE_CHUNK, bytes(edges)))
+
+        graph = bytearray(CommitGraph.HEADER.pack(CommitGraph.SIGNATURE, 1, 1, len(chunks), 0))
+        offset = CommitGraph.HEADER.size + CommitGraph.CHUNK.size * (len(chunks) + 1)
+        for chunk_id, chunk in chunks:
+            graph += CommitGraph.CHUNK.pack(chunk_id, offset)
+            offset += len(chunk)
+        graph += CommitGraph.CHUNK.pack(b"\0\0\0\0", offset)
+        for _, chunk in chunks:
+            graph += chunk
+
+        checksum = hashlib.sha1(graph).digest()
+        graph += checksum
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_file(path, bytes(graph))
+        return checksum
+
+
+def _generations(parents: List[List[int]]) -> List[int]:
+    """Return the generation number of every commit given the positions of
+    their parents, walking depth first without recursing as histories can be
+    far deeper than the recursion limit."""
+    generations = [0] * len(parents)
+    for start in range(len(parents)):
+        pending = [start]
+        while pending:
+            position = pending[-1]
+            if generations[position]:
+                pending.pop()
+                continue
+
+            missing = [parent for parent in parents[position] if not generations[parent]]
+            if missing:
+                pending.extend(missing)
+                continue
+
+            pending.pop()
+            generations[position] = min(
+                1 + max((generations[parent] for parent in parents[position]), default=0),
+                GENERATION_MAX,
+            )
+
+    return generations
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+log = logging.getLogger("pytt")
+
+# Size of the blocks of the base that are indexed when searching for copies.
+DELTA_BLOCK = 16
+# Largest copy and insert a single delta instruction can describe.
+MAX_COPY = 0x10000
+MAX_INSERT = 0x7F
+
+
+# For reference of how deltas are structured, see the "Deltified
+# representation" section of:
+# https://github.com/git/git/blob/master/Documentation/technical/pack-format.txt
+def _read_size(delta: bytes, offset: int) -> Tuple[int, int]:
+    """Read a little-endian base 128 size, return it and the offset after it."""
+    size = 0
+    shift = 0
+    while True:
+        c = delta[offset]
+        offset += 1
+        size |= (c & 0x7F) << shift
+        shift += 7
+        if not c & 0x80:
+            return size, offset
+
+
+def _write_size(out: bytearray, size: int) -> None:
+    """Append size as a little-endian base 128 number."""
+    while size >= 0x80:
+        out.append(0x80 | (size & 0x7F))
+        size >>= 7
+    out.append(size)
+
+
+def delta_result_size(delta: bytes) -> int:
+    """Return the size of the object the delta rebuilds, only the first ~20
+    bytes of the delta are needed."""
+    _, offset = _read_size(delta, 0)
+    return _read_size(delta, offset)[0]
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Rebuild an object from its base and a delta.
+
+    The delta is {base size} {result size} followed by instructions which
+    either copy a range of the base or insert literal bytes from the delta:
+
+    1xxxxxxx [offset bytes] [size bytes] -- copy, the low 4 bits tell which of
+    the 4 offset bytes follow and the next 3 bits which of the 3 size bytes.
+    0xxxxxxx {data} -- insert the following x bytes.
+    """
+    base_size, offset = _read_size(delta, 0)
+    if base_size != len(base):
+        raise ValueError("delta base size %d, expected %d" % (base_size, len(base)))
+
+    result_size, offset = _read_size(delta, offset)
+    result = bytearray()
+    end = len(delta)
+    while offset < end:
+        cmd = delta[offset]
+        offset += 1
+        if cmd & 0x80:
+            copy_offset = 0
+            for i in range(4):
+                if cmd & (1 << i):
+                    copy_offset |= delta[offset] << (8 * i)
+                    offset += 1
+
+            copy_size = 0
+            for i in range(3):
+                if cmd & (0x10 << i):
+                    copy_size |= delta[offset] << (8 * i)
+                    offset += 1
+
+            if copy_size == 0:
+                copy_size = 0x10000
+
+            result += base[copy_offset : copy_offset + copy_size]
+        elif cmd:
+            result += delta[offset : offset + cmd]
+            offset += cmd
+        else:
+            raise ValueError("unexpected delta opcode 0")
+
+    if len(result) != result_size:
+        raise ValueError("delta result size %d, expected %d" % (len(result), result_size))
+
+    return bytes(result)
+
+
+class DeltaIndex:
+    """An index of the blocks of a base object, used to create deltas from it.
+
+    Building the index is the expensive part of delta creation so it is built
+    once per base and reused for every target the base is tried against.
+    """
+
+    def __init__(self, base: bytes) -> None:
+        self.base = base
+        self.blocks = {}
+        for offset in range(0, len(base) - DELTA_BLOCK + 1, DELTA_BLOCK):
+            self.blocks.setdefault(base[offset : offset + DELTA_BLOCK], offset)
+
+    def create_delta(self, target: bytes, max_size: int = None) -> Optional[bytes]:
+        """Return a delta which turns the base into the target.
+
+        Returns None if no delta smaller than max_size could be created.
+        """
+        base = self.base
+        base_end = len(base)
+        target_end = len(target)
+
+        out = bytearray()
+        _write_size(out, base_end)
+        _write_size(out, target_end)
+
+        insert_start = 0
+        position = 0
+        while position + DELTA_BLOCK <= target_end:
+            base_offset = self.blocks.get(target[position : position + DELTA_BLOCK])
+            if base_offset is None:
+                position += 1
+                continue
+
+            start = position
+            base_start = base_offset
+            while (
+                start > insert_start
+                and base_start > 0
+                and target[start - 1] == base[base_start - 1]
+            ):
+                start -= 1
+                base_start -= 1
+
+            end = position + DELTA_BLOCK
+            base_offset += DELTA_BLOCK
+            while (
+                end + DELTA_BLOCK <= target_end
+                and target[end : end + DELTA_BLOCK] == base[base_offset : base_offset + DELTA_BLOCK]
+            ):
+                end += DELTA_BLOCK
+                base_offset += DELTA_BLOCK
+            while end < target_end and base_offset < base_end and target[end] == base[base_offset]:
+                end += 1
+                base_offset += 1
+
+            _write_insert(out, target, insert_start, start)
+            _write_copy(out, base_start, end - start)
+            insert_start = position = end
+
+            if max_size is not None and len(out) >= max_size:
+                return None
+
+        _write_insert(out, target, insert_start, target_end)
+        if max_size is not None and len(out) >= max_size:
+            return None
+
+        return bytes(out)
+
+
+def create_delta(base: bytes, target: bytes) -> bytes:
+    """Return a delta which turns base into target, see apply_delta."""
+    return DeltaIndex(base).create_delta(target)
+
+
+def _write_insert(out: bytearray, data: bytes, start: int, end: int) -> None:
+    for offset in range(start, end, MAX_INSERT):
+        chunk = data[offset : min(offset + MAX_INSERT, end)]
+        out.append(len(chunk))
+        out += chunk
+
+
+def _write_copy(out: bytearray, offset: int, size: int) -> None:
+    while size:
+        chunk = min(size, MAX_COPY)
+        cmd = 0x80
+        args = bytearray()
+        for i in range(4):
+            byte = (offset >> (8 * i)) & 0xFF
+            if byte:
+                cmd |= 1 << i
+                args.append(byte)
+
+        # a size of 0x10000 is encoded by leaving out all size bytes
+        for i in range(3):
+            byte = (chunk >> (8 * i)) & 0xFF if chunk != MAX_COPY else 0
+            if byte:
+                cmd |= 0x10 << i
+                args.append(byte)
+
+        out.append(cmd)
+        out += args
+        offset += chunk
+        size -= chunk
+
+
+class LRUCache:
+    """A least recently used cache whose values each have a size, e.g. the
+    size of their raw content.
+
+    The least recently used values are evicted once their total size exceeds
+    max_bytes, a value larger than that is never cached.
+
+    Packs keep the objects inflated from their delta chains in one, keyed by
+    offset: rebuilding a deltified object needs every object below it in the
+    chain, so without caching reading all objects of a chain is quadratic in
+    its depth. An ObjectDatabase keeps its decoded trees and commits in one,
+    keyed by sha.
+
+    It can be used from several threads, each call holds the cache's lock
+    only as long as it takes to update it.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[Hashable, Tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        with self._lock:
+            if size > self.max_bytes or key in self._entries:
+                return
+
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
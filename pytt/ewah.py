@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import struct
+from typing import Iterable, List, Tuple
+
+# An EWAH bitmap is a run-length encoded array of 64 bit words. Every run
+# starts with a marker word: the bit the run is filled with in bit 0, the
+# number of filled words in the next 32 bits and the number of literal words
+# which follow the marker in the top 31 bits.
+RUNNING_BIT = 0x1
+RUNNING_LENGTH_SHIFT = 1
+RUNNING_LENGTH_MAX = 0xFFFFFFFF
+LITERAL_WORDS_SHIFT = 33
+LITERAL_WORDS_MAX = 0x7FFFFFFF
+WORD_BITS = 64
+WORD_FILLED = 0xFFFFFFFFFFFFFFFF
+
+HEADER = struct.Struct(">II")
+RLW_POSITION = struct.Struct(">I")
+
+
+# For reference of how the bitmaps are stored, see:
+# https://github.com/git/git/blob/master/ewah/ewah_io.c
+def pack(positions: Iterable[int], bit_size: int) -> bytes:
+    """Encode the set bits at the positions as a bitmap of bit_size bits."""
+    words = [0] * ((bit_size + WORD_BITS - 1) // WORD_BITS)
+    for position in positions:
+        words[position // WORD_BITS] |= 1 << (position % WORD_BITS)
+
+    buffer: List[int] = []
+    marker = 0
+    i = 0
+    while i < len(words) or not buffer:
+        run = 0
+        while i < len(words) and words[i] == 0 and run < RUNNING_LENGTH_MAX:
+            run += 1
+            i += 1
+
+        start = i
+        while i < len(words) and words[i] != 0 and i - start < LITERAL_WORDS_MAX:
+            i += 1
+
+        marker = len(buffer)
+        buffer.append((run << RUNNING_LENGTH_SHIFT) | ((i - start) << LITERAL_WORDS_SHIFT))
+        buffer.extend(words[start:i])
+
+    return b"".join(
+        (
+            HEADER.pack(bit_size, len(buffer)),
+            struct.pack(">%dQ" % len(buffer), *buffer),
+            RLW_POSITION.pack(marker),
+        )
+    )
+
+
+def unpack_from(content: bytes, offset: int = 0) -> Tuple[List[int], int, int]:
+    """Decode the bitmap at the offset, return the positions of its set bits,
+    its size in bits and the offset after it."""
+    bit_size, word_count = HEADER.unpack_from(content, offset)
+    offset += HEADER.size
+    buffer = struct.unpack_from(">%dQ" % word_count, content, offset)
+    offset += 8 * word_count + RLW_POSITION.size
+
+    positions = []
+    word = 0
+    i = 0
+    while i < word_count:
+        marker = buffer[i]
+        run = (marker >> RUNNING_LENGTH_SHIFT) & RUNNING_LENGTH_MAX
+        if marker & RUNNING_BIT:
+            positions.extend(range(word * WORD_BITS, (word + run) * WORD_BITS))
+        word += run
+
+        literals = marker >> LITERAL_WORDS_SHIFT
+        for value in buffer[i + 1 : i + 1 + literals]:
+            while value:
+                low = value & -value
+                positions.append(word * WORD_BITS + low.bit_length() - 1)
+                value ^= low
+            word += 1
+        i += 1 + literals
+
+    return [position for position in positions if position < bit_size], bit_size, offset
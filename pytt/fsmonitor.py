@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import errno
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+log = logging.getLogger("pytt")
+
+# The name of the daemon's socket in the git directory.
+SOCKET_NAME = "pytt-fsmonitor.sock"
+
+# The log of a daemon started in the background, in the git directory.
+LOG_NAME = "pytt-fsmonitor.log"
+
+# Seconds a client waits for the daemon before it scans everything itself.
+QUERY_TIMEOUT = 5
+
+# Paths the journal holds before it forgets them all, older tokens then get
+# a full scan as answer.
+JOURNAL_LIMIT = 1000 * 1000
+
+# The answer to a query whose changes aren't known: everything may have
+# changed. It is what git's fsmonitor hooks answer as well.
+EVERYTHING = b"/"
+
+# inotify event masks, see inotify(7).
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+# The fixed size part of an event: watch descriptor, mask, cookie and the
+# length of the name which follows it.
+EVENT = struct.Struct("iIII")
+EVENT_BUFFER_SIZE = 256 * 1024
+
+
+class Journal:
+    """Remembers which paths changed, numbered in the order they changed.
+
+    A token names a point in the journal, the paths which changed since a
+    token are the ones with a higher number. Tokens of another daemon, or
+    older than what the journal still remembers, can't be answered and the
+    client has to look at everything.
+
+    Examples
+    --------
+    >>> journal = Journal()
+    >>> token = journal.token
+    >>> journal.add(b"dir/file")
+    >>> journal.since(token)
+    [b'dir/file']
+    """
+
+    def __init__(self, limit: int = JOURNAL_LIMIT) -> None:
+        self.limit = limit
+        self.instance = "%x-%x" % (os.getpid(), time.time_ns())
+        self.sequence = 0
+        self._changes: Dict[bytes, int] = {}
+        # tokens before this were forgotten
+        self._oldest = 0
+
+    @property
+    def token(self) -> str:
+        return "pytt:%s:%d" % (self.instance, self.sequence)
+
+    def add(self, path: bytes) -> None:
+        self.sequence += 1
+        self._changes[path] = self.sequence
+        if len(self._changes) > self.limit:
+            self.forget()
+
+    def forget(self) -> None:
+        """Forget every change, e.g. after events were lost."""
+        self.sequence += 1
+        self._changes.clear()
+        self._oldest = self.sequence
+
+    def since(self, token: str) -> Optional[List[bytes]]:
+        """Return the paths which changed since the token, None if unknown."""
+        instance, _, sequence = token.rpartition(":")
+        if instance != "pytt:%s" % self.instance or not sequence.isdigit():
+            return None
+
+        sequence = int(sequence)
+        if sequence < self._oldest or sequence > self.sequence:
+            return None
+
+        return [path for path, changed in self._changes.items() if changed > sequence]
+
+
+class Inotify:
+    """A minimal binding of the Linux inotify API through ctypes.
+
+    ctypes, like selectors in Daemon.run, is only imported by the daemon,
+    status only talks to it over the socket.
+    """
+
+    def __init__(self) -> None:
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._check(self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+    def add_watch(self, path: bytes, mask: int) -> int:
+        return self._check(self._libc.inotify_add_watch(self.fd, path, mask))
+
+    def rm_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> Iterator[Tuple[int, int, bytes]]:
+        """Yield (wd, mask, name) of every queued event, without blocking."""
+        while True:
+            try:
+                buffer = os.read(self.fd, EVENT_BUFFER_SIZE)
+            except BlockingIOError:
+                return
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = EVENT.unpack_from(buffer, offset)
+                offset += EVENT.size
+                name = buffer[offset : offset + length].rstrip(b"\0")
+                offset += length
+                yield wd, mask, name
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    @staticmethod
+    def _check(result: int) -> int:
+        if result < 0:
+            import ctypes
+
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        return result
+
+
+class Daemon:
+    """Watches a working tree with inotify and answers which paths changed
+    since a token over a Unix socket.
+
+    Every directory gets a watch, except the git directory. A directory
+    which is created or moved into the tree is watched as soon as its event
+    is read, and everything in it is recorded as changed as it may have been
+    written before the watch existed. When the kernel's event queue
+    overflows the journal is forgotten, so every client does a full scan.
+
+    The protocol is a single request per connection:
+    query {token}\\n -- answered with {new token}\\0{path}\\0{path}..., or with
+    {new token}\\0/ when the changes since the token aren't known.
+    stop\\n -- stops the daemon.
+
+    The events are drained before a query is answered. inotify queues them
+    while the file system call is made, so every change which was done
+    before the query was sent is in the answer.
+
+    Examples
+    --------
+    >>> Daemon("/path/to/repo", "/path/to/repo/.git/pytt-fsmonitor.sock").run()
+    """
+
+    def __init__(self, root: str, socket_path: str, journal_limit: int = JOURNAL_LIMIT) -> None:
+        self.root = os.fsencode(os.path.abspath(root))
+        self.socket_path = socket_path
+        self.journal = Journal(journal_limit)
+        self._inotify = Inotify()
+        self._watches: Dict[int, bytes] = {}
+        self._running = False
+
+    def run(self) -> None:
+        """Watch the tree and serve queries until asked to stop."""
+        server = self._listen()
+        start = time.perf_counter()
+        self._watch_tree(b"")
+        log.info(
+            "watching %d directories of %s in %.2fs"
+            % (len(self._watches), os.fsdecode(self.root), time.perf_counter() - start)
+        )
+
+        import selectors
+
+        selector = selectors.DefaultSelector()
+        selector.register(self._inotify.fd, selectors.EVENT_READ)
+        selector.register(server, selectors.EVENT_READ)
+        self._running = True
+        try:
+            while self._running:
+                for key, _ in selector.select():
+                    if key.fileobj is server:
+                        connection, _ = server.accept()
+                        with connection:
+                            self._serve(connection)
+                    else:
+                        self._read_events()
+        finally:
+            selector.close()
+            server.close()
+            os.unlink(self.socket_path)
+            self._inotify.close()
+
+    def _listen(self) -> socket.socket:
+        if os.path.exists(self.socket_path):
+            if query(self.socket_path, "") is not None:
+                raise RuntimeError("a daemon is already listening on %s" % self.socket_path)
+            os.unlink(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(16)
+        return server
+
+    def _serve(self, connection: socket.socket) -> None:
+        connection.settimeout(QUERY_TIMEOUT)
+        request = _receive(connection, until=b"\n").rstrip(b"\n")
+        command, _, argument = request.partition(b" ")
+        if command == b"stop":
+            self._running = False
+            return
+        if command != b"query":
+            log.warning("unknown request %s" % request)
+            return
+
+        self._read_events()
+        paths = self.journal.since(argument.decode())
+        response = [self.journal.token.encode()]
+        response.extend([EVERYTHING] if paths is None else paths)
+        connection.sendall(b"\0".join(response))
+
+    def _read_events(self) -> None:
+        for wd, mask, name in self._inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                log.warning("the inotify queue overflowed, clients will do a full scan")
+                self.journal.forget()
+                # directories created in the meantime aren't watched yet
+                self._watch_tree(b"")
+                continue
+
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+            if not name or (not directory and name == b".git"):
+                # events about the directory itself are reported by its parent
+                continue
+
+            path = directory + b"/" + name if directory else name
+            self.journal.add(path)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for created in self._watch_tree(path):
+                        self.journal.add(created)
+                elif mask & IN_MOVED_FROM:
+                    self._unwatch_tree(path)
+
+    def _watch_tree(self, path: bytes) -> List[bytes]:
+        """Watch the directory and every directory under it, return the paths
+        of everything in them."""
+        found = []
+        pending = [path]
+        while pending:
+            directory = pending.pop()
+            absolute = self.root + b"/" + directory if directory else self.root
+            try:
+                wd = self._inotify.add_watch(absolute, WATCH_MASK)
+                entries = list(os.scandir(absolute))
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise RuntimeError(
+                        "out of inotify watches, raise fs.inotify.max_user_watches"
+                    ) from e
+                # removed before it could be watched, its parent has an event
+                continue
+
+            self._watches[wd] = directory
+            for entry in entries:
+                name = directory + b"/" + entry.name if directory else entry.name
+                if not directory and entry.name == b".git":
+                    continue
+                found.append(name)
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(name)
+
+        return found
+
+    def _unwatch_tree(self, path: bytes) -> None:
+        """Remove the watches of a directory which was moved away, and of the
+        directories under it."""
+        prefix = path + b"/"
+        for wd, directory in list(self._watches.items()):
+            if directory == path or directory.startswith(prefix):
+                del self._watches[wd]
+                self._inotify.rm_watch(wd)
+
+
+def query(socket_path: str, token: str) -> Optional[Tuple[str, Optional[List[bytes]]]]:
+    """Ask the daemon which paths changed since the token.
+
+    Return the new token and the changed paths, or None instead of the paths
+    when everything has to be looked at. Return None when no daemon is
+    running.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(QUERY_TIMEOUT)
+            connection.connect(socket_path)
+            connection.sendall(b"query %s\n" % token.encode())
+            response = _receive(connection)
+    except OSError as e:
+        # the daemon isn't running, or is stuck
+        log.debug("no answer from the fsmonitor daemon: %s" % e)
+        return None
+
+    new_token, _, paths = response.partition(b"\0")
+    if paths == EVERYTHING:
+        return new_token.decode(), None
+    return new_token.decode(), paths.split(b"\0") if paths else []
+
+
+def stop(socket_path: str) -> bool:
+    """Ask the daemon to stop, return whether one was running."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(QUERY_TIMEOUT)
+            connection.connect(socket_path)
+            connection.sendall(b"stop\n")
+            _receive(connection)
+    except OSError:
+        return False
+
+    return True
+
+
+def _receive(connection: socket.socket, until: bytes = None) -> bytes:
+    """Read until the connection is closed, or until the terminator."""
+    chunks = []
+    while True:
+        chunk = connection.recv(64 * 1024)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if until is not None and chunk.endswith(until):
+            break
+
+    return b"".join(chunks)
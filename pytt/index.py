@@ -1,17 +1,53 @@
 #!/usr/bin/env python
 from __future__ import annotations
 
+import hashlib
 import logging
-import math
 import os
 import struct
-from collections import namedtuple
-from typing import List, Mapping
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
 
-from bitstring import BitArray, Bits, ConstBitStream
+from . import ewah
+from .object import Tree
+from .pack import _decode_varint, _encode_varint
 
 log = logging.getLogger("pytt")
 
+# Bit masks of the 32 bit mode of an entry.
+MODE_TYPE_SHIFT = 12
+MODE_TYPE_MASK = 0xF
+MODE_PERMISSIONS_MASK = 0x1FF
+
+# Bit masks of the 16 bit flags of an entry.
+FLAG_ASSUME_VALID = 0x8000
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE_SHIFT = 12
+FLAG_STAGE_MASK = 0x3
+FLAG_NAME_MASK = 0xFFF
+
+# Bit masks of the 16 bit extended flags of a version 3 or later entry.
+EXTENDED_SKIP_WORKTREE = 0x4000
+EXTENDED_INTENT_TO_ADD = 0x2000
+
+# The mode of a sparse directory entry, which stands in for all the entries
+# of a directory outside the sparse-checkout cone, see Index.expand.
+MODE_SPARSE_DIRECTORY = 0o40000
+
+# The fixed size part of an entry: ctime, ctime_ns, mtime, mtime_ns, device,
+# inode, mode, uid, gid, file_size, sha and flags.
+ENTRY = struct.Struct(">10I20sH")
+EXTENDED_FLAGS = struct.Struct(">H")
+EXTENSION = struct.Struct(">4sI")
+SPARSE_DIRECTORIES = b"sdir"
+_PADDING = [b"\0" * (8 - i) for i in range(8)]
+
+NS_PER_SECOND = 1000 * 1000 * 1000
+
+# The index versions which can be read and written. Version 3 only adds
+# extended flags, version 4 prefix-compresses the names, see _unpack_entry_v4.
+VERSIONS = (2, 3, 4)
+
 
 # For reference of how the files are structured, see:
 # https://github.com/git/git/blob/master/Documentation/technical/index-format.txt
@@ -23,43 +59,606 @@ class Index:
     staging area. The index doesn't contain any directories -- only files.
     """
 
-    FMT = ">4sii"
+    FMT = ">4sII"
+    HEADER = struct.Struct(FMT)
 
     def __init__(self, content: bytes) -> None:
-        size = struct.calcsize(self.FMT)
-        self.header, self.version, self.file_count = _unpack_slice(self.FMT, content)
-
-        self.entries: Mapping[str, Index.Entry] = {}
-        offset = size
-        for _ in range(0, self.file_count):
-            entry = Index.Entry(new=False, content=content, offset=offset)
-            self.entries[entry.name] = entry
-            offset += entry.size
-
-        # Extensions are ignored
+        self.header, self.version, self.file_count = self.HEADER.unpack_from(content)
+
+        # Entries read from disk are kept in the compact table, added entries
+        # in _pending until they are merged into it, see table.
+        self._table = Index.Table()
+        self._pending: Dict[str, Index.Entry] = {}
+        # the mtime of the index file the index was read from, if any,
+        # entries whose file changed at or after it are racy
+        self.mtime_ns: Optional[int] = None
+
+        if self.version not in VERSIONS:
+            raise ValueError("unsupported index version %d" % self.version)
+
+        view = memoryview(content)
+        offset = self.HEADER.size
+        append = self._table.append
+        if self.version == 4:
+            name = b""
+            for _ in range(0, self.file_count):
+                stat, sha, flags, extended, name, offset = _unpack_entry_v4(
+                    view, content, offset, name
+                )
+                append(stat, sha, flags, name, extended)
+        else:
+            for _ in range(0, self.file_count):
+                stat, sha, flags, extended, name, offset = _unpack_entry(view, content, offset)
+                append(stat, sha, flags, name, extended)
+
+        # Only the cache-tree and fsmonitor extensions are read, the other
+        # extensions are all optional and dropped when the index is written.
+        # The sparse directory (sdir) extension only says that there are
+        # sparse directory entries, which is found out when writing.
+        self.cache_tree: Optional[Index.CacheTree] = None
+        self.fsmonitor: Optional[Index.FSMonitor] = None
+        end = len(content) - 20
+        while offset < end:
+            signature, size = EXTENSION.unpack_from(view, offset)
+            offset += EXTENSION.size
+            if signature == Index.CacheTree.SIGNATURE:
+                self.cache_tree = Index.CacheTree.unpack(content[offset : offset + size])
+            elif signature == Index.FSMonitor.SIGNATURE:
+                self.fsmonitor = Index.FSMonitor.unpack(content[offset : offset + size])
+            offset += size
+
+        if self.fsmonitor is not None and self.fsmonitor.bit_size > len(self._table):
+            log.warning("ignoring the fsmonitor extension, it has more entries than the index")
+            self.fsmonitor = None
 
         # The last 20 bytes are always a checksum
-        self.checksum = ConstBitStream(content[-20:])
+        self.checksum = content[-20:]
+
+    def __len__(self) -> int:
+        return len(self.table)
 
     def add_entry(self, new_entry: Index.Entry) -> None:
-        self.entries[new_entry.name] = new_entry
+        """Add the entry, replacing any entry with the same name.
+
+        Replacing an entry is done in place, new names are only merged into
+        the sorted table the next time it's needed so that adding many entries
+        costs a single merge.
+        """
+        if self.cache_tree is not None:
+            self.cache_tree.invalidate(new_entry.name)
+
+        position = self._table.find(new_entry.name.encode())
+        if position is not None:
+            self._table.set_row(position, *new_entry.fields()[:3])
+            if self.fsmonitor is not None:
+                self.fsmonitor.dirty.add(position)
+        else:
+            self._pending[new_entry.name] = new_entry
+            # the positions of the dirty entries shift
+            self.fsmonitor = None
+
+    def get_entries(self) -> Iterator[Index.Entry]:
+        """Yield a view of every entry, sorted by name."""
+        table = self.table
+        for position in range(len(table)):
+            yield table.entry(position)
+
+    @property
+    def sparse(self) -> bool:
+        """Whether some directories are stored as a single sparse directory
+        entry, see expand."""
+        return MODE_SPARSE_DIRECTORY in self.table.mode
+
+    def expand(self, read_tree: Callable[[str], Tree], paths: Iterable[str] = None) -> None:
+        """Replace the sparse directory entries by the entries of the files in
+        their trees, all of them or only the ones the paths are in.
+
+        The files are marked skip-worktree like the directory was, and have
+        no stat data as they aren't in the working tree.
+        """
+        table = self.table
+        if paths is None:
+            positions = [p for p, mode in enumerate(table.mode) if mode == MODE_SPARSE_DIRECTORY]
+        else:
+            positions = set()
+            for path in paths:
+                position = self._sparse_directory(path)
+                if position is not None:
+                    positions.add(position)
+            positions = sorted(positions)
+        if not positions:
+            return
+
+        expanded = Index.Table()
+        start = 0
+        for position in positions:
+            expanded.extend(table, start, position)
+            extended = table.extended[position]
+            files = _tree_files(read_tree, table.name(position), table.sha(position))
+            for name, mode, sha in files:
+                encoded = name.encode()
+                flags = min(len(encoded), FLAG_NAME_MASK)
+                expanded.append((0,) * 6 + (mode, 0, 0, 0), sha, flags, encoded, extended)
+            if self.cache_tree is not None:
+                self.cache_tree.invalidate(table.name(position))
+            start = position + 1
+        expanded.extend(table, start, len(table))
+
+        self._table = expanded
+        # the positions of the dirty entries shift
+        self.fsmonitor = None
+
+    def _sparse_directory(self, path: str) -> Optional[int]:
+        """Return the position of the sparse directory entry the path is in,
+        or is, or None."""
+        table = self._table
+        parts = path.split("/")
+        for depth in range(1, len(parts)):
+            position = table.find(("%s/" % "/".join(parts[:depth])).encode())
+            if position is not None and table.mode[position] == MODE_SPARSE_DIRECTORY:
+                return position
+
+        return None
+
+    def sparsify(self, includes_directory: Callable[[str], bool]) -> None:
+        """Replace the entries of every directory none of whose files are
+        included by a single sparse directory entry of its tree, marked
+        skip-worktree.
+
+        Only directories whose tree is valid in the cache-tree, and whose
+        entries are all skip-worktree and merged, are collapsed, see the
+        write-tree command.
+        """
+        if self.cache_tree is None:
+            return
+
+        table = self.table
+        collapsed = Index.Table()
+        copied, removed = self._sparsify_level(
+            table, collapsed, 0, len(table), "", self.cache_tree, includes_directory
+        )
+        if not copied:
+            # nothing was collapsed
+            return
+
+        if self.cache_tree.valid:
+            self.cache_tree.entry_count -= removed
+        collapsed.extend(table, copied, len(table))
+        self._table = collapsed
+        self.fsmonitor = None
+
+    def _sparsify_level(
+        self,
+        table: Index.Table,
+        collapsed: Index.Table,
+        copied: int,
+        end: int,
+        prefix: str,
+        cache_tree: Index.CacheTree,
+        includes_directory: Callable[[str], bool],
+    ) -> Tuple[int, int]:
+        """Collapse the subdirectories of the directory prefix, whose entries
+        end at end, into collapsed, where the rows before copied were already
+        copied to it. Return the new copied and how many rows were removed."""
+        removed = 0
+        for name in sorted(cache_tree.subtrees):
+            subtree = cache_tree.subtrees[name]
+            directory = "%s%s/" % (prefix, name)
+            # the entries of a directory end before the first name sorting
+            # after "{directory}/", i.e. "{directory}0"
+            start = table.bisect(directory.encode(), copied, end)
+            stop = table.bisect(("%s%s0" % (prefix, name)).encode(), start, end)
+            if start == stop:
+                continue
+
+            if includes_directory(directory[:-1]):
+                copied, subtree_removed = self._sparsify_level(
+                    table, collapsed, copied, stop, directory, subtree, includes_directory
+                )
+                if subtree.valid:
+                    subtree.entry_count -= subtree_removed
+                removed += subtree_removed
+                continue
+
+            # only whole trees which aren't in the working tree can go
+            if not subtree.valid or not all(
+                table.extended[position] & EXTENDED_SKIP_WORKTREE and not table.stage(position)
+                for position in range(start, stop)
+            ):
+                continue
+
+            collapsed.extend(table, copied, start)
+            encoded = directory.encode()
+            collapsed.append(
+                (0,) * 6 + (MODE_SPARSE_DIRECTORY, 0, 0, 0),
+                bytes.fromhex(subtree.sha),
+                min(len(encoded), FLAG_NAME_MASK),
+                encoded,
+                EXTENDED_SKIP_WORKTREE,
+            )
+            copied = stop
+            removed += stop - start - 1
+            # like git, the cache-tree of a sparse directory is a leaf
+            subtree.entry_count = 1
+            subtree.subtrees = {}
 
-    def get_entries(self) -> List[Index.Entry]:
-        return self.entries.values()
+        return copied, removed
 
     def pack(self) -> bytes:
-        packed = BitArray("")
+        table = self.table
+        # extended flags need version 3, which git also upgrades to
+        version = 3 if self.version == 2 and any(table.extended) else self.version
+        packed = bytearray(self.HEADER.pack(self.header, version, len(table)))
+
+        table.pack_into(packed, version)
+
+        if self.cache_tree is not None:
+            cache_tree = self.cache_tree.pack()
+            packed += EXTENSION.pack(Index.CacheTree.SIGNATURE, len(cache_tree))
+            packed += cache_tree
+
+        if self.fsmonitor is not None:
+            fsmonitor = self.fsmonitor.pack(len(table))
+            packed += EXTENSION.pack(Index.FSMonitor.SIGNATURE, len(fsmonitor))
+            packed += fsmonitor
+
+        if self.sparse:
+            packed += EXTENSION.pack(SPARSE_DIRECTORIES, 0)
+
+        self.checksum = hashlib.sha1(packed).digest()
+        packed += self.checksum
+        return bytes(packed)
+
+    @property
+    def table(self) -> Index.Table:
+        """The entries, with the pending entries merged into them.
+
+        Both are sorted so the table is rebuilt in a single pass, copying the
+        runs of rows between two pending entries at once.
+        """
+        if not self._pending:
+            return self._table
+
+        old = self._table
+        table = Index.Table()
+        start = 0
+        for name in sorted(self._pending):
+            entry = self._pending[name]
+            stat, sha, flags, encoded = entry.fields()
+            end = old.bisect(encoded)
+            table.extend(old, start, end)
+            table.append(stat, sha, flags, encoded, entry.extended)
+            start = end
+        table.extend(old, start, len(old))
+
+        self._table = table
+        self._pending = {}
+        return table
+
+    class CacheTree:
+        """The cache-tree (TREE) extension caches the tree sha of every
+        directory in the index, so that write-tree only has to write the trees
+        of the directories whose entries changed.
+
+        A directory which has changed since its tree was written is marked
+        invalid with an entry count of -1 and has no sha.
+
+        The structure is, for each directory depth first:
+        {name}\\0{entry_count} {subtree_count}\\n[{sha}]
+        """
 
-        packed_index = struct.pack(
-            self.FMT, self.header, self.version, len(self.entries)
+        SIGNATURE = b"TREE"
+
+        def __init__(self, name: str = "", entry_count: int = -1, sha: str = None) -> None:
+            self.name = name
+            self.entry_count = entry_count
+            self.sha = sha
+            self.subtrees: Dict[str, Index.CacheTree] = {}
+
+        @property
+        def valid(self) -> bool:
+            return self.entry_count >= 0
+
+        @classmethod
+        def unpack(cls, content: bytes) -> Index.CacheTree:
+            tree, _ = cls._unpack_from(content, 0)
+            return tree
+
+        @classmethod
+        def _unpack_from(cls, content: bytes, offset: int) -> Tuple[Index.CacheTree, int]:
+            end = content.index(b"\0", offset)
+            name = content[offset:end].decode()
+
+            offset = end + 1
+            end = content.index(b"\n", offset)
+            entry_count, subtree_count = content[offset:end].split(b" ")
+
+            tree = cls(name, int(entry_count))
+            offset = end + 1
+            if tree.valid:
+                tree.sha = content[offset : offset + 20].hex()
+                offset += 20
+
+            for _ in range(int(subtree_count)):
+                subtree, offset = cls._unpack_from(content, offset)
+                tree.subtrees[subtree.name] = subtree
+
+            return tree, offset
+
+        def pack(self) -> bytes:
+            packed = bytearray()
+            self._pack_into(packed)
+            return bytes(packed)
+
+        def _pack_into(self, packed: bytearray) -> None:
+            packed += b"%s\0%d %d\n" % (
+                self.name.encode(),
+                self.entry_count,
+                len(self.subtrees),
+            )
+            if self.valid:
+                packed += bytes.fromhex(self.sha)
+
+            for name in sorted(self.subtrees):
+                self.subtrees[name]._pack_into(packed)
+
+        def invalidate(self, path: str) -> None:
+            """Invalidate every directory from the root down to the path's."""
+            tree = self
+            tree.entry_count = -1
+            for name in path.split("/")[:-1]:
+                tree = tree.subtrees.get(name)
+                if tree is None:
+                    return
+                tree.entry_count = -1
+
+    class FSMonitor:
+        """The fsmonitor (FSMN) extension holds the token of the last query
+        to a file system monitor, and which entries weren't known to match the
+        working tree at that time, i.e. are dirty.
+
+        The entries which aren't dirty, and which the monitor doesn't report
+        as changed since the token, don't have to be compared to the working
+        tree at all.
+
+        The structure is:
+        {version}{token}\0{bitmap size}{bitmap}
+
+        where the bitmap is an EWAH bitmap of the positions of the dirty
+        entries.
+        """
+
+        SIGNATURE = b"FSMN"
+        VERSION = 2
+        HEADER = struct.Struct(">I")
+
+        def __init__(self, token: str, dirty: Iterable[int] = (), bit_size: int = 0) -> None:
+            self.token = token
+            self.dirty = set(dirty)
+            self.bit_size = bit_size
+
+        @classmethod
+        def unpack(cls, content: bytes) -> Optional[Index.FSMonitor]:
+            (version,) = cls.HEADER.unpack_from(content)
+            if version != cls.VERSION:
+                # version 1 holds a timestamp instead of a token
+                return None
+
+            end = content.index(b"\0", cls.HEADER.size)
+            token = content[cls.HEADER.size : end].decode()
+            dirty, bit_size, _ = ewah.unpack_from(content, end + 1 + cls.HEADER.size)
+            return cls(token, dirty, bit_size)
+
+        def pack(self, entry_count: int) -> bytes:
+            bitmap = ewah.pack(self.dirty, entry_count)
+            return b"".join(
+                (
+                    self.HEADER.pack(self.VERSION),
+                    self.token.encode(),
+                    b"\0",
+                    self.HEADER.pack(len(bitmap)),
+                    bitmap,
+                )
+            )
+
+    class Table:
+        """Index entries stored column-wise instead of as Index.Entry objects.
+
+        Every stat field is an array of 32 bit ints, the binary shas are
+        concatenated in one bytearray and the names in another, sorted, with
+        an array of offsets into it. Index.Entry views are only created for
+        the rows that are asked for, see entry().
+        """
+
+        STAT_FIELDS = (
+            "ctime",
+            "ctime_ns",
+            "mtime",
+            "mtime_ns",
+            "device",
+            "inode",
+            "mode",
+            "uid",
+            "gid",
+            "file_size",
         )
-        packed.append(packed_index)
 
-        for _, entry in sorted(self.entries.items()):
-            packed.append(entry.pack())
+        def __init__(self) -> None:
+            self.stat = [array("I") for _ in self.STAT_FIELDS]
+            (
+                self.ctime,
+                self.ctime_ns,
+                self.mtime,
+                self.mtime_ns,
+                self.device,
+                self.inode,
+                self.mode,
+                self.uid,
+                self.gid,
+                self.file_size,
+            ) = self.stat
+            self.shas = bytearray()
+            self.flags = array("H")
+            self.extended = array("H")
+            self.names = bytearray()
+            self.name_offsets = array("Q", [0])
+
+        def __len__(self) -> int:
+            return len(self.flags)
+
+        def append(
+            self, stat: Sequence[int], sha: bytes, flags: int, name: bytes, extended: int = 0
+        ) -> None:
+            for column, value in zip(self.stat, stat):
+                column.append(value)
+            self.shas += sha
+            self.flags.append(flags)
+            self.extended.append(extended)
+            self.names += name
+            self.name_offsets.append(len(self.names))
+
+        def extend(self, other: Index.Table, start: int, end: int) -> None:
+            """Copy the rows start:end of the other table to the end of this one."""
+            if start >= end:
+                return
+
+            for column, other_column in zip(self.stat, other.stat):
+                column.extend(other_column[start:end])
+            self.shas += other.shas[20 * start : 20 * end]
+            self.flags.extend(other.flags[start:end])
+            self.extended.extend(other.extended[start:end])
+
+            shift = len(self.names) - other.name_offsets[start]
+            self.names += other.names[other.name_offsets[start] : other.name_offsets[end]]
+            self.name_offsets.extend(
+                offset + shift for offset in other.name_offsets[start + 1 : end + 1]
+            )
+
+        def set_row(self, position: int, stat: Sequence[int], sha: bytes, flags: int) -> None:
+            """Overwrite everything but the name and the extended flags of the row."""
+            for column, value in zip(self.stat, stat):
+                column[position] = value
+            self.shas[20 * position : 20 * position + 20] = sha
+            self.flags[position] = flags
+
+        def smudge_racy(self, mtime_ns: int) -> int:
+            """Set the size of the entries whose file changed at or after
+            mtime_ns to 0, like git's ce_smudge_racily_clean_entry, and return
+            how many were smudged.
+
+            The stat data of such an entry can still match its file after a
+            change of the same size within the same timestamp tick. Once the
+            index is written it is older than the entry, which then no longer
+            looks racy, but a size of 0 never matches and has it hashed.
+            """
+            seconds = mtime_ns // NS_PER_SECOND
+            # max runs in C, most index writes have no racy entries at all
+            if not self.mtime or max(self.mtime) < seconds:
+                return 0
+
+            smudged = 0
+            for position in range(len(self)):
+                if self.mtime[position] < seconds or not self.file_size[position]:
+                    continue
+                if self.mtime[position] * NS_PER_SECOND + self.mtime_ns[position] >= mtime_ns:
+                    self.file_size[position] = 0
+                    smudged += 1
+            return smudged
+
+        def name_bytes(self, position: int) -> bytes:
+            return bytes(
+                self.names[self.name_offsets[position] : self.name_offsets[position + 1]]
+            )
+
+        def name(self, position: int) -> str:
+            return self.name_bytes(position).decode()
+
+        def sha_bytes(self, position: int) -> bytes:
+            return bytes(self.shas[20 * position : 20 * position + 20])
+
+        def sha(self, position: int) -> str:
+            return self.shas[20 * position : 20 * position + 20].hex()
+
+        def stage(self, position: int) -> int:
+            return (self.flags[position] >> FLAG_STAGE_SHIFT) & FLAG_STAGE_MASK
+
+        def skip_worktree(self, position: int) -> bool:
+            """Whether the entry is outside the sparse-checkout, and so not
+            expected in the working tree."""
+            return bool(self.extended[position] & EXTENDED_SKIP_WORKTREE)
+
+        def bisect(self, name: bytes, lo: int = 0, hi: int = None) -> int:
+            """Return the first row whose name is not less than the given name."""
+            hi = len(self) if hi is None else hi
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.name_bytes(mid) < name:
+                    lo = mid + 1
+                else:
+                    hi = mid
+
+            return lo
+
+        def find(self, name: bytes) -> Optional[int]:
+            """Return the row of the entry with the name or None."""
+            position = self.bisect(name)
+            if position < len(self) and self.name_bytes(position) == name:
+                return position
+
+            return None
+
+        def entry(self, position: int) -> Index.Entry:
+            """Materialize the row as an Index.Entry."""
+            stat = [column[position] for column in self.stat]
+            return Index.Entry._from_fields(
+                stat,
+                self.sha_bytes(position),
+                self.flags[position],
+                self.name(position),
+                self.extended[position],
+            )
 
-        packed.append(self.checksum)
-        return packed.bytes
+        def pack_into(self, packed: bytearray, version: int = 2) -> None:
+            """Serialize every row like Index.Entry.pack, without creating the
+            entries, and append them to packed.
+
+            Entries with extended flags need version 3 or later.
+
+            Keyword args:
+            version -- 4 compresses every name against the one before it
+            instead of padding it, see _unpack_entry_v4.
+            """
+            pack = ENTRY.pack
+            names = self.names
+            shas = self.shas
+            offsets = self.name_offsets
+            rows = zip(zip(*self.stat), self.flags, self.extended, offsets, offsets[1:])
+            previous = bytearray()
+            for position, (stat, flags, extended, start, end) in enumerate(rows):
+                flags &= ~FLAG_NAME_MASK & ~FLAG_EXTENDED
+                flags |= min(end - start, FLAG_NAME_MASK)
+                if extended:
+                    flags |= FLAG_EXTENDED
+                packed += pack(*stat, shas[20 * position : 20 * position + 20], flags)
+                if extended:
+                    packed += EXTENDED_FLAGS.pack(extended)
+                    end_of_flags = ENTRY.size + EXTENDED_FLAGS.size
+                else:
+                    end_of_flags = ENTRY.size
+                if version == 4:
+                    name = names[start:end]
+                    strip = len(previous) - _common_prefix_length(previous, name)
+                    if strip < 0x80:
+                        packed.append(strip)
+                    else:
+                        packed += _encode_varint(strip)
+                    packed += name[len(previous) - strip :]
+                    packed.append(0)
+                    previous = name
+                else:
+                    packed += names[start:end]
+                    # 1-8 NUL bytes pad the entry to a multiple of 8 bytes
+                    packed += _PADDING[(end_of_flags + end - start) % 8]
 
     class Entry:
         """An entry describes a single entry in the index.
@@ -75,7 +674,7 @@ class Index:
         >>> Index.Entry.create_new(mode, sha, filename) 
         """
 
-        ENTRY_FMT = ">iiiiii2x2siii20s2s"
+        ENTRY = ENTRY
 
         def __init__(self, new=False, **kwargs) -> None:
             if new:
@@ -101,139 +700,236 @@ class Index:
             """Create a new Tree Entry from the given mode, sha and filename."""
             return Index.Entry(new=True, mode=mode, sha=sha, filename=filename)
 
-        def _unpack(self, content: bytes, offset: int) -> None:
-            unpacked = _unpack_slice(self.ENTRY_FMT, content, offset)
-
-            StaticEntry = namedtuple(
-                "StaticEntry",
-                "ctime ctime_ns mtime mtime_ns device inode mode uid gid file_size sha flags",
-            )
-            static = StaticEntry._make(unpacked)
-
-            self.ctime = static.ctime
-            self.ctime_ns = static.ctime_ns
-            self.mtime = static.mtime
-            self.mtime_ns = static.mtime_ns
-
-            log.debug(
-                "ctime: %s, ctime_ns: %s, mtime: %s, mtime_ns: %s",
-                static.ctime,
-                static.ctime_ns,
-                static.mtime,
-                static.mtime_ns,
-            )
-
-            self.device = static.device
-            self.inode = static.inode
-
-            log.debug("device: %s, inode: %s", self.device, self.inode)
-
-            mode = ConstBitStream(static.mode)
-            self.mode_type: int = mode.read(4).uint
-            mode.pos += 3  # 3 unused bytes to throw away
-            self.mode_permissions: int = mode.read(9).uint
-
-            log.debug(
-                "mode_type: %s, mode_permissions: %s",
-                self.mode_type,
-                self.mode_permissions,
-            )
-
-            self.uid = static.uid
-            self.gid = static.gid
-            self.file_size = static.file_size
-            self.sha: str = ConstBitStream(static.sha).hex
-
-            log.debug("sha: %s", self.sha)
-
-            flags = ConstBitStream(static.flags)
-            self.assume_valid = flags.read(1).int
-            self.extended_flag = flags.read(1).int
-            self.stage_flag = flags.read(2).int
-            self.length = flags.read(12).int
-
-            log.debug("stage_flag: %s", self.stage_flag)
-            log.debug("length: %s" % self.length)
+        @classmethod
+        def from_object(
+            cls, mode: str, sha: str, filename: str, extended: int = 0
+        ) -> Index.Entry:
+            """Create an entry of the object with the given mode, sha and
+            filename without looking at the working tree, like git update-index
+            --index-info. The entry has no stat data, so the file is hashed the
+            next time it is compared to the working tree.
+
+            Keyword args:
+            extended -- the extended flags, e.g. EXTENDED_SKIP_WORKTREE for a
+            file outside the sparse-checkout.
+            """
+            name = filename.encode()
+            stat = (0,) * 6 + (int(mode, 8), 0, 0, 0)
+            flags = min(len(name), FLAG_NAME_MASK)
+            return cls._from_fields(stat, bytes.fromhex(sha), flags, filename, extended)
 
-            static_size = struct.calcsize(self.ENTRY_FMT)
+        @classmethod
+        def unpack_from(
+            cls, view: memoryview, content: bytes, offset: int
+        ) -> Tuple[Index.Entry, int]:
+            """Parse the entry at offset, return it and the offset of the next entry."""
+            stat, sha, flags, extended, name, next_offset = _unpack_entry(view, content, offset)
+            entry = cls._from_fields(stat, sha, flags, name.decode(), extended)
+            entry.size = next_offset - offset
+            return entry, next_offset
 
-            self.name: str = _unpack_slice(
-                "%ss" % self.length, content, offset + static_size
-            )[0].decode()
+        @classmethod
+        def _from_fields(
+            cls, stat: Sequence[int], sha: bytes, flags: int, name: str, extended: int = 0
+        ) -> Index.Entry:
+            entry = cls.__new__(cls)
+            (
+                entry.ctime,
+                entry.ctime_ns,
+                entry.mtime,
+                entry.mtime_ns,
+                entry.device,
+                entry.inode,
+                mode,
+                entry.uid,
+                entry.gid,
+                entry.file_size,
+            ) = stat
+
+            entry.mode_type = (mode >> MODE_TYPE_SHIFT) & MODE_TYPE_MASK
+            entry.mode_permissions = mode & MODE_PERMISSIONS_MASK
+            entry.sha = sha.hex()
+
+            entry.assume_valid = 1 if flags & FLAG_ASSUME_VALID else 0
+            entry.extended_flag = 1 if flags & FLAG_EXTENDED else 0
+            entry.stage_flag = (flags >> FLAG_STAGE_SHIFT) & FLAG_STAGE_MASK
+            entry.length = flags & FLAG_NAME_MASK
+            entry.extended = extended
+
+            entry.name = name
+            return entry
 
-            padding = 8 - (static_size + self.length) % 8
-            self.size = static_size + self.length + padding
+        def _unpack(self, content: bytes, offset: int) -> None:
+            entry, _ = Index.Entry.unpack_from(memoryview(content), content, offset)
+            self.__dict__.update(entry.__dict__)
 
         def _new(self, mode: str, sha: str, filename: str) -> None:
-            def split_time(time):
-                frac = math.modf(stat.st_ctime)
-                return (int(frac[1]), int(frac[0] * 1000 * 1000 * 1000))
-
             if not os.path.isfile(filename):
                 with open(filename, "w"):
                     pass
 
-            stat = os.stat(filename)
-            self.ctime, self.ctime_ns = split_time(stat.st_ctime)
-            self.mtime, self.mtime_ns = split_time(stat.st_mtime)
-            self.device = stat.st_dev
-            # the inode can be too large to pack so we just take the first 4 bytes and save them
-            self.inode = struct.unpack("i", struct.pack("l", stat.st_ino)[:4])[0]
+            (
+                self.ctime,
+                self.ctime_ns,
+                self.mtime,
+                self.mtime_ns,
+                self.device,
+                self.inode,
+                _,
+                self.uid,
+                self.gid,
+                self.file_size,
+            ) = stat_fields(os.stat(filename), 0)
 
             self.mode_type: int = int("%s0" % mode[:3], 2)
             self.mode_permissions: int = int(mode[3:], 8)
 
-            self.uid = stat.st_uid
-            self.gid = stat.st_gid
-            self.file_size = stat.st_size
             self.sha: str = sha
 
             # We are a bit lazy and cheat with these flags by assuming they are all 0
             self.assume_valid = 0
             self.extended_flag = 0
+            self.extended = 0
             self.stage_flag = 0
             self.length = len(filename)
 
             self.name: str = filename
 
-        def pack(self) -> bytes:
-            mode_b = BitArray("")
-            mode_b.append(Bits(uint=self.mode_type, length=4))
-            mode_b.append(Bits(uint=0, length=3))
-            mode_b.append(Bits(uint=self.mode_permissions, length=9))
-
-            sha = bytearray.fromhex(self.sha)
-
-            flags = BitArray("")
-            flags.append(Bits(uint=self.assume_valid, length=1))
-            flags.append(Bits(uint=self.extended_flag, length=1))
-            flags.append(Bits(uint=self.stage_flag, length=2))
-            flags.append(Bits(uint=len(self.name), length=12))
-
-            fmt = "%s%ds" % (self.ENTRY_FMT, len(self.name))
-            padding = (8 - (struct.calcsize(fmt) % 8)) % 8
-            fmt = "%s%dx" % (fmt, padding)
-            packed = struct.pack(
-                fmt,
+        def fields(self) -> Tuple[Tuple[int, ...], bytes, int, bytes]:
+            """Return the stat fields, binary sha, flags and encoded name, the
+            way they are stored in an Index.Table."""
+            mode = (self.mode_type << MODE_TYPE_SHIFT) | self.mode_permissions
+            name = self.name.encode()
+
+            flags = min(len(name), FLAG_NAME_MASK)
+            flags |= self.stage_flag << FLAG_STAGE_SHIFT
+            if self.assume_valid:
+                flags |= FLAG_ASSUME_VALID
+
+            stat = (
                 self.ctime,
                 self.ctime_ns,
                 self.mtime,
                 self.mtime_ns,
                 self.device,
                 self.inode,
-                mode_b.bytes,
+                mode,
                 self.uid,
                 self.gid,
                 self.file_size,
-                sha,
-                flags.bytes,
-                self.name.encode(),
             )
+            return stat, bytes.fromhex(self.sha), flags, name
+
+        def pack(self) -> bytes:
+            stat, sha, flags, name = self.fields()
+            packed = self.ENTRY.pack(*stat, sha, flags)
+
+            # 1-8 NUL bytes pad the entry to a multiple of 8 bytes
+            padding = 8 - (len(packed) + len(name)) % 8
+            return b"%s%s%s" % (packed, name, b"\0" * padding)
 
-            log.debug(packed)
-            return packed
 
+def stat_fields(stat: os.stat_result, mode: int) -> Tuple[int, ...]:
+    """Return the stat fields of an entry for the file's stat result.
 
-def _unpack_slice(fmt: str, content: bytes, offset: int = 0):
-    size = struct.calcsize(fmt)
-    return struct.unpack(fmt, content[offset : offset + size])
+    The index only has room for the low 32 bits of each field, git truncates
+    them the same way.
+    """
+    return (
+        (stat.st_ctime_ns // NS_PER_SECOND) & 0xFFFFFFFF,
+        stat.st_ctime_ns % NS_PER_SECOND,
+        (stat.st_mtime_ns // NS_PER_SECOND) & 0xFFFFFFFF,
+        stat.st_mtime_ns % NS_PER_SECOND,
+        stat.st_dev & 0xFFFFFFFF,
+        stat.st_ino & 0xFFFFFFFF,
+        mode,
+        stat.st_uid & 0xFFFFFFFF,
+        stat.st_gid & 0xFFFFFFFF,
+        stat.st_size & 0xFFFFFFFF,
+    )
+
+
+def _unpack_entry(
+    view: memoryview, content: bytes, offset: int
+) -> Tuple[Tuple[int, ...], bytes, int, int, bytes, int]:
+    """Parse the entry at offset.
+
+    Returns the stat fields, binary sha, flags, extended flags, encoded name
+    and the offset of the next entry. Both the memoryview and the bytes it views are needed: the
+    fixed size part is unpacked from the view without copying and the name is
+    searched for in the bytes.
+    """
+    fields = ENTRY.unpack_from(view, offset)
+    flags = fields[11]
+
+    start = offset + ENTRY.size
+    extended = 0
+    if flags & FLAG_EXTENDED:
+        # version 3 entries can have another 16 bits of flags
+        (extended,) = EXTENDED_FLAGS.unpack_from(view, start)
+        start += EXTENDED_FLAGS.size
+
+    length = flags & FLAG_NAME_MASK
+    if length < FLAG_NAME_MASK:
+        end = start + length
+    else:
+        # longer names don't fit in the flags and are only NUL terminated
+        end = content.index(b"\0", start)
+
+    # 1-8 NUL bytes pad the entry to a multiple of 8 bytes
+    next_offset = offset + ((end - offset + 8) & ~7)
+    return fields[:10], fields[10], flags, extended, content[start:end], next_offset
+
+
+def _unpack_entry_v4(
+    view: memoryview, content: bytes, offset: int, previous: bytes
+) -> Tuple[Tuple[int, ...], bytes, int, int, bytes, int]:
+    """Parse the version 4 entry at offset, like _unpack_entry.
+
+    The name is stored as how many bytes to drop from the end of the name of
+    the previous entry, as a varint, followed by the NUL terminated bytes to
+    append to what is left. The entries aren't padded.
+    """
+    fields = ENTRY.unpack_from(view, offset)
+    flags = fields[11]
+
+    start = offset + ENTRY.size
+    extended = 0
+    if flags & FLAG_EXTENDED:
+        (extended,) = EXTENDED_FLAGS.unpack_from(view, start)
+        start += EXTENDED_FLAGS.size
+
+    strip, start = _decode_varint(content, start)
+    if strip > len(previous):
+        raise ValueError("corrupt index entry at %d" % offset)
+
+    end = content.index(b"\0", start)
+    name = previous[: len(previous) - strip] + content[start:end]
+    return fields[:10], fields[10], flags, extended, name, end + 1
+
+
+def _tree_files(
+    read_tree: Callable[[str], Tree], prefix: str, sha: str
+) -> Iterator[Tuple[str, int, bytes]]:
+    """Yield the name, mode and binary sha of every file in the tree, whose
+    directory is prefix, recursively and sorted like the index."""
+    entries = read_tree(sha).entries
+    # trees sort as if their names ended with a /, the index sorts the files
+    # in them by their whole names, which is the same order
+    for entry in entries:
+        name = "%s%s" % (prefix, entry.name)
+        if entry.is_tree:
+            yield from _tree_files(read_tree, "%s/" % name, entry.sha)
+        else:
+            yield name, int(entry.mode, 8), bytes.fromhex(entry.sha)
+
+
+def _common_prefix_length(a: bytes, b: bytes) -> int:
+    """Return how many bytes a and b start with in common.
+
+    Both are read as big-endian integers, the highest bit set in their xor
+    is then in the first byte which differs.
+    """
+    length = min(len(a), len(b))
+    difference = int.from_bytes(a[:length], "big") ^ int.from_bytes(b[:length], "big")
+    return length - (difference.bit_length() + 7) // 8
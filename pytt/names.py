@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import logging
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+from .pack import Pack
+
+log = logging.getLogger("pytt")
+
+HEX_PREFIX = re.compile("^[0-9a-f]{1,40}$")
+
+
+def _mtime(path: str) -> Optional[int]:
+    """Return the mtime of the path in ns or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class ObjectNames:
+    """A sorted index of the names (shas) of all objects, both loose and
+    packed, used to resolve abbreviated shas.
+
+    The names are split in 256 buckets by their first byte. Each bucket is a
+    single sorted buffer of binary shas, merged from the loose objects in the
+    matching fan-out directory and the same fanout range of every pack index.
+    A bucket is only built when a name in it is looked up, and rebuilt when
+    the mtime of its fan-out directory or of the pack directory changes, so a
+    lookup costs a couple of stats and a binary search however many objects
+    there are.
+    """
+
+    def __init__(self, objects_dir: str, packs: Callable[[], List[Pack]]) -> None:
+        self.objects_dir = objects_dir
+        self._packs = packs
+        self._pack_mtime: Optional[int] = None
+        self._buckets: Dict[int, bytes] = {}
+        self._bucket_mtimes: Dict[int, Optional[int]] = {}
+
+    def find(self, prefix: str) -> List[str]:
+        """Return the hex shas of all objects starting with the hex prefix."""
+        prefix = prefix.lower()
+        if not HEX_PREFIX.match(prefix):
+            return []
+
+        matches = self._find(prefix, refresh=False)
+        if not matches:
+            # an object written within the mtime granularity of its directory
+            # wouldn't invalidate the bucket, so look once more before giving up
+            matches = self._find(prefix, refresh=True)
+
+        return matches
+
+    def shortest_unique(self, sha: str, minimum: int = 4) -> str:
+        """Return the shortest prefix of the full sha, at least minimum long,
+        which no other object starts with."""
+        sha = sha.lower()
+        binary_sha = bytes.fromhex(sha)
+        bucket = self._bucket(binary_sha[0])
+
+        count = len(bucket) // 20
+        position = _bisect(bucket, binary_sha)
+        after = position
+        if bucket[20 * position : 20 * position + 20] == binary_sha:
+            after += 1
+
+        common = 0
+        for neighbour in (position - 1, after):
+            if 0 <= neighbour < count:
+                other = bucket[20 * neighbour : 20 * neighbour + 20].hex()
+                common = max(common, _common_prefix(sha, other))
+
+        return sha[: max(minimum, common + 1)]
+
+    def _find(self, prefix: str, refresh: bool) -> List[str]:
+        if len(prefix) < 2:
+            first = int(prefix, 16) << 4
+            firsts = range(first, first + 16)
+        else:
+            firsts = [int(prefix[:2], 16)]
+
+        start = bytes.fromhex(prefix.ljust(40, "0"))
+        matches = []
+        for first in firsts:
+            bucket = self._bucket(first, refresh)
+            count = len(bucket) // 20
+            position = _bisect(bucket, start)
+            while position < count:
+                sha = bucket[20 * position : 20 * position + 20].hex()
+                if not sha.startswith(prefix):
+                    break
+
+                matches.append(sha)
+                position += 1
+
+        return matches
+
+    def _bucket(self, first: int, refresh: bool = False) -> bytes:
+        """Return the sorted names starting with the byte first, rebuilding
+        them if they could have changed."""
+        pack_mtime = _mtime(os.path.join(self.objects_dir, "pack"))
+        if pack_mtime != self._pack_mtime:
+            self._buckets.clear()
+            self._bucket_mtimes.clear()
+            self._pack_mtime = pack_mtime
+
+        directory = os.path.join(self.objects_dir, "%02x" % first)
+        mtime = _mtime(directory)
+        if not refresh and first in self._buckets and self._bucket_mtimes[first] == mtime:
+            return self._buckets[first]
+
+        names = set()
+        if mtime is not None:
+            for filename in os.listdir(directory):
+                if len(filename) != 38:
+                    continue
+
+                try:
+                    names.add(bytes.fromhex("%02x%s" % (first, filename)))
+                except ValueError:
+                    # e.g. temporary files
+                    continue
+
+        for pack in self._packs():
+            shas = pack.index.shas_starting_with(first)
+            names.update(shas[i : i + 20] for i in range(0, len(shas), 20))
+
+        bucket = b"".join(sorted(names))
+        self._buckets[first] = bucket
+        self._bucket_mtimes[first] = mtime
+        return bucket
+
+
+def _bisect(names: bytes, sha: bytes) -> int:
+    """Return the first position in the sorted names not less than sha."""
+    lo = 0
+    hi = len(names) // 20
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if names[20 * mid : 20 * mid + 20] < sha:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return lo
+
+
+def _common_prefix(a: str, b: str) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+
+    return length
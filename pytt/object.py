@@ -1,15 +1,16 @@
 #!/usr/bin/env python
 from __future__ import annotations
 
+import bisect
 import logging
-import textwrap
-from functools import reduce
-from typing import List
-
-from bitstring import BitArray, Bits, ConstBitStream
+import re
+from typing import Iterator, List, Optional
 
 log = logging.getLogger("pytt")
 
+# {mode} {name}\0{object_sha}, see Tree.Entry
+TREE_ENTRY = re.compile(rb"([0-7]+) ([^\0]*)\0(.{20})", re.DOTALL)
+
 
 class Tree:
     """A tree roughly corresponds to a directory containing entries which can be
@@ -17,33 +18,64 @@ class Tree:
 
     The object-structure looks like:
     [Tree.Entry]
+
+    Entries are sorted by name, where the names of trees sort as if they
+    ended with a /.
     """
 
     def __init__(self, entries: List[Tree.Entry] = []):
         self.entries = entries
+        self._keys: Optional[List[bytes]] = None
 
     @classmethod
     def unpack(cls, content: bytes) -> Tree:
-        bits = ConstBitStream(content)
-        entries = []
-        while bits.pos < bits.length:
-            entries.append(Tree.Entry._unpack(bits))
+        matches = TREE_ENTRY.findall(content)
+        if sum(len(mode) + len(name) + 22 for mode, name, _ in matches) != len(content):
+            raise ValueError("corrupt tree")
 
-        return Tree(entries)
+        return Tree(
+            [
+                Tree.Entry(name.decode("utf-8", "surrogateescape"), sha.hex(), mode.decode())
+                for mode, name, sha in matches
+            ]
+        )
 
-    def pack(self) -> bytes:
-        bits = BitArray(b"")
-        for entry in self.entries:
-            bits.append(Bits(entry.pack()))
+    @classmethod
+    def iter_entries(cls, content: bytes) -> Iterator[Tree.Entry]:
+        """Yield the entries of the tree content one at a time, without
+        parsing the entries after the ones consumed."""
+        offset = 0
+        for match in TREE_ENTRY.finditer(content):
+            if match.start() != offset:
+                break
+
+            mode, name, sha = match.groups()
+            yield Tree.Entry(
+                name.decode("utf-8", "surrogateescape"), sha.hex(), mode.decode()
+            )
+            offset = match.end()
+
+        if offset != len(content):
+            raise ValueError("corrupt tree entry at %d" % offset)
+
+    def find(self, name: str) -> Optional[Tree.Entry]:
+        """Return the entry with the name, looked up with a binary search."""
+        if self._keys is None:
+            self._keys = [entry.sort_key() for entry in self.entries]
+
+        encoded = name.encode("utf-8", "surrogateescape")
+        for key in (encoded, encoded + b"/"):
+            position = bisect.bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                return self.entries[position]
+
+        return None
 
-        return bits.bytes
+    def pack(self) -> bytes:
+        return b"".join(entry.pack() for entry in self.entries)
 
     def __str__(self) -> str:
-        s = ""
-        for entry in self.entries:
-            s += str(entry)
-
-        return s
+        return "\n".join(str(entry) for entry in self.entries)
 
     class Entry:
         """A tree entry contains the mode and name of a tree or blob.
@@ -56,6 +88,8 @@ class Tree:
         {mode} {name}\\0{object_sha}
         """
 
+        __slots__ = ("mode", "name", "sha")
+
         def __init__(self, name: str, sha: str, mode: str) -> None:
             """Create a new Entry with the given name, sha and mode. Mode can be given directly
             or as type and permissions separately (e.g. when converting from an Index.Tree"""
@@ -63,35 +97,31 @@ class Tree:
             self.name = name
             self.sha = sha
 
-        @classmethod
-        def _unpack(cls, bits: BitArray) -> Tree.Entry:
-            mode = _read_till(bits, b" ")
-            name = _read_till(bits, b"\0")
-            sha = bits.read("bytes:20").hex()
+        @property
+        def is_tree(self) -> bool:
+            return self.mode == "40000"
 
-            return Tree.Entry(name, sha, mode=mode)
+        def sort_key(self) -> bytes:
+            """The name the entry is sorted by in its tree."""
+            name = self.name.encode("utf-8", "surrogateescape")
+            return name + b"/" if self.is_tree else name
 
         def pack(self) -> bytes:
-            bits = BitArray("")
-            bits.append(Bits(self.mode.encode()))
-            bits.append(Bits(b" "))
-            bits.append(Bits(self.name.encode()))
-            bits.append(Bits(b"\0"))
-            bits.append(Bits(hex=self.sha))
-
-            log.debug(bits)
-
-            return bits.bytes
+            return b"%s %s\0%s" % (
+                self.mode.encode(),
+                self.name.encode("utf-8", "surrogateescape"),
+                bytes.fromhex(self.sha),
+            )
 
         def __str__(self) -> str:
-            mode = self.mode.decode()
-            if mode == "40000":
-                mode = "0" + mode
+            if self.is_tree:
+                mode = "0" + self.mode
                 object_type = "tree"
             else:
-                object_type = "blob"
+                mode = self.mode
+                object_type = "commit" if mode == "160000" else "blob"
 
-            return "%s %s %s\t%s" % (mode, object_type, self.sha, self.name.decode())
+            return "%s %s %s\t%s" % (mode, object_type, self.sha, self.name)
 
 
 class Commit:
@@ -119,7 +149,6 @@ class Commit:
         author: Commit.Author = None,
         committer: Commit.Author = None,
     ):
-        log.debug("tree: %s, parents: %s, message: %s" % (tree, parents, message))
         self.tree = tree
         self.message = message
         self.parents = parents
@@ -128,51 +157,82 @@ class Commit:
         self.committer = committer if committer else Commit.Author()
 
     @classmethod
-    def unpack(cls, content: bytes) -> Commit:
-        bits = ConstBitStream(content)
-        lines = list(bits.split(b"\n", bytealigned=True))
+    def unpack(cls, content: bytes, message: bool = True) -> Commit:
+        """Parse the commit object.
 
-        lines[0].bytepos += len("tree ")
-        tree = lines[0].read("bytes:40")
+        Keyword args:
+        message -- parse the author and message as well, set to False when
+        only the history is needed, the author and message are None then.
+        """
+        if not message:
+            return cls._unpack_headers(content)
+
+        header, _, message = content.partition(b"\n\n")
 
-        index = 1
+        tree = None
         parents = []
-        while lines[index].startswith(b"\nparent"):
-            lines[index].bytepos += len("\nparent ")
-            parents.append(lines[index].read("bytes:40"))
-            index += 1
+        author = committer = None
+        for line in header.split(b"\n"):
+            key, _, value = line.partition(b" ")
+            if key == b"tree":
+                tree = value.decode()
+            elif key == b"parent":
+                parents.append(value.decode())
+            elif key == b"author":
+                author = Commit.Author.unpack(value)
+            elif key == b"committer":
+                committer = Commit.Author.unpack(value)
+            # other headers, e.g. gpgsig, and their continuation lines are ignored
+
+        return Commit(
+            tree,
+            parents,
+            message.decode("utf-8", "surrogateescape"),
+            author=author,
+            committer=committer,
+        )
 
-        author = Commit.Author.unpack(lines[index], "author")
-        committer = Commit.Author.unpack(lines[index + 1], "committer")
+    @classmethod
+    def _unpack_headers(cls, content: bytes) -> Commit:
+        """Parse only the tree, parents and committer, which git always writes
+        first and in that order, without splitting the rest of the commit."""
+        tree = content[5:45].decode()
+        parents = []
+        offset = 46
+        while content.startswith(b"parent ", offset):
+            parents.append(content[offset + 7 : offset + 47].decode())
+            offset += 48
 
-        # ignore prefix \n
-        message = lines[index + 3][8:].bytes
+        start = content.index(b"\ncommitter ", offset) + len(b"\ncommitter ")
+        committer = Commit.Author.unpack(content[start : content.index(b"\n", start)])
 
-        return Commit(tree, parents, message, author=author, committer=committer)
+        commit = Commit(tree, parents, None, committer=committer)
+        commit.author = None
+        return commit
 
     def pack(self) -> bytes:
-        bits = BitArray("")
-        bits.append(Bits(bytes=b"tree %s\n" % self.tree.encode()))
+        packed = [b"tree %s\n" % self.tree.encode()]
 
         for parent in self.parents:
-            bits.append(Bits(bytes=b"parent %s\n" % parent.encode()))
+            packed.append(b"parent %s\n" % parent.encode())
 
-        bits.append(Bits(bytes=b"author %s\n" % self.author.pack()))
-        bits.append(Bits(bytes=b"committer %s\n" % self.committer.pack()))
-        bits.append(Bits(bytes=b"\n%s" % self.message.encode()))
+        packed.append(b"author %s\n" % self.author.pack())
+        packed.append(b"committer %s\n" % self.committer.pack())
+        packed.append(b"\n%s" % self.message.encode("utf-8", "surrogateescape"))
 
-        return bits.bytes
+        return b"".join(packed)
 
     def __str__(self) -> str:
-        s = "tree %s\n" % self.tree.decode()
+        s = "tree %s\n" % self.tree
         for parent in self.parents:
-            s += "parent %s\n" % parent.decode()
+            s += "parent %s\n" % parent
 
         s += "author %s\n" % self.author
         s += "committer %s\n" % self.committer
-        s += "\n%s" % self.message.decode()
+        s += "\n%s" % self.message
 
-        return s
+        # print adds the final newline back
+        return s[:-1] if s.endswith("\n") else s
 
     class Author:
         """An author describes the author or committer field in a git commit.
@@ -192,13 +252,11 @@ class Commit:
             self.date_timezone = date_timezone
 
         @classmethod
-        def unpack(cls, line: int, prefix: str) -> Commit.Author:
-            line.bytepos += len("\n%s " % prefix)
-            splits = list(line.split(b" ", start=line.pos, bytealigned=True))
-            date_timezone = splits[-1][8:].bytes
-            date_s = splits[-2][8:].bytes
-            email = splits[-3][16:-8].bytes  # strip the < when parsing
-            name = reduce((lambda sum, next: sum + next.bytes), splits[:-3], b"")
+        def unpack(cls, value: bytes) -> Commit.Author:
+            """Parse '{name} <{email}> {date_seconds} {date_timezone}'."""
+            name, _, rest = value.partition(b" <")
+            email, _, date = rest.rpartition(b"> ")
+            date_s, _, date_timezone = date.partition(b" ")
 
             return Commit.Author(name, email, date_s, date_timezone)
 
@@ -209,18 +267,3 @@ class Commit:
             return b" ".join(
                 [self.name, b"<%s>" % self.email, self.date_s, self.date_timezone]
             ).decode()
-
-
-def _read_till(bits: BitArray, delim: bytes) -> BitArray:
-    start_pos = bits.pos
-
-    found_pos = bits.findall(delim, start=bits.pos, bytealigned=True)
-    next_pos = int(list(found_pos)[0] / 8)
-
-    bits.pos = start_pos
-    value = bits.read("bytes:%d" % (next_pos - bits.bytepos))
-
-    # move past the found delimiter
-    bits.bytepos += 1
-
-    return value
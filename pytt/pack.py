@@ -0,0 +1,687 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import concurrent.futures
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import zlib
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from . import trace
+from .delta import DeltaIndex, LRUCache, apply_delta, delta_result_size
+
+log = logging.getLogger("pytt")
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {OBJ_COMMIT: "commit", OBJ_TREE: "tree", OBJ_BLOB: "blob", OBJ_TAG: "tag"}
+TYPE_NUMBERS = {name: number for number, name in TYPE_NAMES.items()}
+
+# How much compressed data to feed zlib beyond the object's inflated size when
+# starting to inflate an entry, see Pack._inflate.
+INFLATE_SLACK = 64
+INFLATE_CHUNK = 4096
+
+# A delta starts with two sizes of at most 10 bytes each.
+DELTA_HEADER_SIZE = 20
+
+# Same default as git's core.deltaBaseCacheLimit.
+DELTA_BASE_CACHE_SIZE = 96 * 1024 * 1024
+
+
+def _map_file(path: str) -> mmap.mmap:
+    """Map the whole file read-only into memory."""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# For reference of how the files are structured, see:
+# https://github.com/git/git/blob/master/Documentation/technical/pack-format.txt
+class PackIndex:
+    """The pack index (.idx) maps object shas to offsets in the packfile.
+
+    Only version 2 is supported. The file is mmap'd and never read in full, a
+    lookup touches the fanout table and log2(n) of the sorted shas.
+
+    The structure is:
+    {magic} {version} [256 fanout counts] [sha] [crc32] [offset] [large offset]
+    """
+
+    MAGIC = b"\377tOc"
+    HEADER = struct.Struct(">4sI")
+    FANOUT = struct.Struct(">256I")
+    OFFSET = struct.Struct(">I")
+    LARGE_OFFSET = struct.Struct(">Q")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._map = _map_file(path)
+
+        magic, version = self.HEADER.unpack_from(self._map)
+        if magic != self.MAGIC or version != 2:
+            raise ValueError("unsupported pack index %s" % path)
+
+        self.fanout = self.FANOUT.unpack_from(self._map, self.HEADER.size)
+        self.count = self.fanout[-1]
+
+        self._sha_offset = self.HEADER.size + self.FANOUT.size
+        self._crc_offset = self._sha_offset + 20 * self.count
+        self._offset_offset = self._crc_offset + 4 * self.count
+        self._large_offset = self._offset_offset + 4 * self.count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def sha(self, position: int) -> bytes:
+        """Return the binary sha of the object at the given position."""
+        start = self._sha_offset + 20 * position
+        return self._map[start : start + 20]
+
+    def offset(self, position: int) -> int:
+        """Return the packfile offset of the object at the given position."""
+        offset = self.OFFSET.unpack_from(self._map, self._offset_offset + 4 * position)[0]
+        if offset & 0x80000000:
+            large = self._large_offset + 8 * (offset & 0x7FFFFFFF)
+            offset = self.LARGE_OFFSET.unpack_from(self._map, large)[0]
+
+        return offset
+
+    def _bisect(self, sha: bytes) -> int:
+        """Return the first position whose sha is not less than the given sha.
+
+        The fanout table narrows the search down to the shas sharing the first
+        byte before bisecting.
+        """
+        first = sha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sha(mid) < sha:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def find(self, sha: bytes) -> Optional[int]:
+        """Return the position of the binary sha or None if it isn't in the pack."""
+        position = self._bisect(sha)
+        if position < self.count and self.sha(position) == sha:
+            return position
+
+        return None
+
+    def shas_starting_with(self, first: int) -> bytes:
+        """Return the sorted binary shas whose first byte is first, as one
+        buffer of 20 byte shas."""
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        return self._map[self._sha_offset + 20 * lo : self._sha_offset + 20 * hi]
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class Pack:
+    """A packfile stores many objects zlib compressed after each other.
+
+    Each entry starts with a variable length header containing the object type
+    and inflated size, objects are looked up through the accompanying .idx.
+
+    Deltified entries store a delta against a base object instead, which is
+    either given as a negative offset in the same pack (OFS_DELTA) or as a sha
+    (REF_DELTA). Inflated bases are kept in an LRUCache of at most
+    delta_cache_size bytes.
+
+    The structure is:
+    PACK {version} {object_count} [{type+size} [{base}] {compressed data}] {checksum}
+    """
+
+    MAGIC = b"PACK"
+    HEADER = struct.Struct(">4sII")
+
+    def __init__(self, path: str, delta_cache_size: int = DELTA_BASE_CACHE_SIZE) -> None:
+        self.path = path
+        self.delta_cache = LRUCache(delta_cache_size)
+        self.index = PackIndex(path[: -len(".pack")] + ".idx")
+        self._map = _map_file(path)
+        self._view = memoryview(self._map)
+
+        magic, version, self.count = self.HEADER.unpack_from(self._map)
+        if magic != self.MAGIC or version not in (2, 3):
+            raise ValueError("unsupported pack %s" % path)
+
+    def __contains__(self, sha: bytes) -> bool:
+        return self.index.find(sha) is not None
+
+    def read(self, sha: bytes) -> Optional[Tuple[str, bytes]]:
+        """Return the type name and content of the binary sha, or None if the
+        object isn't stored in this pack."""
+        position = self.index.find(sha)
+        if position is None:
+            return None
+
+        return self.read_at(self.index.offset(position))
+
+    def read_header(self, sha: bytes) -> Optional[Tuple[str, int]]:
+        """Return the type name and size of the binary sha without rebuilding
+        the object, or None if the object isn't stored in this pack."""
+        position = self.index.find(sha)
+        if position is None:
+            return None
+
+        return self.header_at(self.index.offset(position))
+
+    def header_at(self, offset: int) -> Tuple[str, int]:
+        """Return the type name and size of the entry at the given offset.
+
+        The size of a deltified object is read from the start of its delta and
+        the type from the end of its delta chain, which only needs the entry
+        headers of the chain.
+        """
+        cached = self.delta_cache.get(offset)
+        if cached is not None:
+            return cached[0], len(cached[1])
+
+        object_type, size, data_offset = self._entry_header(offset)
+        if object_type in TYPE_NAMES:
+            return TYPE_NAMES[object_type], size
+
+        base_offset, data_offset = self._delta_base(object_type, offset, data_offset)
+        size = delta_result_size(self._inflate_prefix(data_offset, DELTA_HEADER_SIZE))
+
+        while object_type not in TYPE_NAMES:
+            offset = base_offset
+            object_type, _, data_offset = self._entry_header(offset)
+            if object_type not in TYPE_NAMES:
+                base_offset, _ = self._delta_base(object_type, offset, data_offset)
+
+        return TYPE_NAMES[object_type], size
+
+    def read_at(self, offset: int) -> Tuple[str, bytes]:
+        """Return the type name and content of the entry at the given offset.
+
+        Delta chains are walked down to the first cached or undeltified base
+        and then applied back up, caching every object rebuilt on the way.
+        """
+        cached = self.delta_cache.get(offset)
+        if cached is not None:
+            return cached
+
+        chain = []
+        while True:
+            object_type, size, data_offset = self._entry_header(offset)
+            if object_type in TYPE_NAMES:
+                base = (TYPE_NAMES[object_type], self._inflate(data_offset, size))
+                break
+
+            base_offset, data_offset = self._delta_base(object_type, offset, data_offset)
+            chain.append((offset, data_offset, size))
+
+            offset = base_offset
+            base = self.delta_cache.get(offset)
+            if base is not None:
+                break
+
+        if not chain:
+            return base
+
+        base_type, data = base
+        self.delta_cache.put(offset, base, len(data))
+        for delta_offset, data_offset, size in reversed(chain):
+            data = apply_delta(data, self._inflate(data_offset, size))
+            trace.count("pack/deltas_applied")
+            self.delta_cache.put(delta_offset, (base_type, data), len(data))
+
+        return base_type, data
+
+    def _delta_base(self, object_type: int, offset: int, data_offset: int) -> Tuple[int, int]:
+        """Return the offset of the delta's base and where the delta data starts."""
+        if object_type == OBJ_OFS_DELTA:
+            distance, data_offset = _decode_varint(self._map, data_offset)
+            return offset - distance, data_offset
+
+        if object_type == OBJ_REF_DELTA:
+            sha = self._map[data_offset : data_offset + 20]
+            position = self.index.find(sha)
+            if position is None:
+                raise ValueError("delta base %s not in %s" % (sha.hex(), self.path))
+
+            return self.index.offset(position), data_offset + 20
+
+        raise ValueError("unknown object type %d at %d in %s" % (object_type, offset, self.path))
+
+    def _entry_header(self, offset: int) -> Tuple[int, int, int]:
+        """Parse the entry header at offset.
+
+        Return the type, the inflated size and the offset the data starts at.
+        """
+        c = self._map[offset]
+        offset += 1
+        object_type = (c >> 4) & 0x7
+        size = c & 0xF
+        shift = 4
+        while c & 0x80:
+            c = self._map[offset]
+            offset += 1
+            size |= (c & 0x7F) << shift
+            shift += 7
+
+        return object_type, size, offset
+
+    def _inflate(self, offset: int, size: int) -> bytes:
+        """Inflate size bytes from the zlib stream starting at offset.
+
+        The compressed length isn't stored so the mapped pack is fed to zlib in
+        slices of the memoryview -- slicing doesn't copy, and only the last
+        slice's unused tail is copied by zlib.
+        """
+        decompressor = zlib.decompressobj()
+        chunks = []
+        step = size + INFLATE_SLACK
+        while not decompressor.eof:
+            chunk = self._view[offset : offset + step]
+            if not chunk:
+                raise ValueError("truncated object at %d in %s" % (offset, self.path))
+
+            chunks.append(decompressor.decompress(chunk))
+            offset += len(chunk)
+            step = INFLATE_CHUNK
+
+        data = b"".join(chunks)
+        if len(data) != size:
+            raise ValueError("corrupt object at %d in %s" % (offset, self.path))
+        trace.count("zlib/inflated_bytes", size)
+
+        return data
+
+    def _inflate_prefix(self, offset: int, size: int) -> bytes:
+        """Inflate at most the first size bytes of the zlib stream at offset."""
+        decompressor = zlib.decompressobj()
+        data = b""
+        while len(data) < size and not decompressor.eof:
+            chunk = self._view[offset : offset + INFLATE_SLACK]
+            if not chunk:
+                break
+
+            data += decompressor.decompress(chunk, size - len(data))
+            # input zlib didn't get to is fed again from the pack
+            offset += len(chunk) - len(decompressor.unconsumed_tail)
+
+        return data
+
+    def close(self) -> None:
+        self.delta_cache.clear()
+        self._view.release()
+        self._map.close()
+        self.index.close()
+
+
+class PackWriter:
+    """Collects objects and writes them as a single packfile with its index.
+
+    Objects are sorted like git does it -- by type, a hash of their name and
+    descending size -- so that similar objects end up close to each other, and
+    each object is then tried as a delta against the window objects before it.
+    The delta search can be split across several processes, each searching a
+    contiguous segment of the sorted objects.
+
+    Objects can be added with only their size when the writer is given read,
+    their content is then read when it is needed: during the delta search
+    only the window objects are kept in memory, and while writing only the
+    deltas which haven't been written yet. The segments of the processes
+    are read before they are handed to them. The pack is streamed to a
+    temporary file as it is written.
+
+    Examples
+    --------
+    >>> writer = PackWriter(window=10, depth=50, read=lambda sha: objects.read(sha.hex())[1])
+    >>> writer.add(sha, "blob", None, "readme.md", size)
+    >>> path = writer.write(".git/objects/pack")
+    """
+
+    class Entry:
+        """An object to be packed, together with where it ended up in the pack."""
+
+        def __init__(
+            self, sha: bytes, object_type: str, data: Optional[bytes], name: str, size: int
+        ) -> None:
+            self.sha = sha
+            self.type = object_type
+            self.data = data
+            self.name = name
+            self.size = size
+
+            self.base: Optional[PackWriter.Entry] = None
+            self.delta: Optional[bytes] = None
+            self.delta_size = 0
+            self.depth = 0
+
+            self.offset = 0
+            self.packed_size = 0
+            self.crc = 0
+
+    class _Output:
+        """The pack file being written, hashed as it is written."""
+
+        def __init__(self, f: BinaryIO) -> None:
+            self.f = f
+            self.sha1 = hashlib.sha1()
+            self.offset = 0
+
+        def write(self, data: bytes) -> None:
+            self.f.write(data)
+            self.sha1.update(data)
+            self.offset += len(data)
+
+    def __init__(
+        self,
+        window: int = 10,
+        depth: int = 50,
+        processes: int = 1,
+        read: Optional[Callable[[bytes], bytes]] = None,
+    ) -> None:
+        self.window = window
+        self.depth = depth
+        self.processes = processes
+        self.read = read
+        self.entries: Dict[bytes, PackWriter.Entry] = {}
+
+    def add(
+        self,
+        sha: bytes,
+        object_type: str,
+        data: Optional[bytes],
+        name: str = "",
+        size: Optional[int] = None,
+    ) -> None:
+        """Add the object, its data can be None if the writer was given read,
+        the size is then needed."""
+        if sha not in self.entries:
+            size = len(data) if data is not None else size
+            self.entries[sha] = PackWriter.Entry(sha, object_type, data, name, size)
+
+    def write(self, directory: str) -> str:
+        """Write pack-{checksum}.pack and .idx to the directory, return the
+        path to the pack.
+
+        The .idx is written first, so that readers which find the .pack can
+        always open it.
+        """
+        import tempfile
+
+        entries = sorted(
+            self.entries.values(),
+            key=lambda e: (-TYPE_NUMBERS[e.type], -_name_hash(e.name), -e.size),
+        )
+        self._find_deltas(entries)
+
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp_pack_", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                out = PackWriter._Output(f)
+                out.write(Pack.HEADER.pack(Pack.MAGIC, 2, len(entries)))
+                for entry in entries:
+                    self._write_entry(out, entry)
+                checksum = out.sha1.digest()
+                f.write(checksum)
+
+            path = os.path.join(directory, "pack-%s" % checksum.hex())
+            _write_file(path + ".idx", self._index(checksum))
+            os.replace(tmp_path, path + ".pack")
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        return path + ".pack"
+
+    def _data(self, entry: PackWriter.Entry) -> bytes:
+        return entry.data if entry.data is not None else self.read(entry.sha)
+
+    def _find_deltas(self, entries: List[PackWriter.Entry]) -> None:
+        if self.window <= 0 or self.depth <= 0:
+            return
+
+        segments = _split(entries, self.processes)
+        if len(segments) > 1:
+            jobs = [[(e.type, self._data(e)) for e in segment] for segment in segments]
+            with concurrent.futures.ProcessPoolExecutor(len(jobs)) as executor:
+                futures = [
+                    executor.submit(_find_deltas, job, self.window, self.depth) for job in jobs
+                ]
+                results = [future.result() for future in futures]
+        else:
+            # read one object at a time, _find_deltas only keeps the window
+            results = [
+                _find_deltas(((e.type, self._data(e)) for e in segment), self.window, self.depth)
+                for segment in segments
+            ]
+
+        for segment, deltas in zip(segments, results):
+            for entry, (base, delta, depth) in zip(segment, deltas):
+                if delta is not None:
+                    entry.base = segment[base]
+                    entry.delta = delta
+                    entry.delta_size = len(delta)
+                    entry.depth = depth
+
+    def _write_entry(self, out: PackWriter._Output, entry: PackWriter.Entry) -> None:
+        """Write the entry to the pack, writing its delta bases first if they
+        haven't been written yet since an OFS_DELTA can only point backwards."""
+        chain = []
+        while entry is not None and not entry.offset:
+            chain.append(entry)
+            entry = entry.base
+
+        for entry in reversed(chain):
+            self._write_one(out, entry)
+
+    def _write_one(self, out: PackWriter._Output, entry: PackWriter.Entry) -> None:
+        entry.offset = out.offset
+        if entry.base is None:
+            raw = _entry_header(TYPE_NUMBERS[entry.type], entry.size)
+            raw += zlib.compress(self._data(entry))
+        else:
+            raw = _entry_header(OBJ_OFS_DELTA, entry.delta_size)
+            raw += _encode_varint(entry.offset - entry.base.offset)
+            raw += zlib.compress(entry.delta)
+
+        entry.packed_size = len(raw)
+        entry.crc = zlib.crc32(raw)
+        out.write(raw)
+        # every entry is written once, only its offset is needed from now on
+        entry.data = None
+        entry.delta = None
+
+    def _index(self, checksum: bytes) -> bytes:
+        """Build the v2 .idx of the written entries."""
+        entries = sorted(self.entries.values(), key=lambda e: e.sha)
+
+        fanout = [0] * 256
+        for entry in entries:
+            fanout[entry.sha[0]] += 1
+        for i in range(1, 256):
+            fanout[i] += fanout[i - 1]
+
+        offsets = []
+        large_offsets = []
+        for entry in entries:
+            if entry.offset < 0x80000000:
+                offsets.append(entry.offset)
+            else:
+                offsets.append(0x80000000 | len(large_offsets))
+                large_offsets.append(entry.offset)
+
+        idx = bytearray(PackIndex.HEADER.pack(PackIndex.MAGIC, 2))
+        idx += PackIndex.FANOUT.pack(*fanout)
+        idx += b"".join(entry.sha for entry in entries)
+        idx += struct.pack(">%dI" % len(entries), *(entry.crc for entry in entries))
+        idx += struct.pack(">%dI" % len(offsets), *offsets)
+        idx += struct.pack(">%dQ" % len(large_offsets), *large_offsets)
+        idx += checksum
+        idx += hashlib.sha1(idx).digest()
+
+        return bytes(idx)
+
+    def verify_pack_lines(self) -> List[str]:
+        """Return the object lines `git verify-pack -v` should print for the
+        written pack."""
+        lines = []
+        for entry in sorted(self.entries.values(), key=lambda e: e.offset):
+            size = entry.size if entry.base is None else entry.delta_size
+            line = "%s %-6s %d %d %d" % (
+                entry.sha.hex(),
+                entry.type,
+                size,
+                entry.packed_size,
+                entry.offset,
+            )
+            if entry.base is not None:
+                line += " %d %s" % (entry.depth, entry.base.sha.hex())
+            lines.append(line)
+
+        return lines
+
+    def verify(self, path: str) -> List[str]:
+        """Compare the output of `git verify-pack -v` for the written pack with
+        what was written, return the differing lines as a unified diff."""
+        import difflib
+        import subprocess
+
+        output = subprocess.run(
+            ["git", "verify-pack", "-v", path[: -len(".pack")] + ".idx"],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout.decode()
+        actual = [line for line in output.splitlines() if re.match("[0-9a-f]{40} ", line)]
+
+        return list(
+            difflib.unified_diff(
+                self.verify_pack_lines(), actual, "pytt", "git verify-pack", lineterm=""
+            )
+        )
+
+
+def _find_deltas(
+    objects: Iterable[Tuple[str, bytes]], window: int, max_depth: int
+) -> List[Tuple[int, Optional[bytes], int]]:
+    """Find the best delta for each object against the window objects before it.
+
+    Returns a (base position, delta, depth) tuple per object, where delta is
+    None if the object is best stored whole. Runs in the worker processes so it
+    only deals with plain tuples. The objects are consumed one at a time and
+    only the window objects are kept.
+    """
+    results = []
+    recent: Dict[int, Tuple[str, bytes]] = {}
+    indexes: Dict[int, DeltaIndex] = {}
+    for position, (object_type, data) in enumerate(objects):
+        recent[position] = (object_type, data)
+        best = (0, None, 0)
+        # git's limit: a delta must at least halve the object to be worth it
+        max_size = len(data) // 2 - 20
+        for base in range(max(0, position - window), position):
+            base_type, base_data = recent[base]
+            base_depth = results[base][2]
+            if base_type != object_type or base_depth >= max_depth or max_size <= 0:
+                continue
+            if len(base_data) < len(data) // 32:
+                continue
+
+            if base not in indexes:
+                indexes[base] = DeltaIndex(base_data)
+
+            delta = indexes[base].create_delta(data, max_size)
+            if delta is not None:
+                best = (base, delta, base_depth + 1)
+                max_size = len(delta)
+
+        results.append(best)
+        indexes.pop(position - window, None)
+        recent.pop(position - window, None)
+
+    return results
+
+
+def _split(entries: list, count: int) -> List[list]:
+    """Split the entries in count contiguous segments of roughly equal size."""
+    count = max(1, min(count, len(entries)))
+    size = -(-len(entries) // count) if entries else 0
+    return [entries[i : i + size] for i in range(0, len(entries), size)] if size else []
+
+
+def _name_hash(name: str) -> int:
+    """git's pack_name_hash, which sorts files by the end of their name so
+    e.g. all Makefiles are close to each other."""
+    value = 0
+    for c in name.encode():
+        if chr(c).isspace():
+            continue
+        value = ((value >> 2) + (c << 24)) & 0xFFFFFFFF
+
+    return value
+
+
+def _entry_header(object_type: int, size: int) -> bytes:
+    """Encode the type and size of a pack entry, see Pack._entry_header."""
+    c = (object_type << 4) | (size & 0xF)
+    size >>= 4
+    header = bytearray()
+    while size:
+        header.append(c | 0x80)
+        c = size & 0x7F
+        size >>= 7
+    header.append(c)
+
+    return bytes(header)
+
+
+def _encode_varint(value: int) -> bytes:
+    """Encode the value like git's encode_varint: 7 bits per byte, most
+    significant first, with the high bit set on every byte but the last and
+    one subtracted from every group but the last, so no value has two
+    encodings.
+
+    It is how the distance to an OFS_DELTA's base is stored, and how much of
+    the previous name an entry of index version 4 drops."""
+    encoded = [value & 0x7F]
+    value >>= 7
+    while value:
+        value -= 1
+        encoded.append(0x80 | (value & 0x7F))
+        value >>= 7
+
+    return bytes(reversed(encoded))
+
+
+def _decode_varint(buffer: Union[bytes, mmap.mmap], offset: int) -> Tuple[int, int]:
+    """Decode the varint at offset, see _encode_varint, return it and the
+    offset after it."""
+    c = buffer[offset]
+    offset += 1
+    value = c & 0x7F
+    while c & 0x80:
+        c = buffer[offset]
+        offset += 1
+        value = ((value + 1) << 7) | (c & 0x7F)
+
+    return value, offset
+
+
+def _write_file(path: str, content: bytes) -> None:
+    """Write the file through a temporary file so readers never see it half written."""
+    tmp_path = "%s.tmp" % path
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
@@ -1,68 +1,55 @@
 #!/usr/bin/env python
-import codecs
-import hashlib
+import collections
+import concurrent.futures
 import logging
 import os
-import pathlib
-import re
-import zlib
+import sys
+import time
+from typing import BinaryIO, Callable, Deque, Dict, Iterable, List, Optional, Tuple
 
-from .index import Index
+from . import trace
+from .commit_graph import CommitGraph, CommitGraphWriter
+from .index import EXTENDED_SKIP_WORKTREE, MODE_SPARSE_DIRECTORY, VERSIONS, Index, stat_fields
 from .object import Commit, Tree
+from .pack import PackWriter
+from .repository import HASH_CHUNK_SIZE, ObjectDatabase, Repository
+from .revwalk import RevWalk
+from .treediff import NULL_SHA, RenameDetector, TreeChange, TreeDiff
+from .sparse import SPARSE_CHECKOUT_FILE, Cone
+from .worktree import MODE_EXECUTABLE, MODE_GITLINK, MODE_SYMLINK, Change, HashFile, WorktreeDiff
 
 log = logging.getLogger("pytt")
 
+# Modules only a few commands need, like fsmonitor, blobdiff or subprocess, are
+# imported by those commands so that the others start faster.
 
-def _git_path(path: str) -> str:
-    """Return the path to the file in the git-directory."""
-    return ".git/%s" % path
+# The repository in the current directory. It is kept for the whole process,
+# so its packs and caches are reused between calls, see _repo.
+_repository: Optional[Repository] = None
 
 
-def _ensure_directory(path: str) -> None:
-    """Ensure the given path exists by creating any directories necessary."""
-    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+def _repo() -> Repository:
+    """Return the repository in the current directory."""
+    global _repository
 
+    path = os.getcwd()
+    if _repository is None or _repository.path != path:
+        if _repository is not None:
+            _repository.close()
+        _repository = Repository(path)
 
-def _resolve_object_sha(sha: str) -> str:
-    """If one and only one object exists starting with the sha, return that
-    objects full sha. Allows giving only the shortest sha describing an object.
-    """
-    directory = sha[:2]
-    filename = sha[2:]
-
-    git_dir = ".git/objects/%s" % directory
-    if not os.path.isdir(git_dir):
-        return sha
-
-    matches = []
-    for filepath in os.listdir(git_dir):
-        if re.search("^%s.*" % filename, filepath):
-            matches.append(filepath)
-
-    if len(matches) > 1:
-        log.fatal("multiple possible matches for sha %s" % sha)
+    return _repository
 
-    if len(matches) == 1:
-        filename = matches[0]
 
-    return "%s%s" % (directory, filename)
+def read_object(sha: str) -> Tuple[str, bytes]:
+    """Return the type and content of the object, read from the loose object
+    if there is one and otherwise from the packfiles."""
+    return _repo().objects.read(sha)
 
 
-def _object_path(sha: str, resolve: bool = True) -> str:
-    """Get the path to the object with the given sha.
-
-    Keyword args:
-
-    resolve -- if the sha should be resolved, set to False if you are creating
-    a new object."""
-    sha = _resolve_object_sha(sha) if resolve else sha
-    return _git_path("objects/%s/%s" % (sha[:2], sha[2:]))
-
-
-def _index() -> Index:
-    """Open and parse the index."""
-    with open(_git_path("index"), "rb") as f:
-        return Index(f.read())
+def read_object_header(sha: str) -> Tuple[str, int]:
+    """Return the type and size of the object without reading all of it."""
+    return _repo().objects.read_header(sha)
 
 
 def cat_file(obj: str) -> None:
@@ -71,23 +58,70 @@ def cat_file(obj: str) -> None:
     This implementation assumes the -p flag is passed, i.e. it always pretty
     prints the object.
     """
-    with open(_object_path(obj), "rb") as f:
-        content = zlib.decompress(f.read())
-
-    [header, data] = content.split(b"\0", 1)
+    object_type, data = read_object(obj)
 
-    if header.startswith(b"blob"):
+    if object_type == "blob":
         try:
             print(data.decode())
         except UnicodeDecodeError:
             log.info("Unable to decode, printing as is")
             print(data)
-    elif header.startswith(b"tree"):
+    elif object_type == "tree":
         print(Tree.unpack(data))
-    elif header.startswith(b"commit"):
+    elif object_type == "commit":
         print(Commit.unpack(data))
 
 
+def cat_file_batch(
+    names: Iterable[str], out: BinaryIO, contents: bool = True, flush: bool = True
+) -> None:
+    """Write '{sha} {type} {size}\\n' for every object name, followed by the
+    raw content and a newline if contents is set, like git cat-file --batch.
+
+    Names which can't be resolved to an object get '{name} missing\\n', and
+    short shas of more than one object '{name} ambiguous\\n'. The packs and
+    caches stay open between names, so this is the cheap way of reading many
+    objects.
+
+    Keyword args:
+    contents -- write the content as well, otherwise only the header.
+    flush -- flush out after each object so the reader can answer
+    interactively, turn off if all names are given up front.
+    """
+    objects = _repo().objects
+    for name in names:
+        # not objects.resolve, which logs an ambiguous name as fatal, the
+        # batch goes on with the next name
+        matches = [name] if len(name) == 40 else objects.names.find(name)
+        if len(matches) > 1:
+            out.write(b"%s ambiguous\n" % name.encode())
+        else:
+            _write_batch_object(objects, out, name, matches[0] if matches else name, contents)
+
+        if flush:
+            out.flush()
+
+    out.flush()
+
+
+def _write_batch_object(
+    objects: ObjectDatabase, out: BinaryIO, name: str, sha: str, contents: bool
+) -> None:
+    try:
+        if contents:
+            object_type, data = objects.read(sha)
+            size = len(data)
+        else:
+            object_type, size = objects.read_header(sha)
+    except (FileNotFoundError, ValueError):
+        out.write(b"%s missing\n" % name.encode())
+    else:
+        out.write(b"%s %s %d\n" % (sha.encode(), object_type.encode(), size))
+        if contents:
+            out.write(data)
+            out.write(b"\n")
+
+
 def hash_object(data: bytes, write: bool = False, object_type: str = "blob") -> None:
     """Takes the given data, modifies it to git's format and prints the sha.
 
@@ -97,64 +131,945 @@ def hash_object(data: bytes, write: bool = False, object_type: str = "blob") ->
     write -- if true also saves the object to the corresponding file.
     object_type -- blob, tree or commit
     """
-    header = "%s %d" % (object_type, len(data))
-    content = b"%s\0%s" % (header.encode(), data)
+    objects = _repo().objects
+    if write:
+        sha = objects.write(data, object_type)
+    else:
+        sha = objects.hash(data, object_type)
 
-    sha = hashlib.sha1(content)
-    print(sha.hexdigest())
+    print(sha)
 
-    if write:
-        path = _object_path(sha.hexdigest(), resolve=False)
-        _ensure_directory(path)
 
-        with open(path, "wb") as f:
-            f.write(zlib.compress(content))
+def hash_file(path: str, write: bool = False, object_type: str = "blob") -> None:
+    """Like hash_object but for the content of the file, which is read in
+    chunks so that files of any size are hashed with constant memory."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        print(_repo().objects.hash_stream(f, size, object_type, write))
+
+
+def hash_stream(stream: BinaryIO, write: bool = False, object_type: str = "blob") -> None:
+    """Like hash_file but for a stream, e.g. stdin.
 
+    The object header needs the size before the content so the stream is
+    first copied to a temporary file, which stays in memory if it is small.
+    """
+    import shutil
+    import tempfile
+
+    with tempfile.SpooledTemporaryFile(max_size=HASH_CHUNK_SIZE) as f:
+        shutil.copyfileobj(stream, f, HASH_CHUNK_SIZE)
+        size = f.tell()
+        f.seek(0)
+        print(_repo().objects.hash_stream(f, size, object_type, write))
+
+
+def hash_paths(
+    paths: Iterable[str], write: bool = False, object_type: str = "blob", jobs: int = None
+) -> None:
+    """Hash every file like hash_file and print the shas in the order of the
+    paths.
+
+    The files are hashed on a pool of jobs threads (the number of cores by
+    default), which run in parallel since hashlib and zlib release the GIL
+    while working on large buffers. Paths are consumed as they come and only a
+    few per thread are in flight at a time.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    objects = _repo().objects
+
+    def hash_path(path: str) -> str:
+        with open(path, "rb") as f:
+            return objects.hash_stream(f, os.fstat(f.fileno()).st_size, object_type, write)
 
-def ls_files() -> None:
-    """List all files in the index."""
-    idx = _index()
-    for entry in idx.get_entries():
-        print(entry)
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        pending: Deque[concurrent.futures.Future] = collections.deque()
+        for path in paths:
+            pending.append(executor.submit(hash_path, path))
+            if len(pending) >= 4 * jobs:
+                print(pending.popleft().result())
+
+        while pending:
+            print(pending.popleft().result())
+
+
+def ls_files(sparse: bool = False) -> None:
+    """List all files in the index.
+
+    Keyword args:
+    sparse -- list the directories outside the sparse-checkout as the single
+    entries they are in the index, instead of every file in them.
+    """
+    repo = _repo()
+    idx = repo.index()
+    if not sparse:
+        idx.expand(repo.objects.tree)
+    table = idx.table
+    for position in range(len(table)):
+        print(
+            "%s %s %d\t%s"
+            % (
+                "%06o" % table.mode[position],
+                table.sha(position),
+                table.stage(position),
+                table.name(position),
+            )
+        )
 
 
 def update_index(mode: str, sha: str, filename: str) -> None:
     """Add the object (blob or tree) to the index with the mode and name."""
-    idx = _index()
+    repo = _repo()
+    idx = repo.index()
+
+    sha = repo.objects.resolve(sha)
+    idx.expand(repo.objects.tree, [filename])
+    cone = _sparse_checkout_cone(repo)
+    if cone is not None and not cone.includes(filename):
+        # the file isn't in the working tree, like the rest of its directory
+        entry = Index.Entry.from_object(mode, sha, filename, EXTENDED_SKIP_WORKTREE)
+    else:
+        entry = Index.Entry.create(mode, sha, filename)
+    idx.add_entry(entry)
+
+    repo.write_index(idx)
+
+
+def update_index_version(version: int) -> None:
+    """Rewrite the index in the given version, 4 prefix-compresses the names
+    of the entries which makes the index of deep trees a lot smaller."""
+    if version not in VERSIONS:
+        raise ValueError("index version %d isn't one of %s" % (version, VERSIONS))
+
+    repo = _repo()
+    idx = repo.index()
+    idx.version = version
+    repo.write_index(idx)
+
+
+def update_index_info(entries: Iterable[Tuple[str, str, str]]) -> None:
+    """Add many (mode, sha, filename) entries to the index, like update_index,
+    but reading and writing the index only once.
+
+    The entries are consumed as they come so they can be streamed from stdin.
+    Like git, the working tree isn't looked at: the entries have no stat data.
+    """
+    repo = _repo()
+    idx = repo.index()
+
+    sparse = idx.sparse
+    cone = _sparse_checkout_cone(repo)
+    for mode, sha, filename in entries:
+        # full shas are used as they are instead of listing their directory
+        sha = sha if len(sha) == 40 else repo.objects.resolve(sha)
+        if sparse:
+            idx.expand(repo.objects.tree, [filename])
+        skip = cone is not None and not cone.includes(filename)
+        extended = EXTENDED_SKIP_WORKTREE if skip else 0
+        idx.add_entry(Index.Entry.from_object(mode, sha, filename, extended))
+
+    repo.write_index(idx)
+
 
-    idx.add_entry(Index.Entry.create(mode, _resolve_object_sha(sha), filename))
+def status(refresh: bool = True, jobs: int = None) -> None:
+    """Print the files whose content in the working tree differs from the
+    index, as ' M {name}' or ' D {name}' like git status --short.
 
-    with open(_git_path("index"), "wb") as f:
-        f.write(idx.pack())
+    See diff_files for the keyword args, unlike diff-files the refreshed stat
+    data is written back by default, just like git status does.
+    """
+    for change in _diff_worktree(refresh, jobs):
+        print(" %s %s" % (change.status, change.name))
+
+
+def diff_files(refresh: bool = False, jobs: int = None) -> None:
+    """Print the files whose content in the working tree differs from the
+    index in git diff-files' raw format:
+
+    :{index mode} {worktree mode} {index sha} {zero sha} {status}\t{name}
+
+    Keyword args:
+    refresh -- write the stat data of files whose content turned out to be
+    unchanged to the index, so they aren't hashed the next time.
+    jobs -- threads to lstat and hash the files on.
+    """
+    for change in _diff_worktree(refresh, jobs):
+        modes = "%06o %06o" % (change.index_mode, change.mode)
+        print(":%s %s %s %s\t%s" % (modes, change.index_sha, "0" * 40, change.status, change.name))
+
+
+def _worktree_hasher(objects: ObjectDatabase) -> HashFile:
+    """Return a function hashing the files of the working tree for WorktreeDiff."""
+
+    def hash_file(path: str, st: os.stat_result, mode: int) -> str:
+        if mode == MODE_SYMLINK:
+            return objects.hash(os.fsencode(os.readlink(path)))
+
+        with open(path, "rb") as f:
+            return objects.hash_stream(f, os.fstat(f.fileno()).st_size)
+
+    return hash_file
+
+
+def _diff_worktree(refresh: bool, jobs: Optional[int]) -> List[Change]:
+    from . import fsmonitor
+
+    repo = _repo()
+    hash_file = _worktree_hasher(repo.objects)
+
+    # the index's mtime is taken before reading it, an index written in
+    # between only makes more entries look racy
+    index_mtime_ns = os.stat(repo.git_path("index")).st_mtime_ns
+    idx = repo.index()
+    table = idx.table
+
+    # the daemon is asked before the working tree is looked at, so whatever
+    # changes during the comparison is reported the next time
+    positions = None
+    token = idx.fsmonitor.token if idx.fsmonitor is not None else ""
+    response = fsmonitor.query(repo.git_path(fsmonitor.SOCKET_NAME), token)
+    if response is not None:
+        token, paths = response
+        if paths is not None and idx.fsmonitor is not None:
+            positions = sorted(idx.fsmonitor.dirty.union(_positions_under(table, paths)))
+
+    diff = WorktreeDiff(repo.path, table, index_mtime_ns, hash_file, jobs)
+    with trace.region("worktree", "compare"):
+        changes = diff.run(positions)
+    trace.count("worktree/compared", len(table) if positions is None else len(positions))
+    trace.count("worktree/hashed", diff.hashed)
+    log.debug(
+        "compared %d entries, hashed %d files, %d need their stat data refreshed"
+        % (len(table) if positions is None else len(positions), diff.hashed, len(diff.refreshed))
+    )
+
+    # write_index smudges the racily clean entries, so they are hashed again
+    token_changed = response is not None and (idx.fsmonitor is None or idx.fsmonitor.token != token)
+    if refresh and (diff.refreshed or diff.hashed or token_changed):
+        for position, fields in diff.refreshed.items():
+            table.set_row(position, fields, table.sha_bytes(position), table.flags[position])
+        # without an answer the entries the daemon could report are unknown
+        idx.fsmonitor = None
+        if response is not None:
+            dirty = [table.find(change.name.encode()) for change in changes]
+            idx.fsmonitor = Index.FSMonitor(token, dirty)
+        repo.write_index(idx)
+
+    return changes
+
+
+def _positions_under(table: Index.Table, paths: Iterable[bytes]) -> Iterable[int]:
+    """Yield the positions of the entries at the paths or in directories at
+    the paths."""
+    for path in paths:
+        position = table.find(path)
+        if position is not None:
+            yield position
+
+        # the names in a directory sort between dir/ and dir0
+        start = table.bisect(path + b"/")
+        yield from range(start, table.bisect(path + b"0", start))
+
+
+def fsmonitor_run() -> None:
+    """Run the file system monitor daemon of the working tree in the
+    foreground, until it is stopped."""
+    from . import fsmonitor
 
+    repo = _repo()
+    fsmonitor.Daemon(repo.path, repo.git_path(fsmonitor.SOCKET_NAME)).run()
 
-def _index_entry_mode(entry: Index.Entry) -> str:
-    """Convert an index entry's mode_type and mode_permissions to a single mode string."""
-    return "%s%s" % (bin(entry.mode_type)[2:-1], oct(entry.mode_permissions)[2:])
+
+def fsmonitor_start(log_level: str = "info") -> None:
+    """Start the file system monitor daemon in the background, status then
+    only looks at the files it reports as changed.
+
+    The daemon logs at the log level to .git/pytt-fsmonitor.log, it keeps
+    none of the caller's standard streams open.
+    """
+    import subprocess
+
+    from . import fsmonitor
+
+    repo = _repo()
+    socket_path = repo.git_path(fsmonitor.SOCKET_NAME)
+    if fsmonitor.query(socket_path, "") is not None:
+        print("the fsmonitor daemon is already running")
+        return
+
+    # the daemon runs this same pytt, even when it isn't installed
+    env = dict(os.environ)
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_parent, env.get("PYTHONPATH")]))
+    env["NO_COLOR"] = "1"
+    log_path = repo.git_path(fsmonitor.LOG_NAME)
+    with open(log_path, "ab") as log_file:
+        subprocess.Popen(
+            [sys.executable, "-m", "pytt", "-l", log_level, "fsmonitor", "run"],
+            cwd=repo.path,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=log_file,
+            start_new_session=True,
+        )
+    # watching a large tree takes a while, it answers once it is done
+    deadline = time.monotonic() + 60
+    while fsmonitor.query(socket_path, "") is None:
+        if time.monotonic() > deadline:
+            log.fatal("the fsmonitor daemon didn't start, see %s" % log_path)
+            return
+        time.sleep(0.05)
+    print("started the fsmonitor daemon")
+
+
+def fsmonitor_stop() -> None:
+    """Stop the file system monitor daemon."""
+    from . import fsmonitor
+
+    if fsmonitor.stop(_repo().git_path(fsmonitor.SOCKET_NAME)):
+        print("stopped the fsmonitor daemon")
+    else:
+        print("the fsmonitor daemon isn't running")
+
+
+def fsmonitor_query(token: str) -> None:
+    """Print the daemon's current token and the paths which changed since
+    the token, or / if everything has to be looked at."""
+    from . import fsmonitor
+
+    response = fsmonitor.query(_repo().git_path(fsmonitor.SOCKET_NAME), token)
+    if response is None:
+        print("the fsmonitor daemon isn't running")
+        return
+
+    new_token, paths = response
+    print(new_token)
+    for path in [fsmonitor.EVERYTHING] if paths is None else paths:
+        print(os.fsdecode(path))
+
+
+def _index_entry_mode(mode: int) -> str:
+    """Convert an index entry's 32 bit mode to the mode string used in trees."""
+    return "%o" % mode
 
 
 def write_tree() -> None:
-    """Read the current index and create a new Tree object."""
-    idx = _index()
+    """Read the current index, create a Tree object for every directory in it
+    and print the sha of the root tree.
+
+    The trees of directories that are still valid in the index's cache-tree
+    are reused as they are, and the updated cache-tree is saved to the index.
+    """
+    repo = _repo()
+    idx = repo.index()
+    table = idx.table
+
+    idx.cache_tree = _write_tree_level(repo.objects, table, 0, len(table), "", idx.cache_tree)
+    repo.write_index(idx)
+
+    print(idx.cache_tree.sha)
 
+
+def _write_tree_level(
+    objects: ObjectDatabase,
+    table: Index.Table,
+    start: int,
+    end: int,
+    prefix: str,
+    cached: Optional[Index.CacheTree],
+    name: str = "",
+) -> Index.CacheTree:
+    """Write the tree of the directory prefix, whose entries are the rows
+    start:end, and return its cache-tree."""
+    if cached is not None and cached.valid and cached.entry_count == end - start:
+        return cached
+    if end - start == 1 and table.name(start) == prefix:
+        # a sparse directory entry already has the tree's sha
+        return Index.CacheTree(name, 1, table.sha(start))
+
+    cache_tree = Index.CacheTree(name, end - start)
     tree_entries = []
-    for entry in idx.get_entries():
-        tree_entries.append(Tree.Entry(entry.name, entry.sha, _index_entry_mode(entry)))
+    position = start
+    while position < end:
+        entry_name = table.name(position)[len(prefix) :]
+        directory, slash, _ = entry_name.partition("/")
+        if not slash:
+            mode = _index_entry_mode(table.mode[position])
+            tree_entries.append(Tree.Entry(entry_name, table.sha(position), mode))
+            position += 1
+            continue
+
+        # the entries of a directory are contiguous and end before the first
+        # name sorting after "{directory}/", i.e. "{directory}0"
+        directory_end = table.bisect(("%s%s0" % (prefix, directory)).encode(), position, end)
+        subtree = _write_tree_level(
+            objects,
+            table,
+            position,
+            directory_end,
+            "%s%s/" % (prefix, directory),
+            cached.subtrees.get(directory) if cached is not None else None,
+            directory,
+        )
+        cache_tree.subtrees[directory] = subtree
+        tree_entries.append(Tree.Entry(directory, subtree.sha, "40000"))
+        position = directory_end
 
-    tree_object = Tree(tree_entries)
-    hash_object(tree_object.pack(), write=True, object_type="tree")
+    cache_tree.sha = objects.write(Tree(tree_entries).pack(), "tree")
+    return cache_tree
+
+
+def sparse_checkout_set(directories: List[str]) -> None:
+    """Restrict the working tree to the cone of the directories, see Cone.
+
+    The files which enter the cone are checked out, the ones which leave it
+    are removed from the working tree, unless they were modified, and every
+    directory with no file in the cone is collapsed into a single sparse
+    directory entry in the index. The commands which read the index then
+    only pay for the files in the cone.
+    """
+    repo = _repo()
+    cone = Cone(directories)
+    idx = repo.index()
+    table = idx.table
+    # only the sparse directories which the cone reaches into are expanded
+    idx.expand(
+        repo.objects.tree,
+        [
+            table.name(position)
+            for position in range(len(table))
+            if table.mode[position] == MODE_SPARSE_DIRECTORY
+            and cone.includes_directory(table.name(position)[:-1])
+        ],
+    )
+    _update_sparse_checkout(repo, idx, cone.includes)
+    idx.sparsify(cone.includes_directory)
+
+    cone.write(repo.git_path(SPARSE_CHECKOUT_FILE))
+    repo.write_index(idx)
+
+
+def sparse_checkout_list() -> None:
+    """Print the directories of the sparse-checkout's cone."""
+    try:
+        cone = Cone.read(_repo().git_path(SPARSE_CHECKOUT_FILE))
+    except ValueError as e:
+        log.fatal(e)
+        return
+
+    if cone is None:
+        print("the sparse-checkout isn't enabled")
+        return
+
+    for directory in sorted(cone.recursive):
+        print(directory)
+
+
+def sparse_checkout_disable() -> None:
+    """Check out every file again and expand the index in full."""
+    repo = _repo()
+    idx = repo.index()
+    idx.expand(repo.objects.tree)
+    _update_sparse_checkout(repo, idx, lambda path: True)
+
+    try:
+        os.remove(repo.git_path(SPARSE_CHECKOUT_FILE))
+    except FileNotFoundError:
+        pass
+    repo.write_index(idx)
+
+
+def _sparse_checkout_cone(repo: Repository) -> Optional[Cone]:
+    """Return the cone of the sparse-checkout, None if there is none or its
+    patterns aren't cone patterns."""
+    try:
+        return Cone.read(repo.git_path(SPARSE_CHECKOUT_FILE))
+    except ValueError as e:
+        log.warning("ignoring the sparse-checkout: %s" % e)
+        return None
+
+
+def _update_sparse_checkout(repo: Repository, idx: Index, includes: Callable[[str], bool]) -> None:
+    """Make the working tree and the skip-worktree flags of the expanded
+    entries match the files which includes says are in the sparse-checkout,
+    and write the trees of the directories which were expanded."""
+    table = idx.table
+    entering = []
+    leaving = []
+    for position in range(len(table)):
+        if table.stage(position) or table.mode[position] == MODE_SPARSE_DIRECTORY:
+            continue
+        included = includes(table.name(position))
+        if included and table.skip_worktree(position):
+            entering.append(position)
+        elif not included and not table.skip_worktree(position):
+            leaving.append(position)
+
+    for position in entering:
+        if _check_out(repo, table, position):
+            table.extended[position] &= ~EXTENDED_SKIP_WORKTREE
+
+    # files with changes which aren't in the index stay, like in git
+    index_mtime_ns = os.stat(repo.git_path("index")).st_mtime_ns
+    diff = WorktreeDiff(repo.path, table, index_mtime_ns, _worktree_hasher(repo.objects))
+    modified = {change.name for change in diff.run(leaving) if change.status == "M"}
+    for position in leaving:
+        name = table.name(position)
+        if name in modified:
+            log.warning("not removing %s from the working tree, it has changes" % name)
+            continue
+        path = os.path.join(repo.path, name)
+        if table.mode[position] == MODE_GITLINK:
+            # only the empty directory of a submodule which isn't checked out
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+        elif os.path.lexists(path):
+            os.remove(path)
+            # the directories which are left empty go too
+            try:
+                os.removedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        table.extended[position] |= EXTENDED_SKIP_WORKTREE
+    log.debug("checked out %d files, removed %d" % (len(entering), len(leaving) - len(modified)))
+
+    # the positions of the dirty entries may have been entries leaving
+    idx.fsmonitor = None
+    idx.cache_tree = _write_tree_level(repo.objects, table, 0, len(table), "", idx.cache_tree)
+
+
+def _check_out(repo: Repository, table: Index.Table, position: int) -> bool:
+    """Write the entry's file to the working tree and its stat data to the
+    entry. Return False if there already is a file, which is left alone."""
+    name = table.name(position)
+    path = os.path.join(repo.path, name)
+    if os.path.lexists(path):
+        log.warning("not checking out %s, there already is a file" % name)
+        return False
+
+    mode = table.mode[position]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if mode == MODE_GITLINK:
+        # submodules aren't checked out, git leaves an empty directory
+        os.mkdir(path)
+        return True
+
+    _, data = repo.objects.read(table.sha(position))
+    if mode == MODE_SYMLINK:
+        os.symlink(os.fsdecode(data), path)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+        if mode == MODE_EXECUTABLE:
+            os.chmod(path, 0o755)
+
+    fields = stat_fields(os.lstat(path), mode)
+    table.set_row(position, fields, table.sha_bytes(position), table.flags[position])
+    return True
 
 
 def commit_tree(tree: str, message: str, parent: str = None) -> None:
     """With the given tree, message and optionally parent create a new commit object and save it."""
-    tree = _resolve_object_sha(tree)
-    parent = _resolve_object_sha(parent)
-    c = Commit(tree, [parent], message)
+    repo = _repo()
+    tree = repo.objects.resolve(tree)
+    parents = [repo.objects.resolve(parent)] if parent else []
+    c = Commit(tree, parents, message)
     hash_object(c.pack(), write=True, object_type="commit")
 
 
+def rev_parse(name: str, short: int = None) -> None:
+    """Print the full sha of the object the (abbreviated) name refers to, or
+    its shortest unique abbreviation of at least short characters.
+
+    The name can also be HEAD, a ref or a branch or tag name, see
+    Repository.resolve."""
+    repo = _repo()
+    objects = repo.objects
+    sha = repo.resolve(name)
+    if not objects.exists(sha):
+        raise FileNotFoundError("object %s not found" % name)
+
+    print(objects.names.shortest_unique(sha, short) if short else sha)
+
+
 def update_ref(ref: str, sha: str) -> None:
     """Update the ref to the given sha."""
-    sha = _resolve_object_sha(sha)
-    with open(_git_path(ref), "w") as f:
-        f.write(sha)
+    _repo().update_ref(ref, sha)
+
+
+def diff_tree(
+    old: str,
+    new: str = None,
+    recursive: bool = False,
+    find_renames: Optional[int] = None,
+    patch: bool = False,
+    algorithm: str = "myers",
+) -> None:
+    """Print how the tree of new differs from the tree of old in git
+    diff-tree's raw format. Either is a tree or something which points to
+    one, e.g. a commit or a tag.
+
+    When only old is given it has to be a commit, it is then compared to its
+    first parent and its sha is printed first.
+
+    Keyword args:
+    recursive -- list the changed files in changed subtrees instead of the
+    subtrees themselves.
+    find_renames -- pair deleted and added files which are at least this
+    similar in percent as renames.
+    patch -- print the changes as git's unified diffs instead, implies
+    recursive.
+    algorithm -- the line diff of patch, myers or histogram.
+    """
+    repo = _repo()
+    recursive = recursive or patch
+    if new is None:
+        commit_sha = repo.resolve_commit(old)
+        commit = repo.objects.commit(commit_sha)
+        old_tree = repo.objects.commit(commit.parents[0]).tree if commit.parents else None
+        new_tree = commit.tree
+        print(commit_sha)
+    else:
+        old_tree = _tree_sha(repo, old)
+        new_tree = _tree_sha(repo, new)
+
+    diff = TreeDiff(repo.objects.tree, recursive)
+    with trace.region("diff", "tree"):
+        changes = diff.diff(old_tree, new_tree)
+    trace.count("diff/trees_read", diff.trees_read)
+    log.debug("read %d trees for %d changes" % (diff.trees_read, len(changes)))
+
+    if find_renames is not None:
+        detector = RenameDetector(lambda sha: repo.objects.read(sha)[1], find_renames)
+        with trace.region("diff", "renames"):
+            changes = detector.detect(changes)
+        trace.count("diff/rename_pairs_scored", detector.scored)
+        log.debug("scored %d pairs of files for renames" % detector.scored)
+
+    if not patch:
+        for change in changes:
+            print(change)
+        return
+
+    sys.stdout.flush()
+    out = sys.stdout.buffer
+    for change in changes:
+        if change.status == "T":
+            # a type change is shown as a deletion and an addition
+            deleted = change._replace(status="D", new_mode="0", new_sha=NULL_SHA)
+            added = change._replace(status="A", old_mode="0", old_sha=NULL_SHA)
+            out.writelines(_patch(repo.objects, deleted, algorithm))
+            out.writelines(_patch(repo.objects, added, algorithm))
+        else:
+            out.writelines(_patch(repo.objects, change, algorithm))
+    out.flush()
+
+
+def _patch(objects: ObjectDatabase, change: TreeChange, algorithm: str) -> Iterable[bytes]:
+    """Yield the lines of git's patch of the change."""
+    old_path = change.old_path.encode("utf-8", "surrogateescape")
+    new_path = change.new_path.encode("utf-8", "surrogateescape")
+    yield b"diff --git a/%s b/%s\n" % (old_path, new_path)
+
+    same_mode = change.old_mode == change.new_mode
+    if change.status == "A":
+        yield b"new file mode %06o\n" % int(change.new_mode, 8)
+    elif change.status == "D":
+        yield b"deleted file mode %06o\n" % int(change.old_mode, 8)
+    elif not same_mode:
+        yield b"old mode %06o\n" % int(change.old_mode, 8)
+        yield b"new mode %06o\n" % int(change.new_mode, 8)
+    if change.status == "R":
+        yield b"similarity index %d%%\n" % change.score
+        yield b"rename from %s\n" % old_path
+        yield b"rename to %s\n" % new_path
+    if change.old_sha == change.new_sha:
+        return
+
+    yield b"index %s..%s%s\n" % (
+        _abbreviate(objects, change.old_sha).encode(),
+        _abbreviate(objects, change.new_sha).encode(),
+        b" %06o" % int(change.old_mode, 8) if same_mode and change.status != "A" else b"",
+    )
+
+    old = _patch_content(objects, change.old_sha, change.old_mode)
+    new = _patch_content(objects, change.new_sha, change.new_mode)
+    old_name = b"a/" + old_path if change.status != "A" else b"/dev/null"
+    new_name = b"b/" + new_path if change.status != "D" else b"/dev/null"
+    if b"\0" in old[:8000] or b"\0" in new[:8000]:
+        yield b"Binary files %s and %s differ\n" % (old_name, new_name)
+        return
+
+    from . import blobdiff
+
+    hunks = blobdiff.unified_diff(old, new, algorithm=algorithm)
+    first = next(hunks, None)
+    if first is None:
+        return
+    yield b"--- %s\n" % old_name
+    yield b"+++ %s\n" % new_name
+    yield first
+    yield from hunks
+
+
+def _patch_content(objects: ObjectDatabase, sha: str, mode: str) -> bytes:
+    if sha == NULL_SHA:
+        return b""
+    if mode == "160000":
+        return b"Subproject commit %s\n" % sha.encode()
+    return objects.read(sha)[1]
+
+
+def _abbreviate(objects: ObjectDatabase, sha: str) -> str:
+    if sha == NULL_SHA:
+        return sha[:7]
+    return objects.names.shortest_unique(sha, 7)
+
+
+def _tree_sha(repo: Repository, name: str) -> str:
+    """Return the sha of the tree the name refers to, directly or through a
+    commit."""
+    sha, object_type, _ = repo.peel(repo.resolve(name))
+    if object_type == "commit":
+        return repo.objects.commit(sha).tree
+    if object_type != "tree":
+        raise ValueError("%s is a %s, not a tree" % (name, object_type))
+
+    return sha
+
+
+def pack_objects(
+    objects: List[Tuple[str, str]] = None,
+    window: int = 10,
+    depth: int = 50,
+    processes: int = 1,
+    verify: bool = False,
+) -> List[str]:
+    """Write the objects into a single packfile and print its name.
+
+    Objects are given as (sha, name) tuples, where the name is the path of the
+    object used to find similar objects to delta against. If no objects are
+    given all loose objects are packed, naming them from the trees among them.
+
+    Keyword args:
+    window -- how many objects before each object to try as delta base.
+    depth -- the maximum delta chain length.
+    processes -- how many processes to split the delta search across.
+    verify -- compare the result with the output of `git verify-pack -v`.
+
+    Returns the shas of the packed objects.
+    """
+    repo = _repo()
+    if objects is None:
+        objects = [(sha, "") for sha in repo.objects.loose_objects()]
+
+    # only the headers are read up front, the writer reads the data when it
+    # needs it so that not every object is held in memory at once
+    writer = PackWriter(
+        window, depth, processes, read=lambda sha: repo.objects.read(sha.hex())[1]
+    )
+    names: Dict[str, str] = {}
+    for sha, name in objects:
+        sha = repo.objects.resolve(sha)
+        object_type, size = repo.objects.read_header(sha)
+        writer.add(bytes.fromhex(sha), object_type, None, name, size)
+        if object_type == "tree":
+            for entry in Tree.iter_entries(repo.objects.read(sha)[1]):
+                names.setdefault(entry.sha, entry.name)
+
+    for sha, name in names.items():
+        packed = writer.entries.get(bytes.fromhex(sha))
+        if packed is not None and not packed.name:
+            packed.name = name
+
+    path = writer.write(repo.git_path("objects/pack"))
+    print(os.path.basename(path)[len("pack-") : -len(".pack")])
+
+    if verify:
+        diff = writer.verify(path)
+        for line in diff:
+            log.error(line)
+        if not diff:
+            log.info("verify-pack matches the %d written objects" % len(writer.entries))
+
+    return [sha.hex() for sha in writer.entries]
+
+
+def repack(delete: bool = False, **kwargs) -> None:
+    """Pack all loose objects, see pack_objects for the keyword args.
+
+    Keyword args:
+    delete -- remove the loose objects once they are packed.
+    """
+    loose = _repo().objects.loose_objects()
+    if not loose:
+        print("Nothing new to pack.")
+        return
+
+    packed = pack_objects([(sha, "") for sha in loose], **kwargs)
+
+    if delete:
+        for sha in packed:
+            path = _repo().objects.object_path(sha)
+            os.remove(path)
+            if not os.listdir(os.path.dirname(path)):
+                os.rmdir(os.path.dirname(path))
+
+
+def write_commit_graph() -> None:
+    """Write the commit-graph file for all commits reachable from the refs
+    and print how many commits it holds."""
+    repo = _repo()
+    writer = CommitGraphWriter()
+    pending = list(repo.refs().values())
+    seen = set()
+    while pending:
+        sha = pending.pop()
+        if sha in seen:
+            continue
+        seen.add(sha)
+
+        sha, object_type, data = repo.peel(sha)
+        if object_type != "commit" or bytes.fromhex(sha) in writer.commits:
+            continue
+
+        commit = Commit.unpack(data)
+        writer.add(
+            bytes.fromhex(sha),
+            bytes.fromhex(commit.tree),
+            [bytes.fromhex(parent) for parent in commit.parents],
+            int(commit.committer.date_s),
+        )
+        pending.extend(commit.parents)
+
+    writer.write(repo.git_path("objects/info/commit-graph"))
+    print("wrote %d commits to the commit-graph" % len(writer))
+
+
+def _graph_position(repo: Repository, graph: Optional[CommitGraph], name: str) -> int:
+    """Return the position of the named commit in the commit-graph.
+
+    Raises ValueError if there is no commit-graph or the commit isn't in it.
+    """
+    sha = repo.resolve(name)
+    if graph is None:
+        raise ValueError("no commit-graph, write one with `pytt commit-graph write`")
+
+    position = graph.position(bytes.fromhex(sha))
+    if position is None and repo.objects.read_header(sha)[0] == "tag":
+        sha = repo.peel(sha)[0]
+        position = graph.position(bytes.fromhex(sha))
+    if position is None:
+        raise ValueError(
+            "commit %s isn't in the commit-graph, write it again with"
+            " `pytt commit-graph write`" % sha
+        )
+
+    return position
+
+
+def is_ancestor(ancestor: str, descendant: str) -> bool:
+    """Return True if ancestor can be reached from descendant."""
+    repo = _repo()
+    graph = repo.commit_graph()
+    return graph.is_ancestor(
+        _graph_position(repo, graph, ancestor), _graph_position(repo, graph, descendant)
+    )
+
+
+def merge_base(one: str, two: str, all_bases: bool = False) -> None:
+    """Print the best common ancestor of the two commits, or all of them."""
+    repo = _repo()
+    graph = repo.commit_graph()
+    bases = graph.merge_base(
+        _graph_position(repo, graph, one), _graph_position(repo, graph, two)
+    )
+    for base in bases if all_bases else bases[:1]:
+        print(graph.sha(base).hex())
+
+
+def rev_list(revisions: List[str], **kwargs) -> None:
+    """Print the shas of the commits reachable from the revisions, newest
+    first, see _walk for the revision syntax and the keyword args."""
+    for sha in _walk(revisions, **kwargs):
+        print(sha)
+
+
+def log_commits(revisions: List[str], **kwargs) -> None:
+    """Print the commits reachable from the revisions like git log does,
+    see _walk for the revision syntax and the keyword args."""
+    objects = _repo().objects
+    for i, sha in enumerate(_walk(revisions or ["HEAD"], **kwargs)):
+        commit = objects.commit(sha)
+        if i:
+            print()
+
+        print("commit %s" % sha)
+        if len(commit.parents) > 1:
+            print(
+                "Merge: %s"
+                % " ".join(objects.names.shortest_unique(parent, 7) for parent in commit.parents)
+            )
+        print(
+            "Author: %s <%s>"
+            % (
+                commit.author.name.decode("utf-8", "replace"),
+                commit.author.email.decode("utf-8", "replace"),
+            )
+        )
+        print("Date:   %s" % _format_date(commit.author))
+        print()
+        for line in commit.message.rstrip("\n").split("\n"):
+            print("    %s" % line)
+
+
+def _format_date(author: Commit.Author) -> str:
+    """Format the date like git's default date format, in the author's timezone."""
+    import datetime
+
+    timezone = author.date_timezone.decode()
+    offset = int(timezone[1:3]) * 60 + int(timezone[3:5])
+    date = datetime.datetime.fromtimestamp(
+        int(author.date_s),
+        datetime.timezone(datetime.timedelta(minutes=-offset if timezone[0] == "-" else offset)),
+    )
+    # the day isn't padded, e.g. Tue Nov 7 22:13:20 2023 +0000
+    return "%s %d %s %s" % (
+        date.strftime("%a %b"), date.day, date.strftime("%H:%M:%S %Y"), timezone
+    )
+
+
+def _walk(
+    revisions: List[str],
+    max_count: int = None,
+    first_parent: bool = False,
+    order: str = "date",
+) -> RevWalk:
+    """Return a walk over the commits reachable from the revisions.
+
+    A revision is a name, ^name to exclude the commits reachable from the name
+    or A..B for B excluding A, where a left out A or B is HEAD.
+
+    Keyword args:
+    max_count -- stop after this many commits.
+    first_parent -- only follow the first parent of merges.
+    order -- list newest first by "date" like git, or by "generation" which
+    stays right even when commit times are skewed.
+    """
+    repo = _repo()
+    include = []
+    exclude = []
+    for revision in revisions:
+        if ".." in revision:
+            excluded, _, included = revision.partition("..")
+            exclude.append(repo.resolve_commit(excluded or "HEAD"))
+            include.append(repo.resolve_commit(included or "HEAD"))
+        elif revision.startswith("^"):
+            exclude.append(repo.resolve_commit(revision[1:]))
+        else:
+            include.append(repo.resolve_commit(revision))
+
+    return RevWalk(repo.commit_lookup(), include, exclude, max_count, first_parent, order)
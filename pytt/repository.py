@@ -0,0 +1,553 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import zlib
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from . import trace
+from .commit_graph import CommitGraph
+from .delta import LRUCache
+from .index import Index
+from .names import ObjectNames
+from .object import Commit, Tree
+from .pack import Pack
+from .revwalk import GENERATION_INFINITY, CommitLookup
+
+log = logging.getLogger("pytt")
+
+# How much of a file is read at a time when hashing it, see
+# ObjectDatabase.hash_stream.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# How much raw content the decoded trees and commits kept around by an
+# ObjectDatabase may add up to.
+DECODED_CACHE_SIZE = 32 * 1024 * 1024
+
+# The refs directly in the git directory, every other ref is under refs/.
+PSEUDO_REFS = ("HEAD", "ORIG_HEAD", "FETCH_HEAD", "MERGE_HEAD")
+
+# What a ref has to hold, unless it is a symbolic ref.
+FULL_SHA = re.compile("^[0-9a-f]{40}$")
+
+Decoded = TypeVar("Decoded", Tree, Commit)
+
+
+class ObjectDatabase:
+    """The objects of a repository, loose and packed.
+
+    Packs are mmap'd once and kept open, and the list of packs is only read
+    again when the pack directory changes. Decoded trees and commits are kept
+    in an LRUCache of cache_size bytes, so walking the same trees and
+    history again doesn't read and parse them again. The cached objects are
+    shared, treat them as read-only.
+
+    Examples
+    --------
+    >>> objects = ObjectDatabase(".git/objects")
+    >>> sha = objects.write(b"hello", "blob")
+    >>> objects.read(sha)
+    ('blob', b'hello')
+    """
+
+    def __init__(self, path: str, cache_size: int = DECODED_CACHE_SIZE) -> None:
+        self.path = path
+        self.names = ObjectNames(path, self.packs)
+
+        self._open_packs: Dict[str, Pack] = {}
+        self._pack_list: Tuple[Optional[int], List[Pack]] = (None, [])
+        # packs can be read from several threads, only listing them is locked
+        self._packs_lock = threading.Lock()
+        self._decoded = LRUCache(cache_size)
+
+    def object_path(self, sha: str) -> str:
+        """Return the path of the loose object with the full sha."""
+        return os.path.join(self.path, sha[:2], sha[2:])
+
+    def packs(self) -> List[Pack]:
+        """Return all packfiles, each is only opened once."""
+        directory = os.path.join(self.path, "pack")
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        if mtime == self._pack_list[0]:
+            return self._pack_list[1]
+
+        with self._packs_lock:
+            if mtime == self._pack_list[0]:
+                return self._pack_list[1]
+
+            packs = []
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith(".pack"):
+                    continue
+
+                path = os.path.join(directory, filename)
+                # the .idx is written before the .pack is renamed into place, a
+                # pack without one is still being written or was left broken
+                if not os.path.isfile(path[: -len(".pack")] + ".idx"):
+                    continue
+                if path not in self._open_packs:
+                    self._open_packs[path] = Pack(path)
+                packs.append(self._open_packs[path])
+
+            self._pack_list = (mtime, packs)
+            return packs
+
+    def loose_objects(self) -> List[str]:
+        """Return the shas of all loose objects."""
+        shas = []
+        for directory in sorted(os.listdir(self.path)):
+            if not re.match("^[0-9a-f]{2}$", directory):
+                continue
+
+            for filename in sorted(os.listdir(os.path.join(self.path, directory))):
+                shas.append("%s%s" % (directory, filename))
+
+        return shas
+
+    def resolve(self, sha: str) -> str:
+        """If one and only one object exists starting with the sha, return that
+        objects full sha. Allows giving only the shortest sha describing an object.
+
+        Raises ValueError if more than one object starts with the sha.
+        """
+        matches = self.names.find(sha)
+
+        if len(matches) > 1:
+            log.fatal(
+                "short sha %s is ambiguous, the candidates are:\n%s"
+                % (sha, "\n".join(sorted(matches)))
+            )
+            raise ValueError("ambiguous sha %s" % sha)
+
+        if len(matches) == 1:
+            return matches[0]
+
+        return sha
+
+    def read(self, sha: str) -> Tuple[str, bytes]:
+        """Return the type and content of the object, read from the loose object
+        if there is one and otherwise from the packfiles."""
+        sha = sha if len(sha) == 40 else self.resolve(sha)
+        if len(sha) != 40:
+            raise FileNotFoundError("object %s not found" % sha)
+
+        trace.count("object/read")
+        obj = self.read_loose(sha)
+        if obj is None:
+            obj = self.read_packed(sha)
+        if obj is None:
+            raise FileNotFoundError("object %s not found" % sha)
+
+        return obj
+
+    def read_loose(self, sha: str) -> Optional[Tuple[str, bytes]]:
+        """Return the type and content of the loose object with the full sha,
+        or None if it isn't loose. Only the object's own file is touched, so
+        it is safe to call from several threads at once."""
+        try:
+            with open(self.object_path(sha), "rb") as f:
+                content = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+        trace.count("object/loose")
+        trace.count("zlib/inflated_bytes", len(content))
+        [header, data] = content.split(b"\0", 1)
+        return header.split(b" ", 1)[0].decode(), data
+
+    def read_packed(self, sha: str) -> Optional[Tuple[str, bytes]]:
+        """Return the type and content of the object with the full sha from
+        the packfiles, or None if it isn't packed."""
+        binary_sha = bytes.fromhex(sha)
+        for pack in self.packs():
+            obj = pack.read(binary_sha)
+            if obj is not None:
+                return obj
+
+        return None
+
+    def read_header(self, sha: str) -> Tuple[str, int]:
+        """Return the type and size of the object without reading all of it."""
+        sha = sha if len(sha) == 40 else self.resolve(sha)
+
+        path = self.object_path(sha)
+        if os.path.isfile(path):
+            decompressor = zlib.decompressobj()
+            header = b""
+            with open(path, "rb") as f:
+                while b"\0" not in header and not decompressor.eof:
+                    chunk = f.read(64)
+                    if not chunk:
+                        break
+                    header += decompressor.decompress(chunk)
+
+            object_type, size = header.split(b"\0", 1)[0].split(b" ")
+            return object_type.decode(), int(size)
+
+        if len(sha) == 40:
+            binary_sha = bytes.fromhex(sha)
+            for pack in self.packs():
+                header = pack.read_header(binary_sha)
+                if header is not None:
+                    return header
+
+        raise FileNotFoundError("object %s not found" % sha)
+
+    def exists(self, sha: str) -> bool:
+        """Check if the object with the full sha is stored, loose or packed.
+
+        Anything which isn't a full sha, e.g. a ref name, doesn't exist.
+        """
+        try:
+            binary_sha = bytes.fromhex(sha)
+        except ValueError:
+            return False
+        if len(binary_sha) != 20:
+            return False
+
+        if os.path.isfile(self.object_path(sha)):
+            return True
+
+        return any(binary_sha in pack for pack in self.packs())
+
+    def hash(self, data: bytes, object_type: str = "blob") -> str:
+        """Return the sha of the object without saving it."""
+        return _object_content(data, object_type)[0]
+
+    def write(self, data: bytes, object_type: str = "blob") -> str:
+        """Save the object, unless it is already stored, and return its sha."""
+        sha, content = _object_content(data, object_type)
+
+        if not self.exists(sha):
+            path = self.object_path(sha)
+            _ensure_directory(path)
+
+            with open(path, "wb") as f:
+                f.write(zlib.compress(content))
+
+        return sha
+
+    def hash_stream(
+        self, f: BinaryIO, size: int, object_type: str = "blob", write: bool = False
+    ) -> str:
+        """Hash the size bytes read from f as an object and return its sha.
+
+        If write is set and the object doesn't exist yet, f is read a second
+        time to compress it into a temporary file which is then renamed into
+        place. Hashing is much cheaper than compressing, so objects that
+        already exist only cost the first pass.
+        """
+        header = b"%s %d\0" % (object_type.encode(), size)
+        sha = _hash_chunks(f, size, hashlib.sha1(header))
+        if not write or self.exists(sha):
+            return sha
+
+        import tempfile
+
+        f.seek(0)
+        fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=self.path)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                compressor = zlib.compressobj()
+                tmp.write(compressor.compress(header))
+                written_sha = _hash_chunks(f, size, hashlib.sha1(header), tmp, compressor)
+                tmp.write(compressor.flush())
+
+            if written_sha != sha:
+                raise ValueError("content changed while being hashed")
+
+            path = self.object_path(sha)
+            _ensure_directory(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return sha
+
+    def tree(self, sha: str) -> Tree:
+        """Return the decoded tree, from the cache if it was decoded before."""
+        return self._decoded_object(sha, "tree", Tree.unpack)
+
+    def commit(self, sha: str) -> Commit:
+        """Return the decoded commit, from the cache if it was decoded before."""
+        return self._decoded_object(sha, "commit", Commit.unpack)
+
+    def _decoded_object(
+        self, sha: str, object_type: str, unpack: Callable[[bytes], Decoded]
+    ) -> Decoded:
+        sha = sha if len(sha) == 40 else self.resolve(sha)
+        obj = self._decoded.get(sha)
+        if obj is not None:
+            return obj
+
+        found_type, data = self.read(sha)
+        if found_type != object_type:
+            raise ValueError("%s is a %s, not a %s" % (sha, found_type, object_type))
+
+        obj = unpack(data)
+        self._decoded.put(sha, obj, len(data))
+        return obj
+
+    def close(self) -> None:
+        for pack in self._open_packs.values():
+            pack.close()
+        self._open_packs.clear()
+        self._pack_list = (None, [])
+        self._decoded.clear()
+
+
+class Repository:
+    """A git repository whose working tree is at path and git directory at
+    path/.git.
+
+    Everything that is expensive to open -- the packs, the object name index,
+    the commit-graph and the decoded objects -- is kept open by the repository,
+    so a long-running process should keep one around instead of creating one
+    per call.
+
+    Examples
+    --------
+    >>> repo = Repository("/path/to/repo")
+    >>> commit = repo.objects.commit(repo.resolve("HEAD"))
+    >>> repo.objects.tree(commit.tree).entries
+    """
+
+    def __init__(self, path: str = ".", cache_size: int = DECODED_CACHE_SIZE) -> None:
+        self.path = path
+        self.git_dir = os.path.join(path, ".git")
+        self.objects = ObjectDatabase(self.git_path("objects"), cache_size)
+
+        # the commit-graph is opened again only if the file changes
+        self._commit_graph_file: Tuple[Optional[int], Optional[CommitGraph]] = (None, None)
+
+    def git_path(self, path: str) -> str:
+        """Return the path to the file in the git-directory."""
+        return os.path.join(self.git_dir, path)
+
+    def resolve(self, name: str) -> str:
+        """Return the full sha the name refers to, where the name is HEAD, a ref
+        like refs/heads/master, a branch or tag name or an (abbreviated) sha.
+
+        Raises FileNotFoundError if the name is neither a ref nor the start of
+        an object's sha, and ValueError if it is the start of several.
+        """
+        for ref in (name, "refs/%s" % name, "refs/tags/%s" % name, "refs/heads/%s" % name):
+            sha = self.read_ref(ref)
+            if sha is not None:
+                return sha
+
+        sha = self.objects.resolve(name)
+        if not FULL_SHA.match(sha):
+            raise FileNotFoundError("unknown revision %s" % name)
+
+        return sha
+
+    def resolve_commit(self, name: str) -> str:
+        """Return the sha of the commit the name refers to, peeling annotated tags."""
+        sha, object_type, _ = self.peel(self.resolve(name))
+        if object_type != "commit":
+            raise ValueError("%s is a %s, not a commit" % (name, object_type))
+
+        return sha
+
+    def peel(self, sha: str) -> Tuple[str, str, bytes]:
+        """Return the sha, type and content of the object, or of the object the
+        annotated tag points to if it is one."""
+        object_type, data = self.objects.read(sha)
+        while object_type == "tag":
+            # the tagged object is on the first line, 'object {sha}'
+            sha = data.split(b"\n", 1)[0][len(b"object ") :].decode()
+            object_type, data = self.objects.read(sha)
+
+        return sha, object_type, data
+
+    def read_ref(self, ref: str) -> Optional[str]:
+        """Return the sha of the ref, following symbolic refs, or None if it
+        doesn't exist as a file or in packed-refs.
+
+        Only HEAD and the other PSEUDO_REFS are looked up directly in the git
+        directory, any other ref has to be under refs/. A ref which doesn't
+        hold a sha is ignored with a warning, like git does.
+        """
+        for _ in range(10):
+            if ref not in PSEUDO_REFS and not ref.startswith("refs/"):
+                return None
+
+            path = self.git_path(ref)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    value = f.read().decode("utf-8", "replace").strip()
+                if not value.startswith("ref: "):
+                    # FETCH_HEAD goes on with the branch the sha was fetched from
+                    sha = value.split(None, 1)[0] if value else ""
+                    if not FULL_SHA.match(sha):
+                        log.warning("ignoring broken ref %s" % ref)
+                        return None
+                    return sha
+                ref = value[len("ref: ") :]
+            else:
+                return self.packed_refs().get(ref)
+
+        raise ValueError("too many levels of symbolic refs at %s" % ref)
+
+    def packed_refs(self) -> Dict[str, str]:
+        refs = {}
+        try:
+            with open(self.git_path("packed-refs")) as f:
+                for line in f:
+                    if line.startswith(("#", "^")):
+                        continue
+                    sha, _, ref = line.rstrip("\n").partition(" ")
+                    refs[ref] = sha
+        except FileNotFoundError:
+            pass
+
+        return refs
+
+    def refs(self) -> Dict[str, str]:
+        """Return the sha of HEAD and every ref under refs/, by name."""
+        refs = self.packed_refs()
+        for directory, _, filenames in os.walk(self.git_path("refs")):
+            for filename in filenames:
+                ref = os.path.relpath(os.path.join(directory, filename), self.git_dir)
+                refs[ref.replace(os.sep, "/")] = self.read_ref(ref)
+
+        head = self.read_ref("HEAD")
+        if head is not None:
+            refs["HEAD"] = head
+
+        return {ref: sha for ref, sha in refs.items() if sha}
+
+    def update_ref(self, ref: str, sha: str) -> None:
+        """Update the ref to the given (abbreviated) sha."""
+        sha = self.objects.resolve(sha)
+        with open(self.git_path(ref), "w") as f:
+            f.write(sha)
+
+    def index(self) -> Index:
+        """Open and parse the index."""
+        with trace.region("index", "read"):
+            with open(self.git_path("index"), "rb") as f:
+                idx = Index(f.read())
+                idx.mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            trace.count("index/entries_parsed", idx.file_count)
+            return idx
+
+    def write_index(self, idx: Index) -> None:
+        """Write the index atomically: the new index is written to index.lock,
+        which also keeps other writers out, and then renamed over the index.
+
+        The entries which are racy, against the index as it was read or the
+        one written, are smudged, see Index.Table.smudge_racy. The new index's
+        mtime is only known once it is written, so it is written again if
+        that smudged any entry.
+        """
+        path = self.git_path("index")
+        lock_path = "%s.lock" % path
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with trace.region("index", "write"), os.fdopen(fd, "wb") as f:
+                f.write(idx.pack())
+                f.flush()
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                racy_ns = mtime_ns if idx.mtime_ns is None else min(idx.mtime_ns, mtime_ns)
+                if idx.table.smudge_racy(racy_ns):
+                    f.seek(0)
+                    f.truncate()
+                    f.write(idx.pack())
+                    f.flush()
+                    mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            os.replace(lock_path, path)
+            idx.mtime_ns = mtime_ns
+        except BaseException:
+            os.remove(lock_path)
+            raise
+
+    def commit_graph(self) -> Optional[CommitGraph]:
+        """Return the commit-graph or None if there is none."""
+        path = self.git_path("objects/info/commit-graph")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        if mtime != self._commit_graph_file[0]:
+            if self._commit_graph_file[1] is not None:
+                self._commit_graph_file[1].close()
+            self._commit_graph_file = (mtime, CommitGraph(path))
+
+        return self._commit_graph_file[1]
+
+    def commit_lookup(self) -> CommitLookup:
+        """Return a function giving the parents, generation and commit time of
+        a commit, from the commit-graph if the commit is in it and otherwise
+        from the commit itself."""
+        graph = self.commit_graph()
+
+        def lookup(sha: str) -> Tuple[List[str], int, int]:
+            if graph is not None:
+                position = graph.position(bytes.fromhex(sha))
+                if position is not None:
+                    return (
+                        [graph.sha(parent).hex() for parent in graph.parents(position)],
+                        graph.generation(position),
+                        graph.commit_time(position),
+                    )
+
+            commit = Commit.unpack(self.objects.read(sha)[1], message=False)
+            return commit.parents, GENERATION_INFINITY, int(commit.committer.date_s)
+
+        return lookup
+
+    def close(self) -> None:
+        self.objects.close()
+        if self._commit_graph_file[1] is not None:
+            self._commit_graph_file[1].close()
+        self._commit_graph_file = (None, None)
+
+
+def _ensure_directory(path: str) -> None:
+    """Ensure the given path exists by creating any directories necessary."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+def _object_content(data: bytes, object_type: str) -> Tuple[str, bytes]:
+    """Return the sha of the object and its content in git's format."""
+    header = "%s %d" % (object_type, len(data))
+    content = b"%s\0%s" % (header.encode(), data)
+    trace.count("sha1/hashed_bytes", len(content))
+
+    return hashlib.sha1(content).hexdigest(), content
+
+
+def _hash_chunks(
+    f: BinaryIO, size: int, sha: "hashlib._Hash", out: BinaryIO = None, compressor=None
+) -> str:
+    """Feed the size bytes of f to the sha in chunks, and compressed to out if
+    given, and return the hex digest."""
+    remaining = size
+    while True:
+        chunk = f.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        sha.update(chunk)
+        if out is not None:
+            out.write(compressor.compress(chunk))
+        remaining -= len(chunk)
+
+    if remaining != 0:
+        raise ValueError("content changed size while being hashed")
+    trace.count("sha1/hashed_bytes", size)
+
+    return sha.hexdigest()
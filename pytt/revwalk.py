@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import heapq
+import logging
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .commit_graph import GENERATION_MAX
+
+log = logging.getLogger("pytt")
+
+# The generation of commits which aren't in the commit-graph, they are newer
+# than it so they go before every commit in it.
+GENERATION_INFINITY = GENERATION_MAX + 1
+
+# Returns the parents, generation and commit time of a commit.
+CommitLookup = Callable[[str], Tuple[List[str], int, int]]
+
+
+# Excluded commits a range walk by date goes on popping once only excluded
+# commits are left, in case commit times are skewed, like git's SLOP.
+SLOP = 5
+
+
+class RevWalk:
+    """Walks the history from a set of commits, newest first, leaving out
+    everything reachable from a set of excluded commits -- the A..B of git
+    rev-list, which is B excluding A.
+
+    Commits waiting to be visited are kept in a heap, ordered either by
+    commit time like git rev-list, or by generation number and then commit
+    time. Without excluded commits each commit is yielded as it is popped.
+
+    With excluded commits, a commit can only be yielded once nothing that
+    may still be popped can reach it, as it would then turn out to be
+    excluded. By generation that is once every commit left in the heap has
+    a generation number: a commit's generation is always higher than those
+    of its ancestors. Commit times can be skewed though, so by date the
+    commits are held like git's limit_list does: the walk goes on until
+    only excluded commits are left and SLOP more of them were popped which
+    are older than the last included commit, and only then are the commits
+    yielded which weren't excluded in the meantime.
+
+    Commits without a generation number, i.e. not in the commit-graph, get
+    GENERATION_INFINITY and fall back to commit time.
+
+    Examples
+    --------
+    >>> walk = RevWalk(lookup, include=[b], exclude=[a])
+    >>> for sha in walk:
+    ...     print(sha)
+    """
+
+    ORDERS = ("date", "generation")
+
+    def __init__(
+        self,
+        lookup: CommitLookup,
+        include: Iterable[str],
+        exclude: Iterable[str] = (),
+        max_count: Optional[int] = None,
+        first_parent: bool = False,
+        order: str = "date",
+    ) -> None:
+        if order not in self.ORDERS:
+            raise ValueError("unknown order %s" % order)
+
+        self._lookup = lookup
+        self.max_count = max_count
+        self.first_parent = first_parent
+        self.order = order
+
+        self._heap: List[Tuple[int, int, int, str]] = []
+        self._queued: Dict[str, List[str]] = {}
+        self._excluded = set()
+        self._visited = set()
+        self._included_queued = 0
+        self._pushed = 0
+
+        for sha in exclude:
+            self._push(sha, excluded=True)
+        self._limited = bool(self._excluded)
+        for sha in include:
+            self._push(sha, excluded=False)
+
+    def __iter__(self) -> Iterator[str]:
+        count = 0
+        for sha in self._commits():
+            if self.max_count is not None and count >= self.max_count:
+                return
+            count += 1
+            yield sha
+
+    def _commits(self) -> Iterator[str]:
+        held: List[str] = []
+        slop = SLOP
+        # the commit time of the last included commit
+        last_time = float("inf")
+        while self._heap:
+            if not self._included_queued and not self._unsettled():
+                break
+
+            _, negative_time, _, sha = heapq.heappop(self._heap)
+            parents = self._queued.pop(sha)
+            self._visited.add(sha)
+
+            excluded = sha in self._excluded
+            if not excluded:
+                self._included_queued -= 1
+
+            for parent in parents[:1] if self.first_parent else parents:
+                self._push(parent, excluded)
+
+            if not excluded:
+                last_time = -negative_time
+                held.append(sha)
+            elif self._limited and self.order == "date":
+                if self._included_queued or (self._heap and -self._heap[0][1] >= last_time):
+                    slop = SLOP
+                else:
+                    slop -= 1
+                    if not slop:
+                        break
+
+            if held and not self._unsettled():
+                yield from (sha for sha in held if sha not in self._excluded)
+                held.clear()
+
+        yield from (sha for sha in held if sha not in self._excluded)
+
+    def _unsettled(self) -> bool:
+        """Whether a commit still in the heap can exclude the commits popped
+        so far."""
+        if not self._limited:
+            return False
+        if self.order == "date":
+            return True
+        return bool(self._heap) and -self._heap[0][0] == GENERATION_INFINITY
+
+    def _push(self, sha: str, excluded: bool) -> None:
+        if excluded and sha not in self._excluded:
+            self._excluded.add(sha)
+            if sha in self._queued:
+                self._included_queued -= 1
+            elif sha in self._visited:
+                # only happens when commit times are skewed, an excluded
+                # commit is found to reach a commit which is already popped
+                self._mark_excluded(sha)
+
+        if sha in self._queued or sha in self._visited:
+            return
+
+        parents, generation, commit_time = self._lookup(sha)
+        self._pushed += 1
+        if self.order == "date":
+            generation = 0
+        heapq.heappush(self._heap, (-generation, -commit_time, self._pushed, sha))
+        self._queued[sha] = parents
+        if not excluded:
+            self._included_queued += 1
+
+    def _mark_excluded(self, sha: str) -> None:
+        """Exclude the ancestors of an already visited commit which are still
+        waiting in the heap."""
+        pending = [sha]
+        while pending:
+            parents = self._lookup(pending.pop())[0]
+            for parent in parents[:1] if self.first_parent else parents:
+                if parent in self._excluded:
+                    continue
+
+                self._excluded.add(parent)
+                if parent in self._queued:
+                    self._included_queued -= 1
+                elif parent in self._visited:
+                    pending.append(parent)
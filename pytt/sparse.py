@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import logging
+import os
+from typing import Iterable, List, Optional
+
+log = logging.getLogger("pytt")
+
+# The patterns of the sparse-checkout, relative to the git directory.
+SPARSE_CHECKOUT_FILE = os.path.join("info", "sparse-checkout")
+
+
+class Cone:
+    """The directories of a cone mode sparse-checkout, the files of which are
+    the only ones in the working tree.
+
+    Every file in a directory of the cone, or below one, is included, as are
+    the files directly in the parents of these directories and the files at
+    the root. Unlike full sparse-checkout patterns, whether a directory is in
+    the cone is decided by its name alone, so directories outside the cone
+    can be left out of the index as a whole, see Index.sparsify.
+
+    The cone is stored like git does, as patterns in
+    .git/info/sparse-checkout, e.g. for the directories a/b and c:
+
+    /*
+    !/*/
+    /a/
+    !/a/*/
+    /a/b/
+    /c/
+
+    Examples
+    --------
+    >>> cone = Cone(["a/b", "c"])
+    >>> cone.includes("a/b/d/file"), cone.includes("a/file"), cone.includes("a/d/file")
+    (True, True, False)
+    """
+
+    def __init__(self, directories: Iterable[str]) -> None:
+        self.recursive = {directory.strip("/") for directory in directories}
+        self.recursive.discard("")
+        # the root is always a parent, its files are always included
+        self.parents = {""}
+        for directory in self.recursive:
+            parts = directory.split("/")
+            for depth in range(1, len(parts)):
+                self.parents.add("/".join(parts[:depth]))
+
+    def includes(self, path: str) -> bool:
+        """Whether the file at the path is in the sparse-checkout."""
+        directory, _, _ = path.rpartition("/")
+        return self.includes_directory(directory)
+
+    def includes_directory(self, directory: str) -> bool:
+        """Whether any file in the directory, at any depth, can be in the
+        sparse-checkout."""
+        return directory in self.parents or self._under_recursive(directory)
+
+    def _under_recursive(self, directory: str) -> bool:
+        if not directory:
+            return False
+        parts = directory.split("/")
+        return any("/".join(parts[:depth]) in self.recursive for depth in range(1, len(parts) + 1))
+
+    def patterns(self) -> List[str]:
+        """Return the cone as sparse-checkout patterns, like git writes them."""
+        patterns = ["/*", "!/*/"]
+        # a directory below a recursive one adds nothing to it
+        directories = (self.parents | self.recursive) - {""}
+        for directory in sorted(directories):
+            if self._under_recursive(directory.rpartition("/")[0]):
+                continue
+            patterns.append("/%s/" % directory)
+            if directory not in self.recursive:
+                patterns.append("!/%s/*/" % directory)
+        return patterns
+
+    def write(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("".join("%s\n" % pattern for pattern in self.patterns()))
+
+    @classmethod
+    def read(cls, path: str) -> Optional[Cone]:
+        """Read the cone from the sparse-checkout file, None if there isn't
+        one.
+
+        Raises ValueError if the patterns aren't cone patterns.
+        """
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+
+        patterns = [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+        if patterns[:2] != ["/*", "!/*/"]:
+            raise ValueError("%s doesn't hold cone mode patterns" % path)
+
+        positive = []
+        negative = set()
+        for pattern in patterns[2:]:
+            negated = pattern.startswith("!")
+            directory = pattern[1:] if negated else pattern
+            if negated:
+                if not directory.endswith("/*/"):
+                    raise ValueError("%s isn't a cone mode pattern" % pattern)
+                negative.add(directory[1:-3])
+            else:
+                if not (directory.startswith("/") and directory.endswith("/")):
+                    raise ValueError("%s isn't a cone mode pattern" % pattern)
+                positive.append(directory[1:-1])
+
+        # a directory whose subdirectories are excluded is only a parent
+        return cls(directory for directory in positive if directory not in negative)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+import time
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, TextIO
+
+# Set to a file to trace every command to it, like --profile.
+TRACE_ENV = "PYTT_TRACE"
+# Set to a file to dump cProfile stats of every command to it, like --cprofile.
+CPROFILE_ENV = "PYTT_CPROFILE"
+
+# Returned by region() while tracing is off, so a disabled region costs a
+# global lookup and a call.
+_NULL_REGION = contextlib.nullcontext()
+
+
+class Tracer:
+    """Writes timed regions and counters as JSON lines, one event per line,
+    in the spirit of git's trace2 event format.
+
+    Every event has the name of the event, the session id, the thread, the
+    wall-clock time and t_abs, the seconds since the tracer started. Regions
+    write a region_enter and a region_leave event with their nesting depth,
+    the latter with t_rel, the seconds spent in the region. Counters are only
+    summed in memory and written as counter events when the tracer is closed.
+
+    Examples
+    --------
+    >>> tracer = Tracer(open("trace.json", "a"), ["pytt", "status"])
+    >>> with tracer.region("index", "read"):
+    ...     tracer.count("index/entries", 1000)
+    >>> tracer.close()
+    """
+
+    def __init__(self, out: TextIO, argv: List[str]) -> None:
+        self.out = out
+        self.sid = "%d-%d" % (os.getpid(), time.time_ns())
+        self.counters: Dict[str, int] = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._depth = threading.local()
+        self._event("start", argv=argv)
+
+    def region(self, category: str, label: str, **data: Any) -> ContextManager[None]:
+        return self._region(category, label, data)
+
+    @contextlib.contextmanager
+    def _region(self, category: str, label: str, data: Dict[str, Any]) -> Iterator[None]:
+        nesting = getattr(self._depth, "value", 0) + 1
+        self._event("region_enter", category=category, label=label, nesting=nesting, **data)
+        self._depth.value = nesting
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth.value = nesting - 1
+            self._event(
+                "region_leave",
+                category=category,
+                label=label,
+                nesting=nesting,
+                t_rel=round(time.perf_counter() - start, 6),
+            )
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def close(self, code: int = 0) -> None:
+        for name, value in sorted(self.counters.items()):
+            self._event("counter", name=name, value=value)
+        self._event("exit", code=code)
+        self.out.close()
+
+    def _event(self, event: str, **fields: Any) -> None:
+        # imported here, they aren't needed while tracing is off
+        import datetime
+        import json
+
+        record = {
+            "event": event,
+            "sid": self.sid,
+            "thread": threading.current_thread().name,
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "t_abs": round(time.perf_counter() - self._start, 6),
+        }
+        record.update(fields)
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self.out.write(line)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start(path: str, argv: List[str]) -> Tracer:
+    """Start tracing to the end of the file at path."""
+    global _tracer
+    _tracer = Tracer(open(path, "a"), argv)
+    return _tracer
+
+
+def stop(code: int = 0) -> None:
+    """Write the counters and the exit event, if tracing, and stop."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close(code)
+        _tracer = None
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def region(category: str, label: str, **data: Any) -> ContextManager[None]:
+    """Time the block as a region, if tracing.
+
+    Keyword args:
+        data -- extra fields for the region_enter event
+    """
+    if _tracer is None:
+        return _NULL_REGION
+    return _tracer.region(category, label, **data)
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add amount to the counter, if tracing."""
+    if _tracer is not None:
+        _tracer.count(name, amount)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import heapq
+import logging
+import stat
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .object import Tree
+
+log = logging.getLogger("pytt")
+
+NULL_SHA = "0" * 40
+
+# Renames need at least this similarity in percent, like git's -M default.
+RENAME_THRESHOLD = 50
+
+# Content is fingerprinted in chunks which end at a newline or after this
+# many bytes, like git's spanhash.
+CHUNK_SIZE = 64
+
+# How many of its smallest chunk hashes a file is sampled by, two files are
+# only scored against each other if their samples overlap.
+SAMPLE_SIZE = 16
+
+# Reads the tree and blob objects with the sha.
+ReadTree = Callable[[str], Tree]
+ReadBlob = Callable[[str], bytes]
+
+
+class TreeChange(NamedTuple):
+    """A difference between two trees, in git diff-tree's raw terms."""
+
+    status: str  # A, D, M, T for a type change or R for a rename
+    old_mode: str
+    new_mode: str
+    old_sha: str
+    new_sha: str
+    old_path: str
+    new_path: str
+    score: int = 0  # the similarity of a rename in percent
+
+    def __str__(self) -> str:
+        status = "R%03d" % self.score if self.status == "R" else self.status
+        paths = self.new_path
+        if self.status == "R":
+            paths = "%s\t%s" % (self.old_path, self.new_path)
+        return ":%06o %06o %s %s %s\t%s" % (
+            int(self.old_mode, 8),
+            int(self.new_mode, 8),
+            self.old_sha,
+            self.new_sha,
+            status,
+            paths,
+        )
+
+
+class TreeDiff:
+    """Lists the differences between two trees by merging their sorted
+    entries.
+
+    An entry with the same sha on both sides is skipped, for a subtree that
+    means everything under it is identical and it isn't read at all. The cost
+    is thus the number of trees on the paths to the changes, not the size of
+    the trees.
+
+    Examples
+    --------
+    >>> diff = TreeDiff(repo.objects.tree, recursive=True)
+    >>> for change in diff.diff(old_tree, new_tree):
+    ...     print(change)
+    """
+
+    def __init__(self, read_tree: ReadTree, recursive: bool = False) -> None:
+        self.read_tree = read_tree
+        self.recursive = recursive
+        self.trees_read = 0
+
+    def diff(self, old: Optional[str], new: Optional[str]) -> List[TreeChange]:
+        """Return the changes from the old tree to the new one, sorted by path.
+        None stands for an empty tree."""
+        changes: List[TreeChange] = []
+        self._diff(old, new, "", changes)
+        return changes
+
+    def _diff(
+        self, old: Optional[str], new: Optional[str], prefix: str, changes: List[TreeChange]
+    ) -> None:
+        old_entries = self._entries(old)
+        new_entries = self._entries(new)
+
+        i = j = 0
+        while i < len(old_entries) or j < len(new_entries):
+            old_key, old_entry = old_entries[i] if i < len(old_entries) else (None, None)
+            new_key, new_entry = new_entries[j] if j < len(new_entries) else (None, None)
+
+            if new_key is None or (old_key is not None and old_key < new_key):
+                self._removed(old_entry, prefix, changes)
+                i += 1
+            elif old_key is None or new_key < old_key:
+                self._added(new_entry, prefix, changes)
+                j += 1
+            else:
+                i += 1
+                j += 1
+                if old_entry.sha == new_entry.sha and old_entry.mode == new_entry.mode:
+                    continue
+
+                path = prefix + old_entry.name
+                if old_entry.is_tree and self.recursive:
+                    self._diff(old_entry.sha, new_entry.sha, path + "/", changes)
+                    continue
+
+                status = "M" if _file_type(old_entry.mode) == _file_type(new_entry.mode) else "T"
+                changes.append(
+                    TreeChange(
+                        status,
+                        old_entry.mode,
+                        new_entry.mode,
+                        old_entry.sha,
+                        new_entry.sha,
+                        path,
+                        path,
+                    )
+                )
+
+    def _removed(self, entry: Tree.Entry, prefix: str, changes: List[TreeChange]) -> None:
+        path = prefix + entry.name
+        if entry.is_tree and self.recursive:
+            self._diff(entry.sha, None, path + "/", changes)
+        else:
+            changes.append(TreeChange("D", entry.mode, "0", entry.sha, NULL_SHA, path, path))
+
+    def _added(self, entry: Tree.Entry, prefix: str, changes: List[TreeChange]) -> None:
+        path = prefix + entry.name
+        if entry.is_tree and self.recursive:
+            self._diff(None, entry.sha, path + "/", changes)
+        else:
+            changes.append(TreeChange("A", "0", entry.mode, NULL_SHA, entry.sha, path, path))
+
+    def _entries(self, sha: Optional[str]) -> List[Tuple[bytes, Tree.Entry]]:
+        if sha is None:
+            return []
+
+        self.trees_read += 1
+        return [(entry.sort_key(), entry) for entry in self.read_tree(sha).entries]
+
+
+class RenameDetector:
+    """Pairs up deleted and added files into renames.
+
+    Files with the same sha are exact renames. The others are compared by
+    content: every file is split into chunks and similarity is the number of
+    bytes in chunks both files have, over the size of the larger file, like
+    git estimates it.
+
+    Scoring every deleted file against every added file is quadratic, so
+    each file is sampled by its SAMPLE_SIZE smallest chunk hashes and a pair
+    is only scored when the samples share a hash. Files which are similar
+    share most of their chunks and with them, most likely, their smallest
+    hashes. Pairs whose sizes are too far apart to reach the threshold
+    aren't scored either.
+
+    Examples
+    --------
+    >>> detector = RenameDetector(lambda sha: repo.objects.read(sha)[1])
+    >>> changes = detector.detect(changes)
+    """
+
+    def __init__(self, read_blob: ReadBlob, threshold: int = RENAME_THRESHOLD) -> None:
+        self.read_blob = read_blob
+        self.threshold = threshold
+        self.scored = 0
+
+    def detect(self, changes: List[TreeChange]) -> List[TreeChange]:
+        """Return the changes with the deletions and additions which are
+        renames replaced by a single rename, at the position of the addition."""
+        deleted = {i: c for i, c in enumerate(changes) if c.status == "D" and _is_file(c.old_mode)}
+        added = {j: c for j, c in enumerate(changes) if c.status == "A" and _is_file(c.new_mode)}
+        renames: Dict[int, Tuple[int, int]] = {}
+
+        # exact renames first, they don't need the content
+        by_sha: Dict[Tuple[str, int], List[int]] = {}
+        for i, change in deleted.items():
+            by_sha.setdefault((change.old_sha, _file_type(change.old_mode)), []).append(i)
+        for j, change in added.items():
+            sources = by_sha.get((change.new_sha, _file_type(change.new_mode)))
+            if sources:
+                renames[j] = (sources.pop(0), 100)
+        for source, _ in renames.values():
+            del deleted[source]
+        for j in renames:
+            del added[j]
+
+        # only the content of regular files is compared
+        deleted = {i: c for i, c in deleted.items() if _file_type(c.old_mode) == stat.S_IFREG}
+        added = {j: c for j, c in added.items() if _file_type(c.new_mode) == stat.S_IFREG}
+        if deleted and added:
+            renames.update(self._similar(deleted, added))
+
+        result = []
+        sources = {source for source, _ in renames.values()}
+        for j, change in enumerate(changes):
+            if j in sources:
+                continue
+            if j in renames:
+                source, score = renames[j]
+                old = changes[source]
+                change = TreeChange(
+                    "R",
+                    old.old_mode,
+                    change.new_mode,
+                    old.old_sha,
+                    change.new_sha,
+                    old.old_path,
+                    change.new_path,
+                    score,
+                )
+            result.append(change)
+
+        return result
+
+    def _similar(
+        self, deleted: Dict[int, TreeChange], added: Dict[int, TreeChange]
+    ) -> Dict[int, Tuple[int, int]]:
+        fingerprints = {}
+        samples: Dict[int, List[int]] = {}
+        for i, change in deleted.items():
+            fingerprints[i] = _fingerprint(self.read_blob(change.old_sha))
+            for sample in _sample(fingerprints[i][0]):
+                samples.setdefault(sample, []).append(i)
+
+        # best first, every file takes part in one rename at most
+        candidates = []
+        for j, change in added.items():
+            fingerprints[j] = _fingerprint(self.read_blob(change.new_sha))
+            sources = {
+                i for sample in _sample(fingerprints[j][0]) for i in samples.get(sample, ())
+            }
+            for i in sources:
+                score = self._score(fingerprints[i], fingerprints[j])
+                if score >= self.threshold:
+                    heapq.heappush(
+                        candidates, (-score, change.new_path, deleted[i].old_path, i, j)
+                    )
+
+        renames = {}
+        used = set()
+        while candidates:
+            score, _, _, i, j = heapq.heappop(candidates)
+            if i in used or j in renames:
+                continue
+            used.add(i)
+            renames[j] = (i, -score)
+
+        return renames
+
+    def _score(self, old: Tuple[Dict[int, int], int], new: Tuple[Dict[int, int], int]) -> int:
+        (old_chunks, old_size), (new_chunks, new_size) = old, new
+        larger = max(old_size, new_size)
+        if larger == 0:
+            return 100
+        if min(old_size, new_size) * 100 < larger * self.threshold:
+            return 0
+
+        self.scored += 1
+        if len(new_chunks) < len(old_chunks):
+            old_chunks, new_chunks = new_chunks, old_chunks
+        common = 0
+        for chunk, size in old_chunks.items():
+            other = new_chunks.get(chunk)
+            if other is not None:
+                common += min(size, other)
+
+        return common * 100 // larger
+
+
+def _fingerprint(content: bytes) -> Tuple[Dict[int, int], int]:
+    """Return the bytes in each distinct chunk of the content, by the hash of
+    the chunk, and the size of the content."""
+    chunks: Dict[int, int] = {}
+    for line in content.splitlines(keepends=True):
+        for start in range(0, len(line), CHUNK_SIZE):
+            chunk = line[start : start + CHUNK_SIZE]
+            key = hash(chunk)
+            chunks[key] = chunks.get(key, 0) + len(chunk)
+
+    return chunks, len(content)
+
+
+def _sample(chunks: Dict[int, int]) -> List[int]:
+    return heapq.nsmallest(SAMPLE_SIZE, chunks)
+
+
+def _file_type(mode: str) -> int:
+    return stat.S_IFMT(int(mode, 8))
+
+
+def _is_file(mode: str) -> bool:
+    return _file_type(mode) in (stat.S_IFREG, stat.S_IFLNK)
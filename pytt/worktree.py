@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import os
+import stat
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .index import NS_PER_SECOND, Index, stat_fields
+
+log = logging.getLogger("pytt")
+
+MODE_FILE = 0o100644
+MODE_EXECUTABLE = 0o100755
+MODE_SYMLINK = 0o120000
+MODE_GITLINK = 0o160000
+
+# How many paths a worker lstats per task, see WorktreeDiff.
+LSTAT_CHUNK = 256
+
+# Hashes a file of the working tree, given its path, stat and mode.
+HashFile = Callable[[str, os.stat_result, int], str]
+
+
+class Change(NamedTuple):
+    """A file whose content in the working tree differs from the index."""
+
+    name: str
+    status: str  # M for modified, D for deleted
+    index_mode: int
+    index_sha: str
+    mode: int  # the mode in the working tree, 0 if deleted
+
+
+class WorktreeDiff:
+    """Compares the files in the working tree to their index entries.
+
+    Only the stat data is compared first: a file whose ctime, mtime, inode,
+    uid, gid, size and mode all match its entry hasn't changed. The others
+    are hashed and compared to the entry's sha, and the ones with the same
+    content only had their stat data changed, e.g. by a touch. Their fresh
+    stat data is kept in refreshed so it can be written back to the index,
+    which makes the next comparison of these files free.
+
+    A file can be written again within the same timestamp tick as the index,
+    without its stat data changing, so a file whose mtime isn't older than
+    the index is racily clean and is always hashed.
+
+    The files are lstat'ed and hashed on a pool of jobs threads, both release
+    the GIL, which hides the latency of slow filesystems, e.g. network mounts.
+
+    When a file system monitor tells which files may have changed, only the
+    entries at those positions are compared, see run.
+
+    Entries outside the sparse-checkout, which are marked skip-worktree,
+    aren't compared at all.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        table: Index.Table,
+        index_mtime_ns: int,
+        hash_file: HashFile,
+        jobs: int = None,
+    ) -> None:
+        self.root = root
+        self.table = table
+        self.index_mtime_ns = index_mtime_ns
+        self.hash_file = hash_file
+        self.jobs = jobs or min(32, 4 * (os.cpu_count() or 1))
+
+        self.changes: List[Change] = []
+        self.refreshed: Dict[int, Tuple[int, ...]] = {}
+        self.hashed = 0
+
+    def run(self, positions: Optional[Iterable[int]] = None) -> List[Change]:
+        """Compare every entry, or only the ones at the positions, return the
+        changes sorted by name."""
+        table = self.table
+        # stat data newer than this isn't refreshed, the file could still be
+        # being written to and would then look clean next time
+        started_ns = time.time_ns()
+
+        if positions is None:
+            positions = range(len(table))
+        # skip-worktree entries, e.g. sparse directories, aren't expected on disk
+        positions = [p for p in positions if table.stage(p) == 0 and not table.skip_worktree(p)]
+        paths = [os.path.join(self.root, table.name(p)) for p in positions]
+        chunks = [
+            paths[start : start + LSTAT_CHUNK] for start in range(0, len(paths), LSTAT_CHUNK)
+        ]
+
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as executor:
+            stats = [st for chunk in executor.map(_lstat_all, chunks) for st in chunk]
+
+            suspects = []
+            changes: Dict[int, Change] = {}
+            for position, path, st in zip(positions, paths, stats):
+                mode = table.mode[position]
+                if mode == MODE_GITLINK:
+                    continue
+
+                if st is None:
+                    changes[position] = Change(
+                        table.name(position), "D", mode, table.sha(position), 0
+                    )
+                    continue
+
+                worktree_mode = _worktree_mode(st)
+                if worktree_mode != mode:
+                    changes[position] = Change(
+                        table.name(position), "M", mode, table.sha(position), worktree_mode
+                    )
+                elif not self._stat_matches(position, st) or self._racy(position):
+                    suspects.append((position, path, st, worktree_mode))
+
+            shas = executor.map(lambda suspect: self.hash_file(*suspect[1:]), suspects)
+            for (position, _, st, worktree_mode), sha in zip(suspects, shas):
+                self.hashed += 1
+                if sha != table.sha(position):
+                    changes[position] = Change(
+                        table.name(position),
+                        "M",
+                        table.mode[position],
+                        table.sha(position),
+                        worktree_mode,
+                    )
+                elif st.st_mtime_ns < started_ns and not self._stat_matches(position, st):
+                    self.refreshed[position] = stat_fields(st, table.mode[position])
+
+        self.changes = [changes[position] for position in sorted(changes)]
+        return self.changes
+
+    def _stat_matches(self, position: int, st: os.stat_result) -> bool:
+        fields = stat_fields(st, self.table.mode[position])
+        # the device isn't compared, like git doesn't by default, as it isn't
+        # stable on all filesystems
+        return all(
+            column[position] == value
+            for column, value in zip(self.table.stat, fields)
+            if column is not self.table.device
+        )
+
+    def _racy(self, position: int) -> bool:
+        table = self.table
+        mtime_ns = table.mtime[position] * NS_PER_SECOND + table.mtime_ns[position]
+        return mtime_ns >= self.index_mtime_ns
+
+
+def _lstat_all(paths: Sequence[str]) -> List[Optional[os.stat_result]]:
+    """lstat the paths, None for the ones which don't exist or aren't files."""
+    stats = []
+    for path in paths:
+        try:
+            st = os.lstat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            st = None
+
+        if st is not None and stat.S_ISDIR(st.st_mode):
+            st = None
+        stats.append(st)
+
+    return stats
+
+
+def _worktree_mode(st: os.stat_result) -> int:
+    """Return the mode the file would get in the index."""
+    if stat.S_ISLNK(st.st_mode):
+        return MODE_SYMLINK
+    if st.st_mode & stat.S_IXUSR:
+        return MODE_EXECUTABLE
+    return MODE_FILE
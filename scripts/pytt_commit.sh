@@ -8,7 +8,7 @@ command -v pytt >/dev/null 2>&1 || {
 }
 
 # blob
-pytt hash-object -w '"The greatest thing about Facebook is that you can quote something and totally make up the source." ~ George Washington'
+printf '%s' '"The greatest thing about Facebook is that you can quote something and totally make up the source." ~ George Washington' | pytt hash-object -w --stdin
 
 pytt cat-file 291d4c
 
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# The package root, so the pytt run by the tests is this one even when it
+# isn't installed.
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fixed names and dates, so that the shas git writes don't change between runs.
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "A U Thor",
+    "GIT_AUTHOR_EMAIL": "author@example.com",
+    "GIT_COMMITTER_NAME": "C O Mitter",
+    "GIT_COMMITTER_EMAIL": "committer@example.com",
+    "GIT_AUTHOR_DATE": "1700000000 +0000",
+    "GIT_COMMITTER_DATE": "1700000000 +0000",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+}
+
+
+def git(*args: str, env: dict = None, input: bytes = None, raw: bool = False):
+    """Run git in the current directory and return its output, stripped, or
+    as the bytes it wrote if raw."""
+    process = subprocess.run(
+        ["git", *args],
+        input=input,
+        stdout=subprocess.PIPE,
+        env={**os.environ, **GIT_ENV, **(env or {})},
+        check=True,
+    )
+    return process.stdout if raw else process.stdout.decode().strip()
+
+
+def pytt(*args: str) -> subprocess.CompletedProcess:
+    """Run pytt as a command in the current directory."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get("PYTHONPATH")]))
+    return subprocess.run(
+        [sys.executable, "-m", "pytt", *args], capture_output=True, env=env, timeout=60
+    )
+
+
+def commit(message: str, date: int = 1700000000, **files: str) -> str:
+    """Write the files, commit them at the date and return the commit's sha.
+
+    The files are given as path=content, with __ standing for / in the path.
+    """
+    for name, content in files.items():
+        path = name.replace("__", "/")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    git("add", "-A")
+    dates = {"GIT_AUTHOR_DATE": "@%d +0000" % date, "GIT_COMMITTER_DATE": "@%d +0000" % date}
+    git("commit", "-q", "--allow-empty", "-m", message, env=dates)
+    return git("rev-parse", "HEAD")
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """An empty git repository, which is the current directory."""
+    if shutil.which("git") is None:
+        pytest.skip("git isn't installed")
+
+    monkeypatch.chdir(tmp_path)
+    git("init", "-q", "-b", "master")
+    return tmp_path
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from conftest import git
+from pytt.aio import AsyncObjectDatabase
+from pytt.pack import Pack
+from pytt.repository import ObjectDatabase
+
+
+def pack(shas):
+    """Pack the objects, which nothing refers to, and remove them as loose."""
+    git("pack-objects", "-q", ".git/objects/pack/pack", input="\n".join(shas).encode())
+    git("prune-packed")
+
+
+def test_packed_reads_overlap(repo, monkeypatch):
+    """Two reads from the same pack run at the same time: each waits inside
+    the pack for the other, which would time out if they took turns."""
+    shas = [git("hash-object", "-w", "--stdin", input=b"object %d\n" % i) for i in range(2)]
+    pack(shas)
+
+    barrier = threading.Barrier(2, timeout=10)
+    read_at = Pack.read_at
+
+    def read_at_together(self, offset):
+        barrier.wait()
+        return read_at(self, offset)
+
+    monkeypatch.setattr(Pack, "read_at", read_at_together)
+
+    async def read_both():
+        async with AsyncObjectDatabase(ObjectDatabase(".git/objects"), max_workers=2) as odb:
+            return await asyncio.gather(*(odb.read(sha) for sha in shas))
+
+    assert asyncio.run(read_both()) == [("blob", b"object 0\n"), ("blob", b"object 1\n")]
+
+
+def test_read_many_resolves_abbreviated_shas(repo):
+    shas = [git("hash-object", "-w", "--stdin", input=b"object %d\n" % i) for i in range(20)]
+    pack(shas)
+    shas.append(git("hash-object", "-w", "--stdin", input=b"loose\n"))
+
+    async def read_all():
+        async with AsyncObjectDatabase(ObjectDatabase(".git/objects")) as odb:
+            return {sha: data async for sha, _, data in odb.read_many(sha[:10] for sha in shas)}
+
+    read = asyncio.run(read_all())
+    assert sorted(read) == sorted(sha[:10] for sha in shas)
+    assert read[shas[-1][:10]] == b"loose\n"
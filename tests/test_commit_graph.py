@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import subprocess
+
+import pytest
+
+from conftest import GIT_ENV, commit, git
+from pytt import pytt
+
+
+@pytest.fixture
+def merges(repo):
+    """Two branches merged into each other twice, with criss-cross merge
+    bases:
+
+        b1 - s1 - s2 - merge2         side
+         \\         \\  /
+          m1 - m2 - merge1 - m3     master
+    """
+    commit("b1", date=1000, base="base\n")
+    git("checkout", "-q", "-b", "side")
+    commit("s1", date=2000, side_txt="1\n")
+    commit("s2", date=3000, side_txt="2\n")
+    git("checkout", "-q", "master")
+    commit("m1", date=1500, main_txt="1\n")
+    commit("m2", date=2500, main_txt="2\n")
+    dates = {"GIT_AUTHOR_DATE": "@4000 +0000", "GIT_COMMITTER_DATE": "@4000 +0000"}
+    git("merge", "-q", "--no-ff", "-m", "merge1", "side~0", env=dates)
+    git("checkout", "-q", "side")
+    git("merge", "-q", "--no-ff", "-m", "merge2", "master~1", env=dates)
+    git("checkout", "-q", "master")
+    commit("m3", date=5000, main_txt="3\n")
+    return repo
+
+
+def merge_base(capsys, *args, **kwargs) -> str:
+    pytt.merge_base(*args, **kwargs)
+    return capsys.readouterr().out.strip()
+
+
+def test_git_verifies_the_commit_graph(merges, capsys):
+    pytt.write_commit_graph()
+    assert capsys.readouterr().out == "wrote 8 commits to the commit-graph\n"
+    git("commit-graph", "verify")
+
+
+@pytest.mark.parametrize("writer", ["pytt", "git"])
+def test_merge_base_and_is_ancestor(merges, capsys, writer):
+    if writer == "pytt":
+        pytt.write_commit_graph()
+        capsys.readouterr()
+    else:
+        git("commit-graph", "write", "--reachable")
+
+    assert merge_base(capsys, "master", "side") == git("merge-base", "master", "side")
+    assert sorted(merge_base(capsys, "master", "side", all_bases=True).split()) == sorted(
+        git("merge-base", "--all", "master", "side").split()
+    )
+
+    names = ["master", "side", "master~1", "master~2", "side~1", "side~2", "master~4"]
+    for one in names:
+        for two in names:
+            ancestor = subprocess.run(
+                ["git", "merge-base", "--is-ancestor", one, two], env=GIT_ENV
+            ).returncode == 0
+            assert pytt.is_ancestor(git("rev-parse", one), git("rev-parse", two)) == ancestor
+
+
+def test_rev_list_by_generation(merges, capsys):
+    pytt.write_commit_graph()
+    capsys.readouterr()
+    for revisions in (["master"], ["side"], ["master", "^side"], ["side..master"]):
+        pytt.rev_list(revisions, order="generation")
+        listed = capsys.readouterr().out.split()
+        assert sorted(listed) == sorted(git("rev-list", *revisions).split())
+        # every commit is listed before its parents
+        for position, sha in enumerate(listed):
+            for parent in git("rev-parse", "%s^@" % sha).split():
+                assert parent not in listed[:position]
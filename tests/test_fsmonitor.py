@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+from conftest import commit, pytt
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs inotify")
+
+
+def test_start_returns_with_captured_output(repo):
+    """Starting the daemon returns even when the caller waits for its output,
+    the daemon logs to a file at the caller's level instead."""
+    commit("initial", readme="hello\n")
+
+    started = pytt("-l", "warning", "fsmonitor", "start")
+    try:
+        assert started.returncode == 0
+        assert started.stdout == b"started the fsmonitor daemon\n"
+        assert started.stderr == b""
+
+        with open("file", "w") as f:
+            f.write("new\n")
+        queried = pytt("fsmonitor", "query")
+        assert queried.returncode == 0
+        assert queried.stdout.splitlines()[1:] == [b"/"]
+    finally:
+        stopped = pytt("fsmonitor", "stop")
+
+    assert stopped.stdout == b"stopped the fsmonitor daemon\n"
+    with open(os.path.join(".git", "pytt-fsmonitor.log")) as f:
+        # INFO "watching ... directories" isn't logged at warning
+        assert "watching" not in f.read()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import pytest
+
+from conftest import commit, git
+from pytt import pytt
+from pytt.pack import _decode_varint, _encode_varint
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 129, 16511, 16512, 2**32 - 1, 2**40 + 5])
+def test_varint_round_trip(value):
+    encoded = _encode_varint(value)
+    assert _decode_varint(b"x" + encoded + b"y", 1) == (value, 1 + len(encoded))
+
+
+def test_varint_matches_git():
+    # offset_1 = ((offset_1 + 1) << 7) | (c & 127) in git's unpack_entry
+    assert _encode_varint(128) == b"\x80\x00"
+    assert _encode_varint(16511) == b"\xff\x7f"
+
+
+@pytest.fixture
+def deep(repo):
+    files = {}
+    for a in range(3):
+        for b in range(3):
+            files["dir%d__sub%d__file" % (a, b)] = "%d %d\n" % (a, b)
+            files["dir%d__sub%d__file.txt" % (a, b)] = "%d %d\n" % (a, b)
+    commit("initial", top="top\n", **files)
+    return repo
+
+
+def ls_files(capsys) -> str:
+    pytt.ls_files()
+    return capsys.readouterr().out.strip()
+
+
+@pytest.mark.parametrize("version", [2, 3, 4])
+def test_read_index_written_by_git(deep, capsys, version):
+    git("update-index", "--index-version", str(version))
+    assert ls_files(capsys) == git("ls-files", "-s")
+
+
+@pytest.mark.parametrize("version", [2, 4])
+def test_git_reads_index_written_by_pytt(deep, capsys, version):
+    expected = git("ls-files", "-s")
+    pytt.update_index_version(version)
+
+    with open(".git/index", "rb") as f:
+        assert f.read(12)[4:8] == version.to_bytes(4, "big")
+    assert git("ls-files", "-s") == expected
+    assert git("status", "--porcelain") == ""
+    assert ls_files(capsys) == expected
+
+
+def test_v4_index_round_trip_is_byte_identical(deep):
+    git("update-index", "--index-version", "4")
+    with open(".git/index", "rb") as f:
+        written_by_git = f.read()
+
+    idx = pytt._repo().index()
+    assert idx.version == 4
+    assert idx.pack() == written_by_git
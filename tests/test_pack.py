@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import io
+import os
+
+import pytest
+
+from conftest import commit, git
+from pytt import pytt
+from pytt.pack import Pack
+
+
+@pytest.fixture
+def history(repo):
+    """Commits changing a few lines of similar files, so that they delta."""
+    lines = ["line %d of a file which is long enough to be worth a delta\n" % i for i in range(60)]
+    for i in range(12):
+        lines[i * 5] = "changed in commit %d\n" % i
+        commit(
+            "commit %d" % i,
+            date=1700000000 + i,
+            **{"src__main.txt": "".join(lines), "src__copy.txt": "".join(reversed(lines))},
+        )
+    return repo
+
+
+def pack_files() -> set:
+    return {name for name in os.listdir(".git/objects/pack") if name.startswith("pack-")}
+
+
+def loose_objects() -> set:
+    return set(pytt._repo().objects.loose_objects())
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_pack_objects_is_read_by_git(history, capsys, processes):
+    objects = loose_objects()
+    packed = pytt.pack_objects(processes=processes, verify=True)
+    name = capsys.readouterr().out.strip()
+
+    assert set(packed) == objects
+    assert pack_files() == {"pack-%s.pack" % name, "pack-%s.idx" % name}
+    output = git("verify-pack", "-v", ".git/objects/pack/pack-%s.idx" % name)
+    # {sha} {type} {size} {packed size} {offset} [{depth} {base}], then a summary
+    entries = [line.split() for line in output.splitlines() if line[:40] in objects]
+    assert len(entries) == len(objects)
+    # the similar blobs are stored as deltas
+    assert any(len(entry) == 7 for entry in entries)
+
+
+def test_repack_deletes_the_loose_objects(history, capsys):
+    expected = git("cat-file", "--batch-all-objects", "--batch", raw=True)
+    pytt.repack(delete=True)
+    capsys.readouterr()
+
+    assert loose_objects() == set()
+    git("fsck", "--strict")
+    assert git("cat-file", "--batch-all-objects", "--batch", raw=True) == expected
+
+
+def test_repack_without_loose_objects_writes_nothing(history, capsys):
+    pytt.repack(delete=True)
+    capsys.readouterr()
+    packs = pack_files()
+
+    pytt.repack(delete=True)
+    assert capsys.readouterr().out == "Nothing new to pack.\n"
+    assert pack_files() == packs
+
+
+def test_read_deltas_git_packed(history):
+    """Read every object of a pack git wrote with long delta chains."""
+    git("repack", "-adfq", "--depth=50", "--window=50")
+    [name] = [name for name in pack_files() if name.endswith(".pack")]
+    names = git("cat-file", "--batch-all-objects", "--batch-check=%(objectname)").split()
+    stdin = "\n".join(names).encode()
+
+    out = io.BytesIO()
+    pytt.cat_file_batch(names, out, contents=True)
+    assert out.getvalue() == git("cat-file", "--batch", input=stdin, raw=True)
+
+    pack = Pack(os.path.join(".git/objects/pack", name))
+    headers = [
+        "%s %s %d" % ((sha,) + pack.read_header(bytes.fromhex(sha))) for sha in names
+    ]
+    pack.close()
+    assert "\n".join(headers) == git("cat-file", "--batch-check", input=stdin)
+
+
+def test_packs_without_an_idx_are_skipped(history, capsys):
+    pytt.repack(delete=True)
+    capsys.readouterr()
+    with open(".git/objects/pack/pack-%s.pack" % ("0" * 40), "wb") as f:
+        f.write(b"PACK being written")
+
+    head = git("rev-parse", "HEAD")
+    out = io.BytesIO()
+    pytt.cat_file_batch([head], out, contents=False)
+    assert out.getvalue() == git("cat-file", "--batch-check", input=head.encode(), raw=True)
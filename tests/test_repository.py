@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import pytest
+
+from conftest import commit, git
+from pytt.repository import Repository
+
+
+def test_resolve_refs(repo):
+    first = commit("first", a="a\n")
+    second = commit("second", b="b\n")
+    git("tag", "v1", first)
+    git("update-ref", "ORIG_HEAD", first)
+    git("pack-refs", "--all")
+    git("branch", "loose", first)
+    repository = Repository(str(repo))
+
+    assert repository.resolve("HEAD") == second
+    assert repository.resolve("ORIG_HEAD") == first
+    assert repository.resolve("master") == second
+    assert repository.resolve("refs/heads/master") == second
+    assert repository.resolve("v1") == first
+    assert repository.resolve("loose") == first
+    assert repository.resolve(second[:7]) == second
+
+
+@pytest.mark.parametrize("name", ["config", "index", "description", "objects", "nothing"])
+def test_files_in_the_git_directory_arent_refs(repo, name):
+    """Only HEAD-like names are looked up directly in the git directory."""
+    commit("first", a="a\n")
+    with pytest.raises(FileNotFoundError, match="unknown revision %s" % name):
+        Repository(str(repo)).resolve(name)
+
+
+def test_broken_ref_is_ignored(repo):
+    commit("first", a="a\n")
+    with open(".git/refs/heads/broken", "w") as f:
+        f.write("not a sha\n")
+    repository = Repository(str(repo))
+
+    assert repository.read_ref("refs/heads/broken") is None
+    assert "refs/heads/broken" not in repository.refs()
+    with pytest.raises(FileNotFoundError):
+        repository.resolve("broken")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import pytest
+
+from conftest import commit, git
+from pytt import pytt
+
+
+def rev_list(capsys, *revisions: str, **kwargs) -> str:
+    pytt.rev_list(list(revisions), **kwargs)
+    return capsys.readouterr().out.strip()
+
+
+@pytest.fixture
+def skewed(repo):
+    """A branch x whose tip is dated before its parents, and master which
+    goes on from the same parent:
+
+        c1 - c2 - c3 - c4 - m1 - m2   master
+                        \\
+                         x           x, dated before c1
+    """
+    for i in range(1, 5):
+        commit("c%d" % i, date=1000 * i, **{"file%d" % i: "%d\n" % i})
+    git("checkout", "-q", "-b", "x")
+    commit("x", date=500, x="x\n")
+    git("checkout", "-q", "master")
+    commit("m1", date=5000, m="1\n")
+    commit("m2", date=6000, m="2\n")
+    return repo
+
+
+@pytest.mark.parametrize("order", ["date", "generation"])
+@pytest.mark.parametrize("revisions", [("x..master",), ("master", "^x"), ("master..x",)])
+def test_range_with_skewed_dates(skewed, capsys, revisions, order):
+    """Commits reachable from the excluded x are left out even though x is
+    only popped after them."""
+    assert rev_list(capsys, *revisions, order=order) == git("rev-list", *revisions)
+
+
+@pytest.mark.parametrize("order", ["date", "generation"])
+def test_range_with_skewed_dates_and_commit_graph(skewed, capsys, order):
+    """With a commit-graph the skewed commits get generations, without one
+    for the newest ones they fall back to date."""
+    git("commit-graph", "write", "--reachable")
+    assert rev_list(capsys, "x..master", order=order) == git("rev-list", "x..master")
+
+    commit("m3", date=100, m="3\n")
+    assert rev_list(capsys, "x..master", order=order) == git("rev-list", "x..master")
+
+
+def test_max_count_and_first_parent(repo, capsys):
+    base = commit("base", date=1000, a="a\n")
+    git("checkout", "-q", "-b", "side")
+    commit("side", date=2000, b="b\n")
+    git("checkout", "-q", "master")
+    commit("main", date=3000, c="c\n")
+    git("merge", "-q", "--no-ff", "-m", "merge", "side")
+
+    assert rev_list(capsys, "HEAD") == git("rev-list", "HEAD")
+    assert rev_list(capsys, "HEAD", max_count=2) == git("rev-list", "-n", "2", "HEAD")
+    assert rev_list(capsys, "HEAD", first_parent=True) == git(
+        "rev-list", "--first-parent", "HEAD"
+    )
+    assert rev_list(capsys, "%s..HEAD" % base, max_count=2) == git(
+        "rev-list", "-n", "2", "%s..HEAD" % base
+    )
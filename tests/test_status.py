@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import os
+import time
+
+from conftest import commit, git
+from pytt import pytt
+
+
+def status(capsys) -> str:
+    pytt.status()
+    return capsys.readouterr().out
+
+
+def test_racily_clean_entry_is_smudged(repo, capsys):
+    """A same-size change within the timestamp tick of the entry's stat data
+    is found even after status wrote the index again, which made the index
+    newer than the entry."""
+    commit("initial", file="aaaa\n")
+    mtime_ns = time.time_ns() - 100 * 1000 * 1000 * 1000
+    os.utime("file", ns=(mtime_ns, mtime_ns))
+    git("update-index", "--refresh")
+    # the index was written before the file changed, the entry is racy
+    os.utime(".git/index", ns=(mtime_ns - 1, mtime_ns - 1))
+
+    assert status(capsys) == ""
+    with open("file", "w") as f:
+        f.write("bbbb\n")
+    # the change is done within the same tick
+    os.utime("file", ns=(mtime_ns, mtime_ns))
+
+    assert status(capsys) == " M file\n"
+    assert git("status", "--porcelain") == "M file"
+
+
+def test_entries_which_arent_racy_keep_their_size(repo, capsys):
+    commit("initial", file="aaaa\n")
+    mtime_ns = time.time_ns() - 100 * 1000 * 1000 * 1000
+    os.utime("file", ns=(mtime_ns, mtime_ns))
+    git("update-index", "--refresh")
+
+    assert status(capsys) == ""
+    idx = pytt._repo().index()
+    assert idx.table.file_size[idx.table.find(b"file")] == 5
+
+
+def test_status_and_diff_files_match_git(repo, capsys):
+    os.symlink("link_target", "link")
+    commit(
+        "initial",
+        top="top\n",
+        link_target="target\n",
+        **{"dir__modified": "old\n", "dir__deleted": "gone\n", "dir__sub__same": "same\n"},
+    )
+    with open("dir/modified", "w") as f:
+        f.write("new content\n")
+    os.remove("dir/deleted")
+    os.chmod("top", 0o755)
+    os.remove("link")
+    os.symlink("top", "link")
+    # same content and size, only the stat data differs
+    os.utime("dir/sub/same", ns=(0, 0))
+
+    # git diff-files lists files whose stat data differs until the index is
+    # refreshed, git diff refreshes it in memory first like pytt does
+    pytt.diff_files()
+    assert capsys.readouterr().out.strip() == git("diff", "--raw", "--no-abbrev")
+    printed = status(capsys)
+    # status wrote the stat data of the unchanged file to the index
+    pytt.diff_files()
+    assert capsys.readouterr().out.strip() == git("diff-files")
+    assert printed == git("status", "--porcelain", raw=True).decode()
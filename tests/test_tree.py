@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from conftest import commit, git
+from pytt import pytt
+
+
+def write_tree(capsys) -> str:
+    pytt.write_tree()
+    return capsys.readouterr().out.strip()
+
+
+@pytest.fixture
+def nested(repo):
+    commit(
+        "initial",
+        top="top\n",
+        **{
+            "a__b__c__deep": "deep\n",
+            "a__b__file": "file\n",
+            "a__file.txt": "text\n",
+            "a-sibling": "sorts between a and a/\n",
+            "z__last": "last\n",
+        },
+    )
+    os.symlink("top", "link")
+    os.chmod("a/file.txt", 0o755)
+    git("add", "-A")
+    return repo
+
+
+def test_write_tree_matches_git(nested, capsys):
+    assert write_tree(capsys) == git("write-tree")
+    git("fsck", "--strict")
+
+
+def test_write_tree_with_the_cache_tree_git_wrote(nested, capsys):
+    blob = git("hash-object", "-w", "--stdin", input=b"new\n")
+    # read-tree writes a cache-tree which is valid everywhere, adding a/b/new
+    # only invalidates a/b, a and the root
+    git("read-tree", "HEAD")
+    git("update-index", "--add", "--cacheinfo", "100644,%s,a/b/new" % blob)
+
+    assert write_tree(capsys) == git("write-tree")
+
+
+def test_cache_tree_written_by_pytt_is_used_by_git(nested, capsys):
+    sha = write_tree(capsys)
+    idx = pytt._repo().index()
+    assert idx.cache_tree is not None and idx.cache_tree.sha == sha
+    assert idx.cache_tree.entry_count == len(idx)
+
+    # git trusts the cache-tree, a wrong one would give another tree
+    assert git("write-tree") == sha
+    assert git("diff-index", "--cached", "HEAD", "--name-only").split() == [
+        "a/file.txt",
+        "link",
+    ]
+
+
+def test_update_index_invalidates_the_cache_tree(nested, capsys):
+    write_tree(capsys)
+    blob = git("hash-object", "-w", "--stdin", input=b"changed\n")
+    pytt.update_index("100644", blob, "a/b/c/deep")
+    sha = write_tree(capsys)
+
+    git("update-index", "--cacheinfo", "100644,%s,a/b/c/deep" % blob)
+    assert sha == git("write-tree")
+    assert git("ls-tree", "-r", sha, "a/b/c") == "100644 blob %s\ta/b/c/deep" % blob
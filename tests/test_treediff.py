@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from conftest import commit, git, pytt
+
+
+@pytest.fixture
+def changes(repo):
+    """A commit which modifies, adds, deletes, renames and chmods files, and
+    turns a file into a symlink, in the top directory and in subdirectories."""
+    lines = ["line %d of a file which is renamed\n" % i for i in range(40)]
+    commit(
+        "initial",
+        top="top\n",
+        typechange="a file\n",
+        **{
+            "src__main.txt": "".join("main %d\n" % i for i in range(30)),
+            "src__old.txt": "".join(lines),
+            "src__lib__gone.txt": "gone\n",
+            "docs__moved.txt": "moved as it is\n",
+            "docs__mode.sh": "echo\n",
+        },
+    )
+    os.remove("src/lib/gone.txt")
+    os.rename("docs/moved.txt", "moved.txt")
+    os.remove("src/old.txt")
+    lines[10] = "changed while renamed\n"
+    os.remove("typechange")
+    os.symlink("top", "typechange")
+    os.chmod("docs/mode.sh", 0o755)
+    main = ["main %d\n" % i for i in range(30)]
+    main[3:5] = ["inserted\n", "main 4 changed\n"]
+    del main[20]
+    new = commit(
+        "changes",
+        **{
+            "src__new.txt": "".join(lines),
+            "src__main.txt": "".join(main),
+            "src__lib__added.txt": "added\n",
+        },
+    )
+    names = {"old": git("rev-parse", "HEAD~"), "new": new}
+    names["old_src"] = git("rev-parse", "HEAD~:src")
+    names["new_src"] = git("rev-parse", "HEAD:src")
+    return names
+
+
+# pytt resolves full names only, the arguments are formatted with the shas
+ARGS = [
+    ["{old}", "{new}"],
+    ["-r", "{old}", "{new}"],
+    ["-r", "-M", "{old}", "{new}"],
+    ["-r", "--find-renames=98%", "{old}", "{new}"],
+    ["-r", "-M", "{new}"],
+    ["{old_src}", "{new_src}"],
+    ["-p", "{old}", "{new}"],
+    ["-p", "-M", "{old}", "{new}"],
+    ["-p", "-M", "--diff-algorithm=histogram", "{old}", "{new}"],
+]
+
+
+@pytest.mark.parametrize("args", ARGS, ids=" ".join)
+def test_diff_tree_matches_git(changes, args):
+    args = [arg.format(**changes) for arg in args]
+    process = pytt("diff-tree", *args)
+    assert process.returncode == 0, process.stderr
+    assert process.stdout == git("diff-tree", *args, raw=True)
+
+
+def test_diff_tree_patches_apply(changes):
+    patch = pytt("diff-tree", "-p", "-M", changes["old"], changes["new"]).stdout
+    git("checkout", "-q", changes["old"])
+    git("apply", "--index", input=patch)
+    assert git("write-tree") == git("rev-parse", "%s^{tree}" % changes["new"])